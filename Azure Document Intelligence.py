@@ -1,12 +1,13 @@
 import os
-import csv
 import io
 import fitz  # PyMuPDF (for reading PDF metadata)
-import boto3
 from dotenv import load_dotenv
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import AnalyzeResult
+from instrumentation import span
+from s3_uploader import get_uploader
+from table_builder import TableBatch
 
 def extract_and_upload_pdf(pdf_path):
     """Extracts text, images, tables, and metadata from a PDF and uploads them directly to S3."""
@@ -14,13 +15,9 @@ def extract_and_upload_pdf(pdf_path):
     # Load environment variables
     load_dotenv()
 
-    # AWS S3 Configuration
-    session = boto3.Session(
-        aws_access_key_id=os.getenv('AWS_SERVER_PUBLIC_KEY'),
-        aws_secret_access_key=os.getenv('AWS_SERVER_SECRET_KEY'),
-    )
-    s3 = session.client('s3')
-    bucket_name = os.getenv('AWS_BUCKET_NAME')
+    # AWS S3 Configuration (shared, pooled uploader)
+    uploader = get_uploader()
+    bucket_name = uploader.bucket
 
     # Define base S3 path for structured storage
     s3_base_dir = "pdf_processing_pipeline/pdf_enterprise_pipeline"
@@ -55,10 +52,11 @@ def extract_and_upload_pdf(pdf_path):
     document_intelligence_client = DocumentIntelligenceClient(endpoint=endpoint, credential=AzureKeyCredential(key))
 
     # Analyze Document
-    with open(pdf_path, "rb") as f:
-        poller = document_intelligence_client.begin_analyze_document("prebuilt-layout", body=f, output=["figures"])
+    with span("azure.analyze", source=os.path.basename(pdf_path), pages=pdf_page_count):
+        with open(pdf_path, "rb") as f:
+            poller = document_intelligence_client.begin_analyze_document("prebuilt-layout", body=f, output=["figures"])
 
-    result: AnalyzeResult = poller.result()
+        result: AnalyzeResult = poller.result()
     operation_id = poller.details["operation_id"]
 
     # -------- Upload Images Directly to S3 --------
@@ -67,16 +65,17 @@ def extract_and_upload_pdf(pdf_path):
             if figure.id:
                 s3_path = f"{s3_base_dir}/images/{figure.id}.png"
 
-                response = document_intelligence_client.get_analyze_result_figure(
-                    model_id=result.model_id, result_id=operation_id, figure_id=figure.id
-                )
+                with span("azure.figure", figure_id=figure.id):
+                    response = document_intelligence_client.get_analyze_result_figure(
+                        model_id=result.model_id, result_id=operation_id, figure_id=figure.id
+                    )
 
-                # Convert generator response to bytes
-                image_bytes = b"".join(response)
+                    # Convert generator response to bytes
+                    image_bytes = b"".join(response)
 
-                # Upload image directly to S3
-                s3.put_object(Bucket=bucket_name, Key=s3_path, Body=image_bytes)
-                print(f"✅ Uploaded Image: s3://{bucket_name}/{s3_path}")
+                # Queue image upload directly to S3
+                uploader.upload_bytes(image_bytes, s3_path)
+                print(f"✅ Queued Image: s3://{bucket_name}/{s3_path}")
     else:
         print("❌ No figures found.")
 
@@ -98,36 +97,28 @@ def extract_and_upload_pdf(pdf_path):
 
     # Upload text content to S3
     s3_path_text = f"{s3_base_dir}/text/extracted_text.txt"
-    s3.put_object(Bucket=bucket_name, Key=s3_path_text, Body=text_content.getvalue())
-    print(f"✅ Uploaded Extracted Text: s3://{bucket_name}/{s3_path_text}")
+    uploader.upload_bytes(text_content.getvalue(), s3_path_text)
+    print(f"✅ Queued Extracted Text: s3://{bucket_name}/{s3_path_text}")
 
-    # -------- Upload Tables Directly to S3 (CSV Format) --------
+    # -------- Upload Tables Directly to S3 (CSV and Parquet) --------
     if result.tables:
         print(f"\n---- Extracted {len(result.tables)} Tables ----")
 
-        for table_idx, table in enumerate(result.tables):
-            table_buffer = io.StringIO()
-            writer = csv.writer(table_buffer)
-
-            # Sort cells by row & column order
-            table.cells.sort(key=lambda cell: (cell.row_index, cell.column_index))
-
-            # Create an empty matrix for the table
-            table_matrix = [["" for _ in range(table.column_count)] for _ in range(table.row_count)]
-
-            # Fill matrix with cell data
-            for cell in table.cells:
-                table_matrix[cell.row_index][cell.column_index] = cell.content
-
-            # Write table to CSV format in-memory
-            writer.writerows(table_matrix)
+        # All tables at once into one preallocated array, merged cells expanded
+        table_batch = TableBatch.from_azure(result.tables)
 
+        for table_idx, csv_data in enumerate(table_batch.csv_payloads(lineterminator="\r\n")):
             # Define S3 Path Before Uploading
             s3_path_table = f"{s3_base_dir}/tables/table_{table_idx}.csv"
 
-            # Upload CSV file directly to S3
-            s3.put_object(Bucket=bucket_name, Key=s3_path_table, Body=table_buffer.getvalue())
-            print(f"✅ Uploaded Table {table_idx}: s3://{bucket_name}/{s3_path_table}")
+            # Queue CSV file upload directly to S3
+            uploader.upload_bytes(csv_data, s3_path_table)
+            print(f"✅ Queued Table {table_idx}: s3://{bucket_name}/{s3_path_table}")
+
+        # Every table in one columnar file (table, page, row, column, text)
+        s3_path_tables = f"{s3_base_dir}/tables/tables.parquet"
+        uploader.upload_bytes(table_batch.to_parquet(), s3_path_tables)
+        print(f"✅ Queued Tables (Parquet): s3://{bucket_name}/{s3_path_tables}")
 
     # -------- Upload Metadata Directly to S3 --------
     metadata_buffer = io.StringIO()
@@ -142,10 +133,17 @@ def extract_and_upload_pdf(pdf_path):
     s3_path_metadata = f"{s3_base_dir}/others/metadata.txt"
 
     # Upload metadata directly to S3
-    s3.put_object(Bucket=bucket_name, Key=s3_path_metadata, Body=metadata_buffer.getvalue())
-    print(f"✅ Uploaded Metadata: s3://{bucket_name}/{s3_path_metadata}")
+    uploader.upload_bytes(metadata_buffer.getvalue(), s3_path_metadata)
+    print(f"✅ Queued Metadata: s3://{bucket_name}/{s3_path_metadata}")
+
+    # Wait for every queued upload and report the ones that failed
+    upload_report = uploader.flush()
+    if not upload_report.ok:
+        for failure in upload_report.failures:
+            print(f"❌ Upload failed: s3://{bucket_name}/{failure.key}: {failure.error}")
+        upload_report.raise_for_failures()
 
-    print("\n✅✅✅ Extraction & Upload Completed Successfully! ✅✅✅")
+    print(f"\n✅✅✅ Extraction & Upload Completed Successfully! ({upload_report.uploaded} objects) ✅✅✅")
 
 
 # Example Usage:
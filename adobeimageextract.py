@@ -16,10 +16,6 @@ logging.basicConfig(level=logging.INFO)
 class ExtractTextInfoFromPDF:
     def __init__(self, input_pdf_path):
         try:
-            # Read the input PDF file
-            with open(input_pdf_path, 'rb') as file:
-                input_stream = file.read()
-
             # Initial setup, create credentials instance
             credentials = ServicePrincipalCredentials(
                 client_id=os.getenv('PDF_SERVICES_CLIENT_ID'),
@@ -29,8 +25,10 @@ class ExtractTextInfoFromPDF:
             # Creates a PDF Services instance
             pdf_services = PDFServices(credentials=credentials)
 
-            # Creates an asset from source file and upload
-            input_asset = pdf_services.upload(input_stream=input_stream, mime_type=PDFServicesMediaType.PDF)
+            # Creates an asset from source file and upload, streaming the open file
+            # instead of reading the whole PDF into memory
+            with open(input_pdf_path, 'rb') as input_stream:
+                input_asset = pdf_services.upload(input_stream=input_stream, mime_type=PDFServicesMediaType.PDF)
 
             # Create parameters for the job
             extract_pdf_params = ExtractPDFParams(
@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+from collections import namedtuple
+import fitz  # PyMuPDF
+import numpy as np
+from dotenv import load_dotenv
+from document_model import Document
+from extraction_cache import file_sha256
+from extractors import azure_result_to_document
+from instrumentation import count, span
+from pdf_input import open_pdf
+from s3_uploader import get_uploader
+from table_builder import TableBatch
+
+# Load environment variables
+load_dotenv()
+
+# Base S3 path, one folder per document (file name and content hash) underneath
+S3_BASE_DIR = "pdf_processing_pipeline/pdf_enterprise_pipeline"
+
+# Service limits per request (same as the Azure Document Intelligence script)
+MAX_FILE_SIZE_MB = 5
+MAX_PAGE_COUNT = 5
+
+# Analyses in flight at once, and figure downloads in flight at once
+AZURE_MAX_CONCURRENT = int(os.getenv('AZURE_MAX_CONCURRENT', '8'))
+AZURE_FIGURE_CONCURRENCY = int(os.getenv('AZURE_FIGURE_CONCURRENCY', '16'))
+
+# Figures are streamed into a spooled buffer that moves to disk above this size
+FIGURE_SPOOL_BYTES = 1024 * 1024
+
+PdfChunk = namedtuple("PdfChunk", ["source", "first_page", "page_count", "data"])
+ChunkResult = namedtuple("ChunkResult", ["chunk", "result", "figure_keys"])
+
+
+def split_pdf(pdf_path, max_pages=MAX_PAGE_COUNT, max_file_mb=MAX_FILE_SIZE_MB):
+    """Cut a PDF into page-range chunks that each fit the service limits.
+
+    A document within both limits is sent as it is. Otherwise chunks of max_pages pages are
+    written with PyMuPDF and any chunk still above max_file_mb is halved until it fits;
+    a single page above the size limit raises ValueError.
+    """
+    max_bytes = max_file_mb * 1024 * 1024
+    with open_pdf(pdf_path) as pdf_document:
+        page_count = len(pdf_document)
+        if page_count <= max_pages and os.path.getsize(pdf_path) <= max_bytes:
+            with open(pdf_path, "rb") as f:
+                return [PdfChunk(pdf_path, 1, page_count, f.read())]
+
+        chunks = []
+
+        def add_chunk(start, stop):
+            with fitz.open() as part:
+                part.insert_pdf(pdf_document, from_page=start, to_page=stop - 1)
+                data = part.tobytes(garbage=3, deflate=True)
+            if len(data) <= max_bytes:
+                chunks.append(PdfChunk(pdf_path, start + 1, stop - start, data))
+            elif stop - start > 1:
+                middle = (start + stop) // 2
+                add_chunk(start, middle)
+                add_chunk(middle, stop)
+            else:
+                raise ValueError(f"Page {start + 1} of {pdf_path} is {len(data) / (1024 * 1024):.2f}MB on its own "
+                                 f"(Limit: {max_file_mb}MB)")
+
+        for start in range(0, page_count, max_pages):
+            add_chunk(start, min(start + max_pages, page_count))
+        return chunks
+
+
+def document_dir(s3_base_dir, pdf_path):
+    """S3 folder of a document: its file name plus a short hash of its contents, so PDFs
+    with the same name from different directories do not overwrite each other."""
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    return f"{s3_base_dir}/{stem}-{file_sha256(pdf_path)[:16]}"
+
+
+def absolute_figure_id(figure_id, page_offset):
+    """Figure ids are "<page>.<index>" relative to the chunk; shift the page by page_offset."""
+    page, _, index = figure_id.partition(".")
+    if not page_offset or not page.isdigit():
+        return figure_id
+    return f"{int(page) + page_offset}.{index}"
+
+
+def build_async_client():
+    from azure.ai.documentintelligence.aio import DocumentIntelligenceClient
+    from azure.core.credentials import AzureKeyCredential
+
+    return DocumentIntelligenceClient(endpoint=os.getenv("AZURE_FORM_RECOGNIZER_ENDPOINT"),
+                                      credential=AzureKeyCredential(os.getenv("AZURE_FORM_RECOGNIZER_KEY")))
+
+
+async def stream_figure(client, uploader, model_id, result_id, figure_id, key, figure_slots):
+    """Copy one figure from the service into a spooled buffer as it arrives and queue its upload."""
+    async with figure_slots:
+        spool = tempfile.SpooledTemporaryFile(max_size=FIGURE_SPOOL_BYTES)
+        try:
+            with span("azure.figure", figure_id=figure_id):
+                async for piece in await client.get_analyze_result_figure(model_id=model_id, result_id=result_id,
+                                                                          figure_id=figure_id):
+                    spool.write(piece)
+        except BaseException:
+            spool.close()
+            raise
+        count("bytes_read", spool.tell(), source="azure")
+    # Blocks while the uploader is at its pending limit, so keep it off the event loop
+    await asyncio.to_thread(uploader.upload_stream, spool, key, "image/png")
+    return key
+
+
+async def analyze_chunk(client, uploader, chunk, s3_dir, analyze_slots, figure_slots):
+    """Analyze one chunk, then fetch all of its figures concurrently."""
+    async with analyze_slots:
+        with span("azure.analyze", source=os.path.basename(chunk.source), first_page=chunk.first_page,
+                  pages=chunk.page_count, bytes=len(chunk.data)):
+            poller = await client.begin_analyze_document("prebuilt-layout", body=io.BytesIO(chunk.data), output=["figures"])
+            result = await poller.result()
+    count("pages", chunk.page_count)
+    count("bytes_written", len(chunk.data), destination="azure")
+    operation_id = poller.details["operation_id"]
+
+    page_offset = chunk.first_page - 1
+    figure_keys = await asyncio.gather(*(
+        stream_figure(client, uploader, result.model_id, operation_id, figure.id,
+                      f"{s3_dir}/images/{absolute_figure_id(figure.id, page_offset)}.png", figure_slots)
+        for figure in result.figures or [] if figure.id
+    ))
+    return ChunkResult(chunk, result, list(figure_keys))
+
+
+def merge_chunk_results(source, chunk_results):
+    """One Document for the whole PDF from its chunk results, with absolute page numbers."""
+    document = Document(source, "azure")
+    for chunk_result in sorted(chunk_results, key=lambda chunk_result: chunk_result.chunk.first_page):
+        page_offset = chunk_result.chunk.first_page - 1
+        part = azure_result_to_document(chunk_result.result, source)
+        for page in part.pages:
+            page.number += page_offset
+            for figure in page.figures:
+                figure.ref = absolute_figure_id(figure.ref, page_offset)
+            document.pages.append(page)
+    return document
+
+
+def write_merged_outputs(uploader, s3_dir, chunk_results, document):
+    """Queue the text, table CSVs and metadata of a merged document; returns their keys."""
+    results = [chunk_result.result for chunk_result in chunk_results]
+    text_content = io.StringIO()
+    if any(style.is_handwritten for result in results for style in result.styles or []):
+        text_content.write("Document contains handwritten content\n")
+    else:
+        text_content.write("Document does not contain handwritten content\n")
+    for chunk_result in chunk_results:
+        page_offset = chunk_result.chunk.first_page - 1
+        for page in chunk_result.result.pages:
+            text_content.write(f"\n---- Page #{page.page_number + page_offset} ----\n")
+            text_content.write(f"Dimensions: Width {page.width}, Height {page.height}, Unit: {page.unit}\n")
+            for line_idx, line in enumerate(page.lines or []):
+                text_content.write(f"... Line #{line_idx}: '{line.content}'\n")
+
+    keys = [f"{s3_dir}/text/extracted_text.txt"]
+    uploader.upload_bytes(text_content.getvalue(), keys[0])
+
+    # All tables of all chunks in one batch, pages shifted to their place in the document
+    chunk_tables = [result.tables or [] for result in results]
+    table_batch = TableBatch.from_azure([table for tables in chunk_tables for table in tables])
+    page_offsets = np.array([chunk_result.chunk.first_page - 1 for chunk_result in chunk_results], dtype=np.int64)
+    table_batch.pages += np.repeat(page_offsets, [len(tables) for tables in chunk_tables])
+    for table_idx, csv_data in enumerate(table_batch.csv_payloads(lineterminator="\r\n")):
+        keys.append(f"{s3_dir}/tables/table_{table_idx}.csv")
+        uploader.upload_bytes(csv_data, keys[-1])
+    if len(table_batch):
+        keys.append(f"{s3_dir}/tables/tables.parquet")
+        uploader.upload_bytes(table_batch.to_parquet(), keys[-1])
+
+    metadata_buffer = io.StringIO()
+    metadata_buffer.write("📄 Document Metadata\n")
+    metadata_buffer.write("----------------------------\n")
+    metadata_buffer.write(f"Total Pages: {len(document.pages)}\n")
+    metadata_buffer.write(f"Total Figures: {sum(len(page.figures) for page in document.pages)}\n")
+    metadata_buffer.write(f"Total Tables: {len(table_batch)}\n")
+    metadata_buffer.write(f"Total Paragraphs: {sum(len(page.blocks) for page in document.pages)}\n")
+    metadata_buffer.write(f"Requests: {len(chunk_results)}\n")
+    keys.append(f"{s3_dir}/others/metadata.txt")
+    uploader.upload_bytes(metadata_buffer.getvalue(), keys[-1])
+    return keys
+
+
+async def extract_document(client, uploader, pdf_path, s3_base_dir, analyze_slots, figure_slots):
+    started = time.perf_counter()
+    with span("azure.document", source=os.path.basename(pdf_path)):
+        s3_dir = await asyncio.to_thread(document_dir, s3_base_dir, pdf_path)
+        with span("azure.split", source=os.path.basename(pdf_path)):
+            chunks = await asyncio.to_thread(split_pdf, pdf_path)
+        chunk_results = await asyncio.gather(*(
+            analyze_chunk(client, uploader, chunk, s3_dir, analyze_slots, figure_slots) for chunk in chunks))
+        document = merge_chunk_results(pdf_path, chunk_results)
+        keys = write_merged_outputs(uploader, s3_dir, chunk_results, document)
+    figure_keys = [key for chunk_result in chunk_results for key in chunk_result.figure_keys]
+    return {"source": pdf_path, "s3_dir": s3_dir, "chunks": len(chunks), "pages": len(document.pages),
+            "figures": len(figure_keys), "tables": sum(len(page.tables) for page in document.pages),
+            "keys": keys + figure_keys, "seconds": time.perf_counter() - started, "document": document}
+
+
+async def extract_documents(pdf_paths, client=None, uploader=None, s3_base_dir=S3_BASE_DIR,
+                            max_concurrent=AZURE_MAX_CONCURRENT, figure_concurrency=AZURE_FIGURE_CONCURRENCY):
+    """Analyze many PDFs at once with the async client and upload their outputs to S3.
+
+    Every document is split into chunks that fit the service limits and all chunks of all
+    documents are submitted together, at most max_concurrent analyses in flight. Figures are
+    fetched concurrently (at most figure_concurrency at a time) and streamed to the uploader
+    without being joined in memory. Chunk results are merged back into one text file, one
+    set of tables and figure ids with absolute page numbers per document.
+
+    Pass client= to use a stand-in such as azure_fake.FakeDocumentIntelligenceClient.
+    Returns one summary per document in input order; a failed document has an "error".
+    """
+    uploader = uploader or get_uploader()
+    analyze_slots = asyncio.Semaphore(max_concurrent)
+    figure_slots = asyncio.Semaphore(figure_concurrency)
+    owns_client = client is None
+    client = client or build_async_client()
+    try:
+        outcomes = await asyncio.gather(*(
+            extract_document(client, uploader, pdf_path, s3_base_dir, analyze_slots, figure_slots)
+            for pdf_path in pdf_paths), return_exceptions=True)
+    finally:
+        if owns_client:
+            await client.close()
+
+    upload_report = await asyncio.to_thread(uploader.flush)
+    for failure in upload_report.failures:
+        print(f"❌ Upload failed: s3://{uploader.bucket}/{failure.key}: {failure.error}")
+    upload_report.raise_for_failures()
+
+    summaries = []
+    for pdf_path, outcome in zip(pdf_paths, outcomes):
+        if isinstance(outcome, BaseException):
+            print(f"❌ {pdf_path}: {type(outcome).__name__}: {outcome}")
+            summaries.append({"source": pdf_path, "error": f"{type(outcome).__name__}: {outcome}"})
+        else:
+            summaries.append(outcome)
+    return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract many PDFs concurrently with Azure Document Intelligence.")
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--max-concurrent", type=int, default=AZURE_MAX_CONCURRENT)
+    parser.add_argument("--fake", action="store_true", help="use the local fake service instead of Azure")
+    args = parser.parse_args()
+
+    fake_client = None
+    if args.fake:
+        from azure_fake import FakeDocumentIntelligenceClient
+        fake_client = FakeDocumentIntelligenceClient()
+    for summary in asyncio.run(extract_documents(args.pdfs, client=fake_client, max_concurrent=args.max_concurrent)):
+        if "error" in summary:
+            continue
+        print(f"✅ {summary['source']}: {summary['pages']} pages in {summary['chunks']} requests, "
+              f"{summary['figures']} figures, {summary['tables']} tables -> s3://{get_uploader().bucket}/{summary['s3_dir']} "
+              f"({summary['seconds']:.2f}s)")
@@ -0,0 +1,130 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+import fitz  # PyMuPDF
+
+
+class FakeServiceError(Exception):
+    """What the fake raises where the real service would answer with an HTTP error."""
+
+
+class _FakePoller:
+    def __init__(self, client, result, operation_id):
+        self._client = client
+        self._result = result
+        self.details = {"operation_id": operation_id}
+
+    async def result(self):
+        try:
+            await asyncio.sleep(self._client.latency)
+            return self._result
+        finally:
+            self._client.in_flight -= 1
+
+
+async def _chunks(data, size):
+    for start in range(0, len(data), size):
+        await asyncio.sleep(0)
+        yield data[start:start + size]
+
+
+class FakeDocumentIntelligenceClient:
+    """Local stand-in for azure.ai.documentintelligence.aio.DocumentIntelligenceClient.
+
+    Builds prebuilt-layout style results from the PDF with PyMuPDF: one line and paragraph
+    per text line, one figure (id "<page>.<index>") per embedded image, no tables. It
+    enforces the same page and size limits as the service, sleeps `latency` seconds per
+    analysis and serves figures as PNG bytes in `figure_chunk_size` pieces, so concurrency,
+    chunking and streaming can be checked without credentials. Calls are recorded in
+    `calls`, and `max_in_flight` is the highest number of analyses running at once.
+    """
+
+    def __init__(self, max_pages=5, max_file_mb=5, latency=0.05, figure_chunk_size=16 * 1024):
+        self.max_pages = max_pages
+        self.max_bytes = max_file_mb * 1024 * 1024
+        self.latency = latency
+        self.figure_chunk_size = figure_chunk_size
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._figures = {}
+
+    async def begin_analyze_document(self, model_id, body, output=None, **kwargs):
+        data = body.read() if hasattr(body, "read") else bytes(body)
+        self.calls.append(("analyze", model_id, len(data)))
+        if len(data) > self.max_bytes:
+            raise FakeServiceError(f"InvalidContentLength: {len(data)} bytes exceeds {self.max_bytes}")
+        with fitz.open(stream=data, filetype="pdf") as pdf_document:
+            if len(pdf_document) > self.max_pages:
+                raise FakeServiceError(f"InvalidContent: {len(pdf_document)} pages exceeds {self.max_pages}")
+            operation_id = uuid.uuid4().hex
+            result = self._layout(pdf_document, model_id, operation_id, "figures" in (output or []))
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return _FakePoller(self, result, operation_id)
+
+    def _layout(self, pdf_document, model_id, operation_id, with_figures):
+        pages, paragraphs, figures = [], [], []
+        for page in pdf_document:
+            page_number = page.number + 1
+            lines = []
+            for block in page.get_text("dict")["blocks"]:
+                for line in block.get("lines", []):
+                    content = "".join(span["text"] for span in line["spans"]).strip()
+                    if not content:
+                        continue
+                    x0, y0, x1, y1 = line["bbox"]
+                    polygon = [x0, y0, x1, y0, x1, y1, x0, y1]
+                    lines.append(SimpleNamespace(content=content, polygon=polygon))
+                    paragraphs.append(SimpleNamespace(content=content, role=None, bounding_regions=[
+                        SimpleNamespace(page_number=page_number, polygon=polygon)]))
+            pages.append(SimpleNamespace(page_number=page_number, width=page.rect.width, height=page.rect.height,
+                                         unit="pixel", lines=lines))
+
+            if with_figures:
+                for index, image in enumerate(page.get_image_info(xrefs=True), start=1):
+                    figure_id = f"{page_number}.{index}"
+                    x0, y0, x1, y1 = image["bbox"]
+                    pixmap = fitz.Pixmap(pdf_document, image["xref"]) if image["xref"] else page.get_pixmap(clip=image["bbox"])
+                    if pixmap.n - pixmap.alpha > 3:
+                        pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+                    self._figures[(operation_id, figure_id)] = pixmap.tobytes("png")
+                    figures.append(SimpleNamespace(id=figure_id, caption=None, bounding_regions=[
+                        SimpleNamespace(page_number=page_number, polygon=[x0, y0, x1, y0, x1, y1, x0, y1])]))
+
+        return SimpleNamespace(model_id=model_id, pages=pages, paragraphs=paragraphs, tables=[],
+                               figures=figures, styles=[])
+
+    async def get_analyze_result_figure(self, model_id, result_id, figure_id, **kwargs):
+        self.calls.append(("figure", result_id, figure_id))
+        try:
+            data = self._figures[(result_id, figure_id)]
+        except KeyError:
+            raise FakeServiceError(f"NotFound: figure {figure_id} of result {result_id}")
+        return _chunks(data, self.figure_chunk_size)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+def make_pdf(page_count, images_per_page=1):
+    """Small test PDF with a line of text and images_per_page distinct images on every page."""
+    pdf_document = fitz.open()
+    for page_index in range(page_count):
+        page = pdf_document.new_page()
+        page.insert_text((72, 72), f"Page {page_index + 1} of {page_count}")
+        for image_index in range(images_per_page):
+            pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 32, 32), False)
+            pixmap.set_rect(pixmap.irect, ((page_index * 37) % 256, (image_index * 91) % 256, 128))
+            top = 100 + image_index * 80
+            page.insert_image(fitz.Rect(72, top, 136, top + 64), stream=pixmap.tobytes("png"))
+    data = pdf_document.tobytes()
+    pdf_document.close()
+    return data
@@ -1,8 +1,32 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, File, Form, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+import asyncio
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import uuid
 import bcrypt
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+
+# Extraction modules live in the project root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main as extraction
+from downloader import download
+from extraction_cache import file_sha256
+from extraction_engine import split_page_range
+from instrumentation import PrometheusCollector, call_and_drain, count, merge, span, telemetry
+from search_index import get_index
+from table_prescreen import prescreen
 
 # FastAPI app initialization
 app = FastAPI()
@@ -10,8 +34,21 @@ app = FastAPI()
 # OAuth2 Configuration
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Ingestion job settings
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+# Pool tasks one job may have submitted at a time, so a large PDF leaves workers to the other jobs
+JOB_MAX_IN_FLIGHT = int(os.getenv("JOB_MAX_IN_FLIGHT", str(max(1, EXTRACTION_WORKERS // MAX_CONCURRENT_JOBS))))
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
+STAGES = ("text", "images", "lists", "tables")
+
+# Pipeline metrics of this process and of everything its extraction workers reported back
+metrics_registry = CollectorRegistry()
+metrics_registry.register(PrometheusCollector(telemetry))
+
 # In-memory Databases
 item_db = []
+job_db: Dict[str, "Job"] = {}
 fake_users_db = {
     "johndoe": {
         "username": "johndoe",
@@ -38,6 +75,24 @@ class Item(BaseModel):
     price: float
     description: Optional[str] = None
 
+class StageProgress(BaseModel):
+    status: str = "pending"
+    done: int = 0
+    total: int = 0
+
+class Job(BaseModel):
+    id: str
+    status: str = "queued"
+    source: str
+    s3_prefix: str
+    sha256: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    pages: Optional[int] = None
+    stages: Dict[str, StageProgress]
+    error: Optional[str] = None
+
 # Utility Functions
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
@@ -109,3 +164,183 @@ async def delete_item(item_id: int):
             del item_db[i]
             return {"message": "Item deleted"}
     raise HTTPException(status_code=404, detail="Item not found")
+
+# Document ingestion jobs
+#
+# All PyMuPDF/camelot work runs in a process pool (spawned, so workers never inherit the
+# event loop's threads); the event loop only awaits futures and updates job_db. At most
+# MAX_CONCURRENT_JOBS jobs hold a slot at a time, the rest wait in "queued". A running job
+# keeps at most JOB_MAX_IN_FLIGHT chunks in the pool's queue, so the pool's FIFO interleaves
+# the chunks of concurrent jobs instead of running one job's chunks before the next one's.
+extraction_pool: Optional[ProcessPoolExecutor] = None
+job_slots = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+# Strong references to running job tasks so they are not garbage collected
+job_tasks = set()
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    global extraction_pool
+    if extraction_pool is None:
+        extraction_pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return extraction_pool
+
+@app.on_event("shutdown")
+def shutdown_extraction_pool():
+    if extraction_pool is not None:
+        extraction_pool.shutdown(wait=False, cancel_futures=True)
+
+async def run_in_pool(pool, function, *args):
+    """Run function in the extraction pool and fold the worker's telemetry into this process.
+
+    Cancelling drops the task if it is still queued; one a worker already started cannot be
+    stopped, so cancellation waits for it to end (the job's input must outlive it).
+    """
+    future = pool.submit(call_and_drain, function, *args)
+    try:
+        result, worker_telemetry = await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        if not future.cancelled():
+            await asyncio.wait([asyncio.wrap_future(future)])
+        raise
+    merge(worker_telemetry)
+    return result
+
+async def run_limited(limit: asyncio.Semaphore, pool, function, *args):
+    """run_in_pool once one of the job's in-flight slots is free."""
+    async with limit:
+        return await run_in_pool(pool, function, *args)
+
+async def as_completed_or_cancel(coroutines):
+    """Yield the results of coroutines as they complete. If one fails, cancel the rest and
+    wait for them before the error propagates, so no pool work for the job is left running
+    and no task exception goes unretrieved."""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def save_upload(upload: UploadFile, destination: Path):
+    with destination.open("wb") as out:
+        shutil.copyfileobj(upload.file, out)
+
+async def run_job(job: Job, file_path: Path, url: Optional[str]):
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+    in_flight = asyncio.Semaphore(JOB_MAX_IN_FLIGHT)
+    try:
+        async with job_slots:
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                if url:
+                    job.status = "downloading"
+                    with span("download", job=job.id):
+                        await loop.run_in_executor(None, download, url, str(file_path))
+                    job.status = "running"
+
+                job.pages = await run_in_pool(pool, extraction.count_pages, str(file_path))
+                job.sha256 = await loop.run_in_executor(None, file_sha256, str(file_path))
+
+                # Text, images and lists come out of the same single pass, chunk by chunk
+                page_stages = [job.stages[name] for name in ("text", "images", "lists")]
+                for stage in page_stages:
+                    stage.status, stage.total = "running", job.pages
+                chunks = split_page_range(job.pages, EXTRACTION_WORKERS)
+                with span("page_pass", job=job.id, pages=job.pages):
+                    extract_chunk = partial(extraction.extract_page_chunk, document_sha256=job.sha256)
+                    chunk_runs = [run_limited(in_flight, pool, extract_chunk, str(file_path), chunk, job.s3_prefix)
+                                  for chunk in chunks]
+                    async for report in as_completed_or_cancel(chunk_runs):
+                        for stage in page_stages:
+                            stage.done += report["pages"]
+                for stage in page_stages:
+                    stage.status = "done"
+
+                # Tables: cheap pre-screen, then camelot one candidate page per task
+                tables = job.stages["tables"]
+                tables.status = "running"
+                with span("tables", job=job.id):
+                    screen = await run_in_pool(pool, prescreen, str(file_path))
+                    tables.total = len(screen.candidates)
+                    table_runs = [run_limited(in_flight, pool, extraction.extract_page_tables, str(file_path),
+                                              page_number, job.s3_prefix)
+                                  for page_number in screen.candidates]
+                    async for _ in as_completed_or_cancel(table_runs):
+                        tables.done += 1
+                tables.status = "done"
+                search_index = get_index()
+                if search_index is not None:
+                    await run_in_threadpool(search_index.set_source, job.sha256, job.source)
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = f"{type(e).__name__}: {e}"
+                for stage in job.stages.values():
+                    if stage.status == "running":
+                        stage.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                count("jobs", status=job.status)
+                telemetry.observe("job", job.finished_at - job.started_at)
+    finally:
+        # The upload or download is only needed while the job runs, whatever its outcome
+        file_path.unlink(missing_ok=True)
+
+@app.post("/documents", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+async def create_document(file: Optional[UploadFile] = File(None), url: Optional[str] = Form(None)):
+    if (file is None) == (url is None):
+        raise HTTPException(status_code=400, detail="Provide either a file upload or a url")
+
+    job_id = uuid.uuid4().hex
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    file_path = UPLOAD_DIR / f"{job_id}.pdf"
+    if file is not None:
+        await run_in_threadpool(save_upload, file, file_path)
+
+    job = Job(
+        id=job_id,
+        source=url or file.filename,
+        s3_prefix=f"{extraction.S3_JOBS_PREFIX}/{job_id}",
+        created_at=time.time(),
+        stages={name: StageProgress() for name in STAGES},
+    )
+    job_db[job_id] = job
+    task = asyncio.create_task(run_job(job, file_path, url))
+    job_tasks.add(task)
+    task.add_done_callback(job_tasks.discard)
+    return job
+
+@app.get("/documents/{job_id}", response_model=Job)
+async def read_document(job_id: str):
+    if job_id not in job_db:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_db[job_id]
+
+@app.get("/search")
+async def search(q: str, limit: int = 10, offset: int = 0, doc_id: Optional[str] = None):
+    """Pages matching every word of q, best BM25 score first, with a snippet and the
+    matched blocks' bbox and match offsets. doc_id (a job's sha256) limits the search to
+    one document."""
+    search_index = get_index()
+    if search_index is None:
+        raise HTTPException(status_code=404, detail="Search index is off; set SEARCH_INDEX_PATH")
+    if not 1 <= limit <= 100 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be 1-100 and offset >= 0")
+    return await run_in_threadpool(search_index.search, q, limit, offset, doc_id)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage durations, pages, bytes, S3 requests and retries, cache hits."""
+    return Response(generate_latest(metrics_registry), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/trace")
+async def trace(format: str = "chrome"):
+    """Spans recorded so far as a Chrome trace or OTLP/JSON; needs TRACE_ENABLED or TRACE_FILE."""
+    if not telemetry.tracing:
+        raise HTTPException(status_code=404, detail="Tracing is off; set TRACE_ENABLED=1")
+    if format not in ("chrome", "otlp"):
+        raise HTTPException(status_code=400, detail="format must be chrome or otlp")
+    return telemetry.otlp_trace() if format == "otlp" else telemetry.chrome_trace()
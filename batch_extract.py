@@ -0,0 +1,371 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import time
+from collections import deque
+from dotenv import load_dotenv
+from extraction_cache import file_sha256
+from extraction_engine import split_page_range
+from instrumentation import call_and_drain, count, merge, span
+from main import (COLUMNAR_DATASET, COLUMNAR_OUTPUT, S3_BATCH_PREFIX, TABLE_PRESCREEN_THRESHOLD, count_pages,
+                  download_pdf, extract_page_chunk, extract_page_tables)
+from s3_uploader import get_uploader
+from search_index import get_index
+from sinks import COLUMNAR_FOLDER, delete_columnar_parts
+from table_prescreen import prescreen as prescreen_tables
+
+# Load environment variables
+load_dotenv()
+
+# Batch configuration
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', str(os.cpu_count() or 1)))
+# Pages per text/images/lists task; smaller chunks balance better, larger ones reopen the PDF less
+BATCH_CHUNK_PAGES = int(os.getenv('BATCH_CHUNK_PAGES', '16'))
+# Finished (and failed) documents are appended here; a rerun skips the finished ones
+BATCH_CHECKPOINT = os.getenv('BATCH_CHECKPOINT', 'batch_checkpoint.jsonl')
+# Downloaded URLs and S3 objects are kept here until their document is done
+BATCH_WORK_DIR = os.getenv('BATCH_WORK_DIR', '.batch_inputs')
+
+
+def read_manifest(manifest_path):
+    """Sources listed one per line: http(s) URLs, s3://bucket/key or local paths.
+
+    Blank lines and lines starting with # are skipped, duplicates are dropped and relative
+    paths are taken relative to the manifest.
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    sources = []
+    with open(manifest_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if source_kind(line) == "path":
+                line = os.path.normpath(os.path.join(base, os.path.expanduser(line)))
+            sources.append(line)
+    return list(dict.fromkeys(sources))
+
+
+def source_kind(source):
+    if source.startswith(("http://", "https://")):
+        return "url"
+    if source.startswith("s3://"):
+        return "s3"
+    return "path"
+
+
+def fetch_source(source, work_dir=BATCH_WORK_DIR):
+    """Local path and sha256 of a source, downloading URLs and S3 objects into work_dir."""
+    kind = source_kind(source)
+    if kind == "path":
+        return source, file_sha256(source)
+    os.makedirs(work_dir, exist_ok=True)
+    local_path = os.path.join(work_dir, f"{hashlib.sha256(source.encode()).hexdigest()[:24]}.pdf")
+    if kind == "url":
+        return local_path, download_pdf(source, local_path).sha256
+    bucket, _, key = source[len("s3://"):].partition("/")
+    with span("s3.get", key=key):
+        get_uploader().client.download_file(bucket, key, local_path)
+    count("bytes_read", os.path.getsize(local_path), source="s3")
+    return local_path, file_sha256(local_path)
+
+
+def prepare_document(source, work_dir=BATCH_WORK_DIR, columnar=False):
+    """Worker task: fetch a source, then count and pre-screen its pages for the scheduler.
+
+    With columnar, the document's part files from an earlier run are deleted first; their
+    names follow that run's page chunks, so they would duplicate the new rows.
+    """
+    path, sha256 = fetch_source(source, work_dir)
+    if columnar:
+        delete_columnar_parts(S3_BATCH_PREFIX, sha256, COLUMNAR_DATASET)
+    with span("prescreen"):
+        screen = prescreen_tables(path, TABLE_PRESCREEN_THRESHOLD)
+    return {"path": path, "sha256": sha256, "pages": count_pages(path), "candidates": screen.candidates}
+
+
+# Task kind -> worker function; every task is (document index, kind, args)
+TASK_FUNCTIONS = {
+    "prepare": prepare_document,
+    "pages": extract_page_chunk,
+    "tables": extract_page_tables,
+}
+
+
+def _worker_main(worker_id, inbox, results):
+    """Long-lived worker: run the tasks the scheduler sends until told to stop."""
+    while True:
+        task = inbox.get()
+        if task is None:
+            break
+        _, kind, args = task
+        started = time.perf_counter()
+        try:
+            value, worker_telemetry = call_and_drain(TASK_FUNCTIONS[kind], *args)
+            results.put((worker_id, task, value, None, worker_telemetry, time.perf_counter() - started))
+        except Exception as e:
+            results.put((worker_id, task, None, f"{type(e).__name__}: {e}", None, time.perf_counter() - started))
+
+
+class WorkStealingScheduler:
+    """One task deque per worker; a worker whose deque runs dry steals from the fullest one.
+
+    A prepared document's tasks all go to the deque of the worker that fetched it, which
+    works through them front to back. A thief takes the back half of the longest deque, so
+    one 2000-page PDF is spread over every idle worker while the owner keeps the pages it
+    is about to reach.
+    """
+
+    def __init__(self, workers):
+        self.deques = [deque() for _ in range(workers)]
+        self.steals = 0
+
+    def push(self, worker_id, tasks):
+        self.deques[worker_id].extend(tasks)
+
+    def pop(self, worker_id):
+        own = self.deques[worker_id]
+        return own.popleft() if own else None
+
+    def steal(self, worker_id):
+        victim = max(self.deques, key=len)
+        if not victim:
+            return None
+        stolen = [victim.pop() for _ in range((len(victim) + 1) // 2)]
+        stolen.reverse()
+        self.deques[worker_id].extend(stolen)
+        self.steals += 1
+        return self.deques[worker_id].popleft()
+
+    def drop(self, document_index):
+        """Remove the queued tasks of a document and return how many there were."""
+        dropped = 0
+        for tasks in self.deques:
+            kept = [task for task in tasks if task[0] != document_index]
+            dropped += len(tasks) - len(kept)
+            tasks.clear()
+            tasks.extend(kept)
+        return dropped
+
+
+class Checkpoint:
+    """Append-only JSON-lines log of finished documents; the last line per source wins."""
+
+    def __init__(self, path=BATCH_CHECKPOINT):
+        self.path = path
+        self.entries = {}
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            content = f.read()
+        for line in content.splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Cut short by an interrupted run
+                continue
+            self.entries[entry["source"]] = entry
+        if content and not content.endswith("\n"):
+            with open(path, "a") as f:
+                f.write("\n")
+
+    def done(self, source):
+        return self.entries.get(source, {}).get("status") == "done"
+
+    def record(self, entry):
+        self.entries[entry["source"]] = entry
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def run_batch(sources, workers=BATCH_WORKERS, checkpoint_path=BATCH_CHECKPOINT, work_dir=BATCH_WORK_DIR,
+              chunk_pages=BATCH_CHUNK_PAGES, max_active=None, keep_inputs=False, columnar=COLUMNAR_OUTPUT):
+    """Extract every source (text, images, lists and tables to S3) on a pool of worker processes.
+
+    Each document is fetched and pre-screened by one worker, then split into tasks of
+    chunk_pages pages for the single pass plus one camelot task per candidate table page.
+    Work is balanced at that granularity by a WorkStealingScheduler. At most max_active
+    documents (2 per worker by default) are in progress at once. After that, idle workers
+    steal pages of the documents already started instead of fetching new ones.
+
+    Every finished document is appended to the checkpoint file together with its S3 prefix
+    ({S3_BATCH_PREFIX}/{sha256}); images are shared by the whole batch under
+    {S3_BATCH_PREFIX}/images/. Documents already recorded as done are skipped, so an
+    interrupted batch resumes where it stopped. Failed documents are retried on the next run.
+    With columnar, text, lists, tables and image manifests go to Parquet datasets under
+    {S3_BATCH_PREFIX}/columnar/ instead: one per document, or the single COLUMNAR_DATASET
+    shared by the whole batch, recorded as each entry's columnar_dataset.
+    Returns the checkpoint entries of this run.
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    pending = deque(source for source in sources if not checkpoint.done(source))
+    skipped = len(sources) - len(pending)
+    if skipped:
+        print(f"Resuming: {skipped} of {len(sources)} documents already done per {checkpoint_path}")
+    if not pending:
+        return []
+    workers = max(1, min(workers, len(pending)))
+    max_active = max_active or 2 * workers
+    scheduler = WorkStealingScheduler(workers)
+    documents, finished = {}, []
+    in_flight, idle = {}, set()
+    batch_start = time.perf_counter()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes, inboxes = {}, {}
+
+    def start_worker(worker_id):
+        inboxes[worker_id] = context.Queue()
+        processes[worker_id] = context.Process(target=_worker_main, args=(worker_id, inboxes[worker_id], results), daemon=True)
+        processes[worker_id].start()
+
+    def active_documents():
+        return sum(1 for document in documents.values() if "status" not in document)
+
+    def assign(worker_id):
+        task = scheduler.pop(worker_id)
+        if task is None and pending and active_documents() < max_active:
+            source = pending.popleft()
+            index = len(documents)
+            documents[index] = {"source": source, "remaining": 1, "workers": set(), "tables": 0, "artifacts": 0,
+                                "started": time.perf_counter()}
+            task = (index, "prepare", (source, work_dir, columnar))
+        if task is None:
+            task = scheduler.steal(worker_id)
+        if task is None:
+            idle.add(worker_id)
+            return
+        idle.discard(worker_id)
+        in_flight[worker_id] = task
+        inboxes[worker_id].put(task)
+
+    def finish(document):
+        document["status"] = "failed" if document.get("error") else "done"
+        entry = {"source": document["source"], "status": document["status"], "sha256": document.get("sha256"),
+                 "s3_prefix": document.get("s3_prefix"), "pages": document.get("pages", 0),
+                 "tables": document["tables"], "artifacts": document["artifacts"], "workers": len(document["workers"]),
+                 "seconds": round(time.perf_counter() - document["started"], 3), "finished_at": time.time()}
+        if columnar and document.get("sha256"):
+            entry["columnar_dataset"] = f"{S3_BATCH_PREFIX}/{COLUMNAR_FOLDER}/{COLUMNAR_DATASET or document['sha256']}"
+        if document.get("error"):
+            entry["error"] = document["error"]
+        checkpoint.record(entry)
+        finished.append(entry)
+        count("documents", status=entry["status"])
+        if entry["status"] == "done":
+            search_index = get_index()
+            if search_index is not None:
+                search_index.set_source(entry["sha256"], entry["source"])
+            print(f"✅ {entry['source']}: {entry['pages']} pages, {entry['tables']} tables on {entry['workers']} workers "
+                  f"({entry['seconds']:.2f}s) -> s3://{get_uploader().bucket}/{entry['s3_prefix']}")
+            if not keep_inputs and source_kind(entry["source"]) != "path" and document.get("path"):
+                for leftover in (document["path"], document["path"] + ".meta.json"):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+        else:
+            print(f"❌ {entry['source']}: {entry['error']}")
+
+    def complete(worker_id, task, value, error):
+        index, kind, _ = task
+        document = documents[index]
+        document["remaining"] -= 1
+        document["workers"].add(worker_id)
+        if error:
+            document.setdefault("error", f"{kind} task failed: {error}")
+            document["remaining"] -= scheduler.drop(index)
+        elif kind == "prepare":
+            document.update(path=value["path"], sha256=value["sha256"], pages=value["pages"],
+                            s3_prefix=f"{S3_BATCH_PREFIX}/{value['sha256']}")
+            # Columnar rows are keyed by the document's sha256 under the batch prefix, not its own
+            columnar_doc_id = value["sha256"] if columnar else None
+            tasks = [(index, "pages", (document["path"], page_range, document["s3_prefix"], S3_BATCH_PREFIX,
+                                       columnar_doc_id, S3_BATCH_PREFIX, value["sha256"]))
+                     for page_range in split_page_range(value["pages"], 1, chunk_pages)]
+            tasks += [(index, "tables", (document["path"], page_number, document["s3_prefix"], columnar_doc_id,
+                                         S3_BATCH_PREFIX))
+                      for page_number in value["candidates"]]
+            document["remaining"] += len(tasks)
+            scheduler.push(worker_id, tasks)
+        elif kind == "pages":
+            document["artifacts"] += len(value["artifacts"])
+        else:
+            document["tables"] += value
+            document["artifacts"] += value
+        if document["remaining"] == 0:
+            finish(document)
+
+    def replace_dead_workers():
+        # A worker that died (e.g. killed for memory) fails its document; a fresh one takes its deque
+        for worker_id, process in list(processes.items()):
+            if not process.is_alive() and worker_id in in_flight:
+                complete(worker_id, in_flight.pop(worker_id), None, f"worker exited with code {process.exitcode}")
+                start_worker(worker_id)
+                assign(worker_id)
+                for idle_worker in list(idle):
+                    assign(idle_worker)
+
+    try:
+        for worker_id in range(workers):
+            start_worker(worker_id)
+            assign(worker_id)
+        while in_flight:
+            # Checked every time round, so a steady stream of results cannot hide a dead worker
+            replace_dead_workers()
+            if not in_flight:
+                break
+            try:
+                worker_id, task, value, error, worker_telemetry, seconds = results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            merge(worker_telemetry)
+            if in_flight.get(worker_id) != task:
+                # Sent just before its worker died, and already failed by replace_dead_workers
+                continue
+            in_flight.pop(worker_id)
+            complete(worker_id, task, value, error)
+            assign(worker_id)
+            # New tasks (a prepared document) or a freed document slot can put idle workers back to work
+            for idle_worker in list(idle):
+                assign(idle_worker)
+    except KeyboardInterrupt:
+        print(f"Interrupted; {len(finished)} documents checkpointed in {checkpoint_path}, rerun to resume.")
+        raise
+    finally:
+        for worker_id, process in processes.items():
+            if process.is_alive():
+                inboxes[worker_id].put(None)
+        for process in processes.values():
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+    elapsed = time.perf_counter() - batch_start
+    done = [entry for entry in finished if entry["status"] == "done"]
+    pages = sum(entry["pages"] for entry in done)
+    print(f"Batch: {len(done)} done, {len(finished) - len(done)} failed, {skipped} skipped; "
+          f"{pages} pages in {elapsed:.2f}s ({pages / elapsed if elapsed else 0:.1f} pages/s, "
+          f"{workers} workers, {scheduler.steals} steals)")
+    return finished
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract every PDF of a manifest (URLs, s3:// keys or paths) to S3.")
+    parser.add_argument("manifest", help="text file with one URL, s3://bucket/key or local path per line")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--chunk-pages", type=int, default=BATCH_CHUNK_PAGES)
+    parser.add_argument("--checkpoint", default=BATCH_CHECKPOINT)
+    parser.add_argument("--work-dir", default=BATCH_WORK_DIR)
+    parser.add_argument("--max-active", type=int, help="documents in progress at once (default: 2 per worker)")
+    parser.add_argument("--keep-inputs", action="store_true", help="keep downloaded PDFs after their document is done")
+    parser.add_argument("--columnar", action="store_true", default=COLUMNAR_OUTPUT,
+                        help="write Parquet datasets instead of per-page objects (default: COLUMNAR_OUTPUT)")
+    args = parser.parse_args()
+
+    run_batch(read_manifest(args.manifest), args.workers, args.checkpoint, args.work_dir, args.chunk_pages,
+              args.max_active, args.keep_inputs, args.columnar)
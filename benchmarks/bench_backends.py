@@ -0,0 +1,353 @@
+"""Throughput and agreement of every extraction backend on the versioned corpus.
+
+Usage: python benchmarks/bench_backends.py [--backends pymupdf docling azure adobe] [--output FILE] [--baseline FILE]
+       python benchmarks/bench_backends.py --record azure|adobe [--seed-from-fake]
+
+Backends:
+  pymupdf  main.py's page pass (text, images, lists) with camelot on the pre-screened pages
+  docling  extractors.DoclingExtractor (skipped when docling is not installed)
+  azure    extractors.AzureLayoutExtractor on a client replaying recorded responses
+  adobe    extractors.AdobeExtractor answering from recorded structuredData.json
+
+Each backend runs over the whole corpus in its own child process, so peak RSS is its own.
+Reported per backend: pages/s, p50/p95 per-page latency, peak RSS, bytes written and
+agreement with the corpus truth: text is word F1 outside tables, tables is the mean cell F1
+of each true table against the best extracted table on its page. pymupdf is timed page by
+page; the other backends work a document at a time, so their per-page latency is the
+document's time (plus the recorded service time for cloud backends) spread over its pages.
+Results are saved as JSON (benchmarks/results/<commit>.json by default); --baseline prints
+the change against an earlier results file. Each result carries the recorded_with of the
+recordings it replayed; a cloud backend replaying another backend's output (azure seeded
+from azure_fake) is marked fake-seeded and its F1 scores are not printed as quality numbers.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from corpus import CORPUS_VERSION, load_corpus
+from document_model import Document, Table, TextBlock
+from sinks import LocalDiskSink, PAGE_ARTIFACT
+
+BACKENDS = ("pymupdf", "docling", "azure", "adobe")
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+class CapturingSink:
+    """Counts the bytes written through sink and keeps the page text and table CSVs."""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.bytes_written = 0
+        self.text = {}
+        self.tables = {}
+
+    def write(self, name, data):
+        payload = data.encode("utf-8") if isinstance(data, str) else data
+        self.bytes_written += len(payload)
+        match = PAGE_ARTIFACT.match(name)
+        if match and match.group(2) == "text":
+            self.text[int(match.group(1))] = payload.decode("utf-8")
+        elif match and match.group(3) == "csv":
+            self.tables.setdefault(int(match.group(1)), []).append(list(csv.reader(io.StringIO(payload.decode("utf-8")))))
+        return self.sink.write(name, data)
+
+    def exists(self, name):
+        return self.sink.exists(name)
+
+    def flush(self):
+        return self.sink.flush()
+
+    def to_document(self, source, backend):
+        document = Document(source, backend)
+        for number in sorted(set(self.text) | set(self.tables)):
+            page = document.page(number)
+            if self.text.get(number, "").strip():
+                page.blocks.append(TextBlock(self.text[number]))
+            page.tables.extend(Table(rows) for rows in self.tables.get(number, []))
+        return document
+
+
+def write_document(document, sink):
+    """Per-page text and table CSVs of a Document, named like main.py's artifacts."""
+    for page in document.pages:
+        sink.write(f"page_{page.number}_text.txt", page.text)
+        for table_idx, table in enumerate(page.tables):
+            buffer = io.StringIO()
+            csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(table.rows)
+            sink.write(f"page_{page.number}_table_{table_idx}.csv", buffer.getvalue())
+
+
+def run_pymupdf(path, sink):
+    from extraction_engine import iter_pages, TextHandler, ImageHandler, ListHandler
+    from main import CamelotTableHandler, TABLE_PRESCREEN_THRESHOLD
+    from table_prescreen import prescreen
+
+    candidates = prescreen(path, TABLE_PRESCREEN_THRESHOLD).candidates
+    handlers = [TextHandler(sink), ImageHandler(sink), ListHandler(sink), CamelotTableHandler(path, sink, candidates)]
+    page_seconds = []
+    last = time.perf_counter()
+    for _ in iter_pages(path, handlers):
+        now = time.perf_counter()
+        page_seconds.append(now - last)
+        last = now
+    return sink.to_document(path, "pymupdf"), page_seconds, 0.0, None
+
+
+def run_document_backend(extractor, path, sink, page_count, service_clock=lambda: 0.0, recorded_with=lambda: None):
+    """service_clock returns the recorded service seconds replayed so far, recorded_with the source of the last replay."""
+    start = time.perf_counter()
+    service_before = service_clock()
+    document = extractor.extract(path)
+    write_document(document, sink)
+    service_seconds = service_clock() - service_before
+    seconds = time.perf_counter() - start + service_seconds
+    return document, [seconds / page_count] * page_count, service_seconds, recorded_with()
+
+
+def make_runner(backend):
+    """A function (path, sink, page_count) -> (Document, page seconds, service seconds, recorded_with), or a skip reason."""
+    if backend == "pymupdf":
+        return lambda path, sink, page_count: run_pymupdf(path, sink)
+    service_clock = lambda: 0.0
+    recorded_with = lambda: None
+    if backend == "docling":
+        from extractors import DoclingExtractor
+
+        extractor = DoclingExtractor()
+        if not extractor.available():
+            return "docling is not installed"
+    elif backend == "azure":
+        from extractors import AzureLayoutExtractor
+        from recorded_fakes import RecordedAzureClient
+
+        client = RecordedAzureClient()
+        extractor = AzureLayoutExtractor(client=client)
+        service_clock = lambda: client.service_seconds
+        recorded_with = lambda: client.recorded_with
+    elif backend == "adobe":
+        from recorded_fakes import RecordedAdobeExtractor
+
+        extractor = RecordedAdobeExtractor()
+        service_clock = lambda: extractor.service_seconds
+        recorded_with = lambda: extractor.recorded_with
+    else:
+        raise ValueError(f"Unknown backend '{backend}'. Available: {', '.join(BACKENDS)}")
+    return lambda path, sink, page_count: run_document_backend(extractor, path, sink, page_count, service_clock,
+                                                               recorded_with)
+
+
+def fake_seeded(backend, recorded_with):
+    """Whether backend's results replay recordings made by something other than the backend itself."""
+    return any(source not in (None, backend) for source in recorded_with)
+
+
+def words(text):
+    return Counter(re.findall(r"\w+", text.lower()))
+
+
+def f1(expected, found):
+    if not expected and not found:
+        return 1.0
+    overlap = sum((expected & found).values())
+    return 2 * overlap / (sum(expected.values()) + sum(found.values()))
+
+
+def cells(rows):
+    return Counter(" ".join(str(cell).split()).lower() for row in rows for cell in row if str(cell).strip())
+
+
+def agreement(truth, document):
+    """(text word F1 over the document, mean cell F1 of the true tables, tables found, tables expected)."""
+    expected_words, found_words, overlap = 0, 0, 0
+    table_scores, tables_found = [], 0
+    for truth_page in truth["pages"]:
+        page = document.pages[truth_page["number"] - 1] if truth_page["number"] <= len(document.pages) else None
+        expected = words(truth_page["text"])
+        found = Counter()
+        extracted_tables = page.tables if page else []
+        if page:
+            found = words(page.text)
+            # Table cells that a backend also leaves in the page text are not text errors
+            for table in extracted_tables:
+                found -= words(" ".join(str(cell) for row in table.rows for cell in row))
+        expected_words += sum(expected.values())
+        found_words += sum(found.values())
+        overlap += sum((expected & found).values())
+        tables_found += len(extracted_tables)
+        for truth_table in truth_page["tables"]:
+            table_scores.append(max((f1(cells(truth_table), cells(table.rows)) for table in extracted_tables), default=0.0))
+    text_f1 = 2 * overlap / (expected_words + found_words) if expected_words + found_words else 1.0
+    table_f1 = sum(table_scores) / len(table_scores) if table_scores else None
+    return text_f1, table_f1, tables_found, len(table_scores)
+
+
+def child(backend):
+    """Run one backend over the corpus and print its per-document results as JSON."""
+    from memory_guard import peak_rss_mb
+
+    runner = make_runner(backend)
+    if isinstance(runner, str):
+        print(json.dumps({"skipped": runner}))
+        return
+    documents = []
+    for entry in load_corpus():
+        with tempfile.TemporaryDirectory() as output_folder:
+            sink = CapturingSink(LocalDiskSink(output_folder))
+            try:
+                start = time.perf_counter()
+                document, page_seconds, service_seconds, recorded_with = runner(entry["path"], sink, entry["pages"])
+                seconds = time.perf_counter() - start + service_seconds
+            except LookupError as e:
+                documents.append({"name": entry["name"], "skipped": str(e)})
+                continue
+        text_f1, table_f1, tables_found, tables_expected = agreement(entry["truth"], document)
+        documents.append({"name": entry["name"], "pages": entry["pages"], "seconds": seconds,
+                          "service_seconds": service_seconds, "recorded_with": recorded_with, "page_seconds": page_seconds,
+                          "bytes_written": sink.bytes_written, "text_f1": text_f1, "table_f1": table_f1,
+                          "tables_found": tables_found, "tables_expected": tables_expected})
+    print(json.dumps({"documents": documents, "peak_rss_mb": peak_rss_mb()}))
+
+
+def summarize(backend, result):
+    documents = [doc for doc in result["documents"] if "skipped" not in doc]
+    if not documents:
+        return {"skipped": "; ".join(dict.fromkeys(doc["skipped"] for doc in result["documents"])) or "no documents"}
+    pages = sum(doc["pages"] for doc in documents)
+    latencies = np.array([seconds for doc in documents for seconds in doc["page_seconds"]])
+    table_docs = [doc for doc in documents if doc["table_f1"] is not None]
+    recorded_with = sorted({doc["recorded_with"] for doc in documents if doc.get("recorded_with")})
+    return {
+        "recorded_with": recorded_with,
+        "fake_seeded": fake_seeded(backend, recorded_with),
+        "documents": len(documents),
+        "skipped_documents": [doc["name"] for doc in result["documents"] if "skipped" in doc],
+        "pages": pages,
+        "seconds": sum(doc["seconds"] for doc in documents),
+        "pages_per_second": pages / sum(doc["seconds"] for doc in documents),
+        "p50_page_seconds": float(np.percentile(latencies, 50)),
+        "p95_page_seconds": float(np.percentile(latencies, 95)),
+        "peak_rss_mb": result["peak_rss_mb"],
+        "bytes_written": sum(doc["bytes_written"] for doc in documents),
+        # Weighted by pages / by expected tables so small documents do not dominate
+        "text_f1": sum(doc["text_f1"] * doc["pages"] for doc in documents) / pages,
+        "table_f1": (sum(doc["table_f1"] * doc["tables_expected"] for doc in table_docs)
+                     / sum(doc["tables_expected"] for doc in table_docs)) if table_docs else None,
+        "tables_found": sum(doc["tables_found"] for doc in documents),
+        "tables_expected": sum(doc["tables_expected"] for doc in documents),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(results, baseline=None):
+    print(f"{'backend':<8} {'pages/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>7} {'KB out':>8} {'text F1':>8} "
+          f"{'table F1':>8} {'tables':>7}")
+    for backend, summary in results["backends"].items():
+        if "skipped" in summary:
+            print(f"{backend:<8} skipped: {summary['skipped']}")
+            continue
+        fake = summary.get("fake_seeded", False)
+        text_f1 = "fake" if fake else f"{summary['text_f1']:.3f}"
+        table_f1 = "fake" if fake else f"{summary['table_f1']:.3f}" if summary["table_f1"] is not None else "-"
+        print(f"{backend:<8} {summary['pages_per_second']:>8.1f} {summary['p50_page_seconds'] * 1000:>8.1f} "
+              f"{summary['p95_page_seconds'] * 1000:>8.1f} {summary['peak_rss_mb']:>7.1f} "
+              f"{summary['bytes_written'] / 1024:>8.1f} {text_f1:>8} {table_f1:>8} "
+              f"{summary['tables_found']:>3}/{summary['tables_expected']:<3}")
+        if fake:
+            print(f"{'':<8} replays recordings made with {', '.join(summary['recorded_with'])}: "
+                  f"agreement scores are not {backend}'s quality")
+        previous = (baseline or {}).get("backends", {}).get(backend)
+        if previous and "skipped" not in previous:
+            changes = [f"pages/s {summary['pages_per_second'] / previous['pages_per_second'] - 1:+.1%}",
+                       f"p95 {summary['p95_page_seconds'] / previous['p95_page_seconds'] - 1:+.1%}",
+                       f"RSS {summary['peak_rss_mb'] - previous['peak_rss_mb']:+.1f}MB"]
+            if not fake and not previous.get("fake_seeded", False):
+                changes.append(f"text F1 {summary['text_f1'] - previous['text_f1']:+.3f}")
+                if summary["table_f1"] is not None and previous.get("table_f1") is not None:
+                    changes.append(f"table F1 {summary['table_f1'] - previous['table_f1']:+.3f}")
+            print(f"{'':<8} vs {baseline.get('commit')}: {', '.join(changes)}")
+
+
+def record(backend, seed_from_fake=False):
+    """Record live (or, for azure with seed_from_fake, azure_fake) responses for the corpus."""
+    import recorded_fakes
+
+    for entry in load_corpus():
+        with open(entry["path"], "rb") as f:
+            data = f.read()
+        if backend == "azure" and seed_from_fake:
+            recorded_fakes.seed_azure_from_fake(entry["name"], data)
+        elif backend == "azure":
+            from extractors import AzureLayoutExtractor
+
+            live = AzureLayoutExtractor()
+            AzureLayoutExtractor(client=recorded_fakes.RecordingAzureClient(live._client(), entry["name"])).extract(entry["path"])
+        elif backend == "adobe":
+            recorded_fakes.RecordingAdobeExtractor(entry["name"]).extract(entry["path"])
+        else:
+            raise ValueError(f"Only cloud backends are recorded, not '{backend}'")
+        print(f"Recorded {backend} response for {entry['name']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--output", help="results JSON (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--record", choices=["azure", "adobe"], help="record responses for the corpus and exit")
+    parser.add_argument("--seed-from-fake", action="store_true", help="with --record azure, use azure_fake")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child)
+    if args.record:
+        return record(args.record, args.seed_from_fake)
+
+    commit = git_commit()
+    results = {"corpus_version": CORPUS_VERSION, "commit": commit, "created": datetime.now(timezone.utc).isoformat(),
+               "python": platform.python_version(), "platform": platform.platform(), "backends": {}, "documents": {}}
+    for backend in args.backends:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", backend],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if "skipped" in result:
+            results["backends"][backend] = {"skipped": result["skipped"]}
+            continue
+        results["backends"][backend] = summarize(backend, result)
+        results["documents"][backend] = result["documents"]
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(f"Corpus v{CORPUS_VERSION} at {commit or 'unknown commit'}")
+    print_summary(results, baseline)
+
+    output_path = args.output or os.path.join(RESULTS_FOLDER, f"{commit or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
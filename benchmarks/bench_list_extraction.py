@@ -0,0 +1,93 @@
+"""Bullet-prefix line filter vs. structured list trees from get_text("dict").
+
+Usage: python benchmarks/bench_list_extraction.py [--pages 500] [--repeat 3]
+
+Pages are synthetic: a paragraph, a bulleted list with wrapped items and a nested
+numbered list. Both approaches are timed on their own (each pays for its own text
+extraction) and as the page pass runs them next to the text output: the old filter reused
+the page text, the new trees read the dict from the same TextPage the text came from.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+from list_extraction import page_list_trees, list_text
+
+# The prefixes the plain-text filter used
+LIST_BULLETS = ('-', '*', '•', '○')
+
+
+def make_pdf(path, page_count):
+    pdf_document = fitz.open()
+    for page_index in range(page_count):
+        page = pdf_document.new_page()
+        page.insert_textbox(fitz.Rect(72, 60, 520, 200), f"Page {page_index + 1}. " + "Lorem ipsum dolor sit amet. " * 20)
+        y = 220
+        for item in range(6):
+            page.insert_text((72, y), f"- Item {item + 1} with a description long enough", fontsize=11)
+            page.insert_text((84, y + 14), "to wrap onto a second line", fontsize=11)
+            y += 28
+            if item == 2:
+                for number in range(3):
+                    page.insert_text((96, y), f"{number + 1}. nested step {number + 1}", fontsize=11)
+                    y += 14
+    pdf_document.save(path, garbage=3, deflate=True)
+    pdf_document.close()
+
+
+def prefix_lines(page, text=None):
+    text = page.get_text() if text is None else text
+    return [line.strip() for line in text.splitlines() if line.strip().startswith(LIST_BULLETS)]
+
+
+def tree_lines(page, text_dict=None):
+    return list_text(page_list_trees(page, text_dict))
+
+
+def text_and_trees(page):
+    textpage = page.get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+    page.get_text(textpage=textpage)
+    return tree_lines(page, page.get_text("dict", textpage=textpage))
+
+
+def timed(pdf_path, per_page, repeat):
+    best, found = None, 0
+    for _ in range(repeat):
+        with fitz.open(pdf_path) as pdf_document:
+            start = time.perf_counter()
+            found = sum(len(per_page(page)) for page in pdf_document)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, "lists.pdf")
+        make_pdf(pdf_path, args.pages)
+
+        cases = [
+            ("prefix filter, own get_text()", prefix_lines),
+            ("list trees, own get_text('dict')", tree_lines),
+            ("text + prefix filter (old pass)", lambda page: prefix_lines(page, page.get_text())),
+            ("text + list trees (new pass)", text_and_trees),
+        ]
+        print(f"{args.pages} pages, best of {args.repeat}")
+        print(f"{'approach':<34} {'seconds':>8} {'pages/s':>9} {'items':>7}")
+        for label, per_page in cases:
+            seconds, found = timed(pdf_path, per_page, args.repeat)
+            print(f"{label:<34} {seconds:>8.3f} {args.pages / seconds:>9.1f} {found:>7}")
+
+
+if __name__ == "__main__":
+    main()
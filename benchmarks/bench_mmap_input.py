@@ -0,0 +1,116 @@
+"""Worker memory of the parallel page pass with PDFs opened from a path vs a memory map.
+
+Usage: python benchmarks/bench_mmap_input.py [--pages 400] [--workers 1 2 4] [--pdf file.pdf]
+
+Every worker walks its page chunks with the text and image handlers and reports its peak
+RSS, PSS (shared pages split between the processes mapping them) and private memory from
+/proc/self/smaps_rollup. Each mode runs in a fresh interpreter since MMAP_INPUT is read at
+import. Without --pdf a synthetic document with a large distinct image per page is used.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+from sinks import ArtifactSink
+
+
+class DiscardSink(ArtifactSink):
+    """Drops every artifact, so only the document side of the pass is measured."""
+
+    def write(self, name, data):
+        return name
+
+
+def make_pdf(path, page_count):
+    pdf_document = fitz.open()
+    noise = os.urandom(512 * 512 * 3)
+    for page_index in range(page_count):
+        page = pdf_document.new_page()
+        page.insert_text((72, 72), f"Page {page_index + 1}. " + "Lorem ipsum dolor sit amet. " * 3)
+        # Random pixels do not compress, so the file is about 750KB per page
+        pixmap = fitz.Pixmap(fitz.csRGB, 512, 512, noise[page_index % 97:] + noise[:page_index % 97], False)
+        page.insert_image(fitz.Rect(72, 100, 520, 548), pixmap=pixmap)
+    pdf_document.save(path, garbage=3, deflate=True)
+    pdf_document.close()
+
+
+def memory_mb():
+    values = {}
+    with open("/proc/self/smaps_rollup") as rollup:
+        for line in rollup:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                values[key] = int(rest.split()[0]) / 1024
+    return values
+
+
+def build_handlers():
+    from extraction_engine import TextHandler, ImageHandler
+
+    sink = DiscardSink()
+    return [TextHandler(sink), ImageHandler(sink)]
+
+
+def walk_chunks(pdf_path, chunks):
+    from extraction_engine import _run_chunk
+    from memory_guard import peak_rss_mb
+
+    for chunk in chunks:
+        # What run_parallel runs per chunk inside a worker
+        _run_chunk(pdf_path, build_handlers, chunk)
+    values = memory_mb()
+    return {"peak_rss": peak_rss_mb(), "pss": values["Pss"],
+            "private": values["Private_Clean"] + values["Private_Dirty"]}
+
+
+def child(pdf_path, workers):
+    from extraction_engine import split_page_range
+
+    with fitz.open(pdf_path) as pdf_document:
+        chunks = split_page_range(len(pdf_document), workers)
+    per_worker = [chunks[index::workers] for index in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # All workers alive at once, each measured after its last chunk
+        reports = list(executor.map(partial(walk_chunks, pdf_path), per_worker))
+    print(json.dumps({"peak_rss": max(report["peak_rss"] for report in reports),
+                      "pss": sum(report["pss"] for report in reports),
+                      "private": sum(report["private"] for report in reports)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pdf")
+    parser.add_argument("--child", nargs=2, metavar=("PDF", "WORKERS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child[0], int(args.child[1]))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = args.pdf
+        if pdf_path is None:
+            pdf_path = os.path.join(temp_dir, "input.pdf")
+            make_pdf(pdf_path, args.pages)
+        print(f"{os.path.getsize(pdf_path) / (1024 * 1024):.0f}MB input")
+        print(f"{'mode':>5} {'workers':>8} {'max peak RSS':>13} {'sum PSS':>9} {'sum private':>12}")
+        for workers in args.workers:
+            for mode in ("file", "mmap"):
+                environment = dict(os.environ, MMAP_INPUT="1" if mode == "mmap" else "0")
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", pdf_path, str(workers)],
+                                        check=True, capture_output=True, text=True, env=environment).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{mode:>5} {workers:>8} {result['peak_rss']:>11.1f}MB {result['pss']:>7.1f}MB "
+                      f"{result['private']:>10.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
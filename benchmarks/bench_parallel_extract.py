@@ -0,0 +1,76 @@
+"""Pages/sec of the PyMuPDF page pass against worker count.
+
+Usage: python benchmarks/bench_parallel_extract.py [file.pdf] [--workers 1 2 4 8] [--min-pages-per-worker N]
+
+Artifacts are written to a temporary folder and nothing is uploaded, so the numbers
+measure extraction only. run_parallel uses at most one worker per min_pages_per_worker
+pages (PARALLEL_MIN_PAGES_PER_WORKER by default), so each row shows the workers and
+chunks that actually ran. Without a PDF, a document with enough pages for the largest
+worker count is generated.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+from extraction_engine import run_single_pass, run_parallel, TextHandler, ImageHandler, ListHandler, \
+    PARALLEL_MIN_PAGES_PER_WORKER
+from sinks import LocalDiskSink
+
+
+def build_handlers(output_folder):
+    sink = LocalDiskSink(output_folder)
+    return [TextHandler(sink), ImageHandler(sink), ListHandler(sink)]
+
+
+def make_pdf(path, page_count):
+    """Pages of prose, a bulleted list and a small image each."""
+    pdf_document = fitz.open()
+    for page_index in range(page_count):
+        page = pdf_document.new_page()
+        page.insert_textbox(fitz.Rect(72, 72, 520, 400), f"Page {page_index + 1}. " + "Lorem ipsum dolor sit amet, "
+                            "consectetur adipiscing elit. " * 12)
+        for item in range(4):
+            page.insert_text((90, 430 + item * 16), f"• List item {item + 1} on page {page_index + 1}")
+        pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+        pixmap.set_rect(pixmap.irect, ((page_index * 37) % 256, 90, 160))
+        page.insert_image(fitz.Rect(72, 520, 200, 648), pixmap=pixmap)
+    pdf_document.save(path)
+    pdf_document.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdf", nargs="?")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, os.cpu_count()])
+    parser.add_argument("--min-pages-per-worker", type=int, default=PARALLEL_MIN_PAGES_PER_WORKER)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = args.pdf
+        if pdf_path is None:
+            pdf_path = os.path.join(temp_dir, "input.pdf")
+            make_pdf(pdf_path, args.min_pages_per_worker * max(args.workers))
+
+        print(f"{'requested':>9} {'workers':>8} {'chunks':>7} {'pages':>7} {'seconds':>9} {'pages/sec':>10}")
+        baseline = None
+        for workers in sorted(set(args.workers)):
+            with tempfile.TemporaryDirectory() as output_folder:
+                if workers == 1:
+                    report = run_single_pass(pdf_path, build_handlers(output_folder))
+                    report.update(workers=1, chunks=1)
+                else:
+                    report = run_parallel(pdf_path, partial(build_handlers, output_folder), workers,
+                                          min_pages_per_worker=args.min_pages_per_worker)
+            rate = report["pages"] / report["total"]
+            baseline = baseline or rate
+            print(f"{workers:>9} {report['workers']:>8} {report['chunks']:>7} {report['pages']:>7} "
+                  f"{report['total']:>9.2f} {rate:>10.1f}  (x{rate / baseline:.2f})")
+
+
+if __name__ == "__main__":
+    main()
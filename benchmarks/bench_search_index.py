@@ -0,0 +1,109 @@
+"""Query latency of the page search index against its size.
+
+Usage: python benchmarks/bench_search_index.py [--pages 100000] [--db path] [--repeat 5]
+
+Pages are synthetic: five blocks of words drawn from a Zipf-distributed vocabulary, so a
+few terms are on almost every page and most are rare. The index is built once per --db
+file (rebuilt when --pages changes) through SearchIndex.index_pages, in the same batches
+the pipeline uses. Queries are timed for rare, medium and common terms and their combinations (the first
+run of each query, which fills the page frequency cache, is not counted); "exhaustive" is
+False when more pages matched than SEARCH_MAX_CANDIDATES and only the newest were ranked.
+Re-indexing one document with one changed page is timed last.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import INDEX_BATCH_PAGES, SearchIndex
+
+VOCABULARY = 50000
+PAGES_PER_DOCUMENT = 100
+BLOCKS_PER_PAGE = 5
+WORDS_PER_BLOCK = 50
+
+QUERIES = [
+    ("rare", "w40000"),
+    ("rare pair", "w2000 w3000"),
+    ("medium", "w500"),
+    ("common", "w20"),
+    ("very common", "w1"),
+    ("common pair", "w1 w20"),
+    ("common + rare", "w1 w40000"),
+    ("common + medium", "w1 w20 w300"),
+]
+
+
+def page_blocks(rng, words, cum_weights):
+    return [(" ".join(rng.choices(words, cum_weights=cum_weights, k=WORDS_PER_BLOCK)), [72.0, 72.0 + 100 * block, 520.0, 160.0 + 100 * block])
+            for block in range(BLOCKS_PER_PAGE)]
+
+
+def build(index, page_count):
+    rng = random.Random(7)
+    words = [f"w{rank}" for rank in range(VOCABULARY)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(VOCABULARY)))
+    start = time.perf_counter()
+    for first in range(0, page_count, PAGES_PER_DOCUMENT):
+        doc_id = f"doc-{first // PAGES_PER_DOCUMENT}"
+        pages = {page: page_blocks(rng, words, cum_weights) for page in range(1, min(PAGES_PER_DOCUMENT, page_count - first) + 1)}
+        for batch_start in range(1, len(pages) + 1, INDEX_BATCH_PAGES):
+            batch = {page: pages[page] for page in range(batch_start, min(batch_start + INDEX_BATCH_PAGES, len(pages) + 1))}
+            index.index_pages(doc_id, batch, source=f"{doc_id}.pdf", page_count=len(pages))
+        if first and first % 100000 == 0:
+            print(f"  {first} pages indexed ({first / (time.perf_counter() - start):.0f} pages/s)")
+    index.optimize()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100000)
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bench_search_index.db"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    index = SearchIndex(args.db)
+    indexed = index.connection.execute("SELECT count(*) FROM pages").fetchone()[0]
+    if indexed != args.pages:
+        index.connection.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+        index = SearchIndex(args.db)
+        print(f"Building an index of {args.pages} pages in {args.db}")
+        seconds = build(index, args.pages)
+        print(f"Built in {seconds:.1f}s ({args.pages / seconds:.0f} pages/s), {os.path.getsize(args.db) / 1e6:.0f} MB")
+
+    print(f"{args.pages} pages, {args.repeat} runs per query, max {index.max_candidates} candidates")
+    print(f"{'query':<16} {'terms':<12} {'candidates':>10} {'exhaustive':>10} {'p50 ms':>8} {'max ms':>8}")
+    for label, query in QUERIES:
+        index.search(query)
+        latencies = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = index.search(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"{label:<16} {query:<12} {result['candidates']:>10} {str(result['exhaustive']):>10} "
+              f"{statistics.median(latencies):>8.1f} {max(latencies):>8.1f}")
+
+    # Re-index one document with one changed page: only that page's postings are rewritten
+    rng = random.Random(11)
+    doc_id = f"doc-{args.pages // PAGES_PER_DOCUMENT // 2}"
+    rows = index.connection.execute("SELECT page, text, blocks FROM pages WHERE doc_id = ?", (doc_id,)).fetchall()
+    pages = {page: [(text[start:end], bbox) for start, end, bbox in json.loads(blocks)] for page, text, blocks in rows}
+    pages[1] = page_blocks(rng, ["changed", "page"], [1, 2])
+    start = time.perf_counter()
+    rewritten = index.index_pages(doc_id, pages, page_count=len(pages))
+    print(f"Re-indexed {doc_id} ({len(pages)} pages): {rewritten} rewritten in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Peak RSS of the streaming page pass against page count.
+
+Usage: python benchmarks/bench_streaming_memory.py [--pages 10 100 500 2000] [--sink disk|memory]
+
+Each size is generated as a synthetic PDF (a paragraph, a bullet list and a distinct image
+per page) and extracted in a fresh child process, so every peak is measured on its own.
+--sink memory keeps every artifact in a MemorySink to show what buffering costs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+
+
+def make_pdf(path, page_count):
+    pdf_document = fitz.open()
+    for page_index in range(page_count):
+        page = pdf_document.new_page()
+        page.insert_textbox(fitz.Rect(72, 72, 520, 300), f"Page {page_index + 1}. " + "Lorem ipsum dolor sit amet. " * 40)
+        page.insert_text((72, 330), "• first item\n• second item\n- third item")
+        pixmap = fitz.Pixmap(fitz.csRGB, 256, 256, bytes((page_index % 256, page_index // 256 % 256, 97)) * 256 * 256, False)
+        page.insert_image(fitz.Rect(72, 400, 328, 656), stream=pixmap.tobytes("png"))
+    pdf_document.save(path, garbage=3, deflate=True)
+    pdf_document.close()
+
+
+def child(pdf_path, sink_kind, output_folder):
+    from extraction_engine import iter_pages, TextHandler, ImageHandler, ListHandler
+    from memory_guard import MemoryCeiling, peak_rss_mb
+    from sinks import LocalDiskSink, MemorySink
+
+    sink = MemorySink() if sink_kind == "memory" else LocalDiskSink(output_folder)
+    ceiling = MemoryCeiling(limit_mb=0)
+    start = time.perf_counter()
+    pages = sum(1 for _ in iter_pages(pdf_path, [TextHandler(sink), ImageHandler(sink), ListHandler(sink)], ceiling=ceiling))
+    print(json.dumps({"pages": pages, "seconds": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500, 2000])
+    parser.add_argument("--sink", choices=["disk", "memory"], default="disk")
+    parser.add_argument("--child", nargs=2, metavar=("PDF", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child[0], args.sink, args.child[1])
+
+    print(f"{'pages':>6} {'seconds':>8} {'pages/s':>8} {'peak RSS':>10}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for page_count in args.pages:
+            pdf_path = os.path.join(temp_dir, f"{page_count}.pdf")
+            make_pdf(pdf_path, page_count)
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--sink", args.sink,
+                                     "--child", pdf_path, os.path.join(temp_dir, f"out-{page_count}")],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{result['pages']:>6} {result['seconds']:>8.2f} {result['pages'] / result['seconds']:>8.1f} "
+                  f"{result['peak_rss_mb']:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Versioned benchmark corpus: synthetic PDFs with known text and tables.
+
+Usage: python benchmarks/corpus.py build|verify
+
+Every document is generated deterministically (fixed seed, no document id or dates) and
+written to benchmarks/corpus/v{CORPUS_VERSION}/ together with {name}.truth.json (page
+text outside tables and table cells) and a manifest.json pinning each file's sha256.
+The PDFs are committed; load_corpus() refuses to run on files that no longer match the
+manifest. Change a generator only together with a new CORPUS_VERSION so results recorded
+against the old corpus stay comparable.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+
+CORPUS_VERSION = 1
+CORPUS_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+WORDS = ("data pipeline extraction table figure storage bucket object page layout model service request "
+         "response latency throughput region invoice revenue quarter total amount customer order shipment "
+         "warehouse supplier contract payment balance report summary analysis metric value growth").split()
+
+
+def corpus_dir(version=CORPUS_VERSION):
+    return os.path.join(CORPUS_ROOT, f"v{version}")
+
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def add_prose(page, rng, top=72):
+    heading = f"Section {rng.randint(1, 99)} {rng.choice(WORDS)}"
+    page.insert_text((72, top), heading, fontsize=14)
+    paragraphs = [" ".join(sentence(rng) for _ in range(4)) for _ in range(3)]
+    y = top + 20
+    for paragraph in paragraphs:
+        page.insert_textbox(fitz.Rect(72, y, 520, y + 110), paragraph, fontsize=10)
+        y += 120
+    return [heading] + paragraphs, y
+
+
+def add_lists(page, rng, top=72):
+    lines, y = [], top
+    for item in range(5):
+        text = f"- {sentence(rng, 6)}"
+        page.insert_text((72, y), text, fontsize=10)
+        lines.append(text)
+        y += 14
+        if item == 1:
+            for step in range(3):
+                text = f"{step + 1}. {sentence(rng, 4)}"
+                page.insert_text((92, y), text, fontsize=10)
+                lines.append(text)
+                y += 14
+    return lines, y
+
+
+def add_table(page, rng, top=72, rows=6, columns=4):
+    """Ruled grid with a header row; returns the cell texts row by row."""
+    cells = [[f"{rng.choice(WORDS)}_{column}" for column in range(columns)]]
+    cells += [[str(rng.randint(100, 99999)) for _ in range(columns)] for _ in range(rows - 1)]
+    width, height, left = 110, 20, 72
+    for row in range(rows + 1):
+        page.draw_line((left, top + row * height), (left + columns * width, top + row * height))
+    for column in range(columns + 1):
+        page.draw_line((left + column * width, top), (left + column * width, top + rows * height))
+    for row, values in enumerate(cells):
+        for column, value in enumerate(values):
+            page.insert_text((left + column * width + 6, top + row * height + 14), value, fontsize=10)
+    return cells, top + rows * height + 20
+
+
+def add_figure(page, rng, top):
+    color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+    pixmap = fitz.Pixmap(fitz.csRGB, 96, 96, bytes(color) * 96 * 96, False)
+    page.insert_image(fitz.Rect(72, top, 216, top + 144), stream=pixmap.tobytes("png"))
+    return top + 160
+
+
+def build_document(kinds, seed):
+    """PDF bytes and truth for a document whose page i has the content kinds[i]."""
+    rng = random.Random(seed)
+    pdf_document = fitz.open()
+    truth = {"pages": []}
+    for number, kind in enumerate(kinds, start=1):
+        page = pdf_document.new_page()
+        text, tables = [], []
+        if kind == "prose":
+            text, _ = add_prose(page, rng)
+        elif kind == "lists":
+            text, _ = add_lists(page, rng)
+        elif kind == "table":
+            caption = sentence(rng, 8)
+            page.insert_text((72, 72), caption, fontsize=10)
+            cells, y = add_table(page, rng, top=100)
+            footer = sentence(rng, 10)
+            page.insert_text((72, y + 10), footer, fontsize=10)
+            text, tables = [caption, footer], [cells]
+        elif kind == "figure":
+            y = add_figure(page, rng, 72)
+            text, _ = add_prose(page, rng, top=y + 20)
+            y = add_figure(page, rng, 560)
+        truth["pages"].append({"number": number, "kind": kind, "text": "\n".join(text), "tables": tables})
+    pdf_document.set_metadata({})
+    data = pdf_document.tobytes(garbage=3, deflate=True, no_new_id=True)
+    pdf_document.close()
+    return data, truth
+
+
+# name -> (page kinds, seed)
+DOCUMENTS = {
+    "prose-8": (["prose"] * 8, 1),
+    "lists-4": (["lists"] * 4, 2),
+    "tables-6": (["table"] * 6, 3),
+    "figures-6": (["figure"] * 6, 4),
+    "mixed-24": (["prose", "table", "lists", "figure"] * 6, 5),
+}
+
+
+def build_corpus(version=CORPUS_VERSION):
+    folder = corpus_dir(version)
+    os.makedirs(folder, exist_ok=True)
+    manifest = {"version": version, "documents": []}
+    for name, (kinds, seed) in DOCUMENTS.items():
+        data, truth = build_document(kinds, seed)
+        with open(os.path.join(folder, f"{name}.pdf"), "wb") as f:
+            f.write(data)
+        with open(os.path.join(folder, f"{name}.truth.json"), "w") as f:
+            json.dump(truth, f, indent=1)
+        manifest["documents"].append({"name": name, "file": f"{name}.pdf", "pages": len(kinds), "bytes": len(data),
+                                      "sha256": hashlib.sha256(data).hexdigest()})
+    with open(os.path.join(folder, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def load_corpus(version=CORPUS_VERSION):
+    """Manifest entries with "path" and "truth" added; raises ValueError when a PDF changed."""
+    folder = corpus_dir(version)
+    with open(os.path.join(folder, "manifest.json")) as f:
+        manifest = json.load(f)
+    documents = []
+    for entry in manifest["documents"]:
+        path = os.path.join(folder, entry["file"])
+        with open(path, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        if sha256 != entry["sha256"]:
+            raise ValueError(f"{path} does not match corpus v{version} (sha256 {sha256}, expected {entry['sha256']})")
+        with open(os.path.join(folder, f"{entry['name']}.truth.json")) as f:
+            truth = json.load(f)
+        documents.append({**entry, "path": path, "truth": truth})
+    return documents
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["build", "verify"])
+    args = parser.parse_args()
+    if args.command == "build":
+        manifest = build_corpus()
+        print(f"Built corpus v{manifest['version']}: {len(manifest['documents'])} documents in {corpus_dir()}")
+    else:
+        documents = load_corpus()
+        print(f"Corpus v{CORPUS_VERSION} OK: {len(documents)} documents, {sum(doc['pages'] for doc in documents)} pages")
@@ -0,0 +1,163 @@
+"""Recorded-response stand-ins for the cloud backends.
+
+Responses are stored per backend under benchmarks/corpus/v{N}/recorded/{backend}/ as
+{name}.json with the request document's sha256, the seconds the service took and the raw
+response: Azure's AnalyzeResult.as_dict() (REST field names) or Adobe's structuredData.json.
+Replays go through the same mapping code as a live run (azure_result_to_document and
+adobe_structured_data_to_document), so only the network call is left out.
+
+Record with credentials in .env:  python benchmarks/bench_backends.py --record azure
+Without Azure credentials, --record azure --seed-from-fake records azure_fake's layout
+results instead; those recordings are marked "recorded_with": "azure_fake" and the
+replaying clients expose the recorded_with of their last replay.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import corpus_dir
+from extractors import AdobeExtractor
+
+
+class MissingRecording(LookupError):
+    """No recorded response for this document."""
+
+
+def recordings_dir(backend):
+    return os.path.join(corpus_dir(), "recorded", backend)
+
+
+def save_recording(backend, name, data, response, service_seconds, recorded_with):
+    os.makedirs(recordings_dir(backend), exist_ok=True)
+    recording = {"backend": backend, "sha256": hashlib.sha256(data).hexdigest(), "recorded_with": recorded_with,
+                 "service_seconds": service_seconds, "response": response}
+    with open(os.path.join(recordings_dir(backend), f"{name}.json"), "w") as f:
+        json.dump(recording, f)
+
+
+def load_recording(backend, data):
+    """The recording whose request document hashes to sha256(data)."""
+    sha256 = hashlib.sha256(data).hexdigest()
+    folder = recordings_dir(backend)
+    for file_name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+        with open(os.path.join(folder, file_name)) as f:
+            recording = json.load(f)
+        if recording["sha256"] == sha256:
+            return recording
+    raise MissingRecording(f"no {backend} recording in {os.path.relpath(folder)}")
+
+
+class _Record(SimpleNamespace):
+    # Fields left out of a REST payload read as None, as they do on the SDK models
+    def __getattr__(self, name):
+        return None
+
+
+def rest_namespace(value):
+    """REST JSON (camelCase keys) as nested objects with the SDK's snake_case attributes."""
+    if isinstance(value, dict):
+        return _Record(**{re.sub(r"(?<!^)(?=[A-Z])", "_", key).lower(): rest_namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [rest_namespace(item) for item in value]
+    return value
+
+
+def rest_dict(value):
+    """Inverse of rest_namespace for SimpleNamespace trees such as azure_fake's results."""
+    if isinstance(value, SimpleNamespace):
+        return {re.sub(r"_([a-z])", lambda match: match.group(1).upper(), key): rest_dict(item)
+                for key, item in vars(value).items() if item is not None}
+    if isinstance(value, list):
+        return [rest_dict(item) for item in value]
+    return value
+
+
+class _Poller:
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+class RecordedAzureClient:
+    """Replays recorded analyses in place of azure.ai.documentintelligence.DocumentIntelligenceClient."""
+
+    def __init__(self):
+        self.service_seconds = 0.0
+        self.recorded_with = None
+
+    def begin_analyze_document(self, model_id, body, **kwargs):
+        recording = load_recording("azure", body.read() if hasattr(body, "read") else bytes(body))
+        self.service_seconds += recording["service_seconds"]
+        self.recorded_with = recording["recorded_with"]
+        return _Poller(rest_namespace(recording["response"]))
+
+
+class RecordingAzureClient:
+    """Wraps a live client and saves every analysis it returns."""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def begin_analyze_document(self, model_id, body, **kwargs):
+        data = body.read() if hasattr(body, "read") else bytes(body)
+        start = time.perf_counter()
+        result = self.client.begin_analyze_document(model_id, body=io.BytesIO(data), **kwargs).result()
+        save_recording("azure", self.name, data, result.as_dict(), time.perf_counter() - start, "azure")
+        return _Poller(result)
+
+
+def seed_azure_from_fake(name, data):
+    """Record azure_fake's layout result for data (no page or size limits)."""
+    from azure_fake import FakeDocumentIntelligenceClient
+
+    async def analyze():
+        client = FakeDocumentIntelligenceClient(max_pages=10 ** 6, max_file_mb=10 ** 6, latency=0)
+        poller = await client.begin_analyze_document("prebuilt-layout", body=io.BytesIO(data))
+        return await poller.result()
+
+    start = time.perf_counter()
+    result = asyncio.run(analyze())
+    save_recording("azure", name, data, rest_dict(result), time.perf_counter() - start, "azure_fake")
+
+
+class RecordedAdobeExtractor(AdobeExtractor):
+    """AdobeExtractor answering from recorded structuredData.json instead of PDF Services."""
+
+    def __init__(self):
+        self.service_seconds = 0.0
+        self.recorded_with = None
+
+    def available(self):
+        return True
+
+    def fetch_structured_data(self, file_path):
+        with open(file_path, "rb") as f:
+            recording = load_recording("adobe", f.read())
+        self.service_seconds += recording["service_seconds"]
+        self.recorded_with = recording["recorded_with"]
+        return recording["response"]
+
+
+class RecordingAdobeExtractor(AdobeExtractor):
+    """AdobeExtractor that saves the structuredData.json of every live run."""
+
+    def __init__(self, name):
+        self.name_for_recording = name
+
+    def fetch_structured_data(self, file_path):
+        start = time.perf_counter()
+        structured_data = super().fetch_structured_data(file_path)
+        with open(file_path, "rb") as f:
+            save_recording("adobe", self.name_for_recording, f.read(), structured_data, time.perf_counter() - start, "adobe")
+        return structured_data
@@ -1,41 +1,203 @@
+import gc
 import logging
 import time
 from pathlib import Path
 from docling_core.types.doc import ImageRefMode, PictureItem, TableItem
-from docling.datamodel.base_models import FigureElement, InputFormat, Table
+from docling.datamodel.base_models import InputFormat
 from docling.datamodel.pipeline_options import PdfPipelineOptions
 from docling.document_converter import DocumentConverter, PdfFormatOption
-import boto3
+import base64
+import io
 import os
+import re
+from sinks import ContentStore, LocalDiskSink, S3Sink, TeeSink
+from extraction_cache import ExtractionCache, file_sha256
+from instrumentation import count, span
+from memory_guard import MemoryCeiling, STREAM_MEMORY_LIMIT_MB
+from pdf_input import open_pdf
 
 # AWS S3 Configuration
-s3 = boto3.client('s3',
-                  aws_access_key_id=os.getenv('AWS_SERVER_PUBLIC_KEY'),
-                  aws_secret_access_key=os.getenv('AWS_SERVER_SECRET_KEY'))
 bucket_name = os.getenv('AWS_BUCKET_NAME')
+S3_MARKDOWN_PREFIX = "pdf_processing_pipeline/pdf_os_pipeline/markdown_outputs"
 
-# Helper function to upload files to S3
-def upload_file_to_s3(file_path, object_name):
-    try:
-        s3.upload_file(file_path, bucket_name, object_name)
-        print(f"Uploaded {file_path} to s3://{bucket_name}/{object_name}")
-    except Exception as e:
-        print(f"Error uploading file {file_path}: {e}")
+# Helper function to encode a PIL image as PNG bytes
+def png_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# Figures are stored once under their content hash, shared across documents
+FIGURES_FOLDER = "figures"
+FIGURE_REF = re.compile(r"\]\((" + FIGURES_FOLDER + r"/[0-9a-f]{64}\.png)\)")
+
+# Figure names known to be in S3, shared across the documents of this process
+_known_figures = set()
+
+def build_figure_store(s3_sink, mirrors):
+    """ContentStore writing figures/<sha256>.png to S3 unless it is already there.
+
+    mirrors (a local copy, the cache staging folder) get every figure of the document.
+    """
+    return ContentStore(s3_sink, FIGURES_FOLDER, check_existing=True, known=_known_figures,
+                        mirror=TeeSink(*mirrors) if mirrors else None)
+
+def store_figure(figure_store, image_bytes, figure_bytes=None):
+    """Store a PNG once under figures/<sha256>.png and return its name.
+
+    figure_bytes, if given, maps the names of this document's figures to their bytes.
+    """
+    name, _ = figure_store.put(image_bytes, "png")
+    if figure_bytes is not None:
+        figure_bytes[name] = image_bytes
+    return name
+
+def embed_figures(referenced_markdown, load_figure):
+    """Build the EMBEDDED markdown variant from the REFERENCED one.
+
+    load_figure(name) returns the stored PNG bytes (e.g. figure_bytes.get, or an S3 GET);
+    the bytes are base64-inlined as they are, nothing is rendered or re-encoded.
+    """
+    def inline(match):
+        data = base64.b64encode(load_figure(match.group(1))).decode("ascii")
+        return f"](data:image/png;base64,{data})"
+    return FIGURE_REF.sub(inline, referenced_markdown)
 
 
 # Constants
 IMAGE_RESOLUTION_SCALE = 2.0
+EXTRACTOR_NAME = "docling"
 
-def main():
+def extraction_options(render_pages, write_embedded):
+    return {
+        "images_scale": IMAGE_RESOLUTION_SCALE,
+        "generate_page_images": render_pages,
+        "generate_picture_images": True,
+        "write_embedded": write_embedded,
+    }
+
+def write_conversion(conv_res, sink, figure_store, render_pages, table_counter=0, figure_bytes=None):
+    """Write page images, table crops and figures of one conversion result.
+
+    Returns the REFERENCED markdown and the updated table counter.
+    """
+    doc_filename = conv_res.input.file.stem
+
+    # Save page images, only when asked for
+    if render_pages:
+        for page_no, page in conv_res.document.pages.items():
+            sink.write(f"{doc_filename}-{page_no}.png", png_bytes(page.image.pil_image))
+
+    # Save figures once per content hash; table crops need the page images
+    for element, _level in conv_res.document.iterate_items():
+        if isinstance(element, TableItem) and render_pages:
+            table_counter += 1
+            sink.write(f"{doc_filename}-table-{table_counter}.png", png_bytes(element.get_image(conv_res.document)))
+
+        if isinstance(element, PictureItem) and element.image is not None:
+            figure_name = store_figure(figure_store, png_bytes(element.image.pil_image), figure_bytes)
+            # Point the referenced markdown at the stored figure
+            element.image.uri = Path(figure_name)
+
+    return conv_res.document.export_to_markdown(image_mode=ImageRefMode.REFERENCED), table_counter
+
+def iter_conversion_windows(doc_converter, input_doc_path, window_pages, ceiling=None):
+    """Convert a PDF window_pages pages at a time, yielding each ConversionResult.
+
+    Only one window's page and picture images are alive at once: the caller writes them
+    out, and the next window is converted after the previous result has been dropped.
+    """
+    with open_pdf(input_doc_path) as pdf_document:
+        page_count = len(pdf_document)
+    for first_page in range(1, page_count + 1, window_pages):
+        last_page = min(first_page + window_pages - 1, page_count)
+        with span("docling.convert", first_page=first_page, last_page=last_page):
+            conv_res = doc_converter.convert(input_doc_path, page_range=(first_page, last_page))
+        count("pages", last_page - first_page + 1)
+        yield conv_res
+        del conv_res
+        gc.collect()
+        if ceiling is not None:
+            ceiling.check(f"pages {first_page}-{last_page} of {input_doc_path}")
+
+def main(keep_local=False, cache=None, render_pages=True, write_embedded=None, stream_window=None,
+         memory_limit_mb=STREAM_MEMORY_LIMIT_MB):
+    """Convert downloaded.pdf with Docling and upload markdown and figures.
+
+    Page images and the table crops made from them are rendered unless render_pages=False.
+    Pictures are stored once per content hash under figures/, which every document shares:
+    a figure already in S3 is not uploaded again. The markdown references them; the
+    base64 EMBEDDED variant is derived from it with embed_figures and written unless
+    write_embedded=False, so it can be built on demand instead.
+
+    With stream_window, the document is converted that many pages at a time so page and
+    picture images never pile up for the whole document, within memory_limit_mb. The
+    EMBEDDED variant holds every figure at once, so by default it is not written in that mode.
+    """
     logging.basicConfig(level=logging.INFO)
+    if write_embedded is None:
+        write_embedded = not stream_window
+    if stream_window and write_embedded:
+        raise ValueError("write_embedded needs every figure in memory; derive it later with embed_figures")
 
     input_doc_path = Path("downloaded.pdf")
     output_dir = Path("output")
 
+    # Artifacts go straight to S3; a local copy in output_dir is opt-in
+    s3_sink = S3Sink(S3_MARKDOWN_PREFIX)
+    sinks = [s3_sink]
+    if keep_local:
+        sinks.append(LocalDiskSink(str(output_dir)))
+
+    start_time = time.time()
+
+    # Serve a previously converted document straight from the cache
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(file_sha256(input_doc_path), EXTRACTOR_NAME,
+                                   extraction_options(render_pages, write_embedded))
+        cached = cache.get(cache_key)
+        if cached is not None:
+            sink = TeeSink(*sinks)
+            figure_store = build_figure_store(s3_sink, sinks[1:])
+            for name, data in cached.items():
+                if name.startswith(f"{FIGURES_FOLDER}/"):
+                    figure_store.put(data, "png")
+                else:
+                    sink.write(name, data)
+            upload_report = s3_sink.flush()
+            figure_store.flush()
+            logging.info(f"Cache hit: replayed {upload_report.uploaded} files in {time.time() - start_time:.2f} seconds.")
+            return
+        sinks.append(LocalDiskSink(cache.begin(cache_key)))
+    sink = TeeSink(*sinks)
+    figure_store = build_figure_store(s3_sink, sinks[1:])
+    try:
+        convert_and_write(input_doc_path, sink, figure_store, render_pages, write_embedded, stream_window,
+                          memory_limit_mb)
+        # Wait for the queued uploads; raises UploadError listing every failed object
+        with span("s3.flush"):
+            upload_report = s3_sink.flush()
+            figure_store.flush()
+    except BaseException:
+        if cache is not None:
+            cache.discard(cache_key)
+        raise
+    logging.info(f"Uploaded {upload_report.uploaded} files to s3://{bucket_name}")
+    if cache is not None:
+        cache.commit(cache_key)
+
+    end_time = time.time() - start_time
+
+    logging.info(f"Document converted and figures exported in {end_time:.2f} seconds.")
+
+def convert_and_write(input_doc_path, sink, figure_store, render_pages, write_embedded, stream_window,
+                      memory_limit_mb):
+    """Convert the document and queue its markdown, figures and images on sink and figure_store."""
     # Configure pipeline options
     pipeline_options = PdfPipelineOptions()
     pipeline_options.images_scale = IMAGE_RESOLUTION_SCALE
-    pipeline_options.generate_page_images = True
+    pipeline_options.generate_page_images = render_pages
     pipeline_options.generate_picture_images = True
 
     doc_converter = DocumentConverter(
@@ -44,56 +206,34 @@ def main():
         }
     )
 
-    start_time = time.time()
-
-    # Convert the document
-    conv_res = doc_converter.convert(input_doc_path)
-
-    output_dir.mkdir(parents=True, exist_ok=True)
-    doc_filename = conv_res.input.file.stem
-
-    # Save page images
-    for page_no, page in conv_res.document.pages.items():
-        page_image_filename = output_dir / f"{doc_filename}-{page_no}.png"
-        with page_image_filename.open("wb") as fp:
-            page.image.pil_image.save(fp, format="PNG")
-        # Upload to S3
-        upload_file_to_s3(str(page_image_filename), f"pdf_processing_pipeline/pdf_os_pipeline/markdown_outputs/{page_image_filename.name}")
-
-    # Save images of figures and tables
-    table_counter = 0
-    picture_counter = 0
-    for element, _level in conv_res.document.iterate_items():
-        if isinstance(element, TableItem):
-            table_counter += 1
-            element_image_filename = output_dir / f"{doc_filename}-table-{table_counter}.png"
-            with element_image_filename.open("wb") as fp:
-                element.get_image(conv_res.document).save(fp, "PNG")
-            # Upload to S3
-            upload_file_to_s3(str(element_image_filename), f"pdf_processing_pipeline/pdf_os_pipeline/markdown_outputs/{element_image_filename.name}")
-
-        if isinstance(element, PictureItem):
-            picture_counter += 1
-            element_image_filename = output_dir / f"{doc_filename}-picture-{picture_counter}.png"
-            with element_image_filename.open("wb") as fp:
-                element.get_image(conv_res.document).save(fp, "PNG")
-            # Upload to S3
-            upload_file_to_s3(str(element_image_filename), f"pdf_processing_pipeline/pdf_os_pipeline/markdown_outputs/{element_image_filename.name}")
-
-    # Save markdown with embedded pictures
-    md_filename_embedded = output_dir / f"{doc_filename}-with-images.md"
-    conv_res.document.save_as_markdown(md_filename_embedded, image_mode=ImageRefMode.EMBEDDED)
-    upload_file_to_s3(str(md_filename_embedded), f"pdf_processing_pipeline/pdf_os_pipeline/markdown_outputs/{md_filename_embedded.name}")
+    figure_bytes = None if stream_window else {}
+    if stream_window:
+        parts = []
+        table_counter = 0
+        for conv_res in iter_conversion_windows(doc_converter, input_doc_path, stream_window, MemoryCeiling(memory_limit_mb)):
+            doc_filename = conv_res.input.file.stem
+            with span("docling.write"):
+                md_part, table_counter = write_conversion(conv_res, sink, figure_store, render_pages, table_counter)
+            parts.append(md_part)
+            # Drop this window before the generator converts the next one
+            del conv_res
+        md_referenced = "\n\n".join(parts)
+    else:
+        # Convert the document
+        with span("docling.convert"):
+            conv_res = doc_converter.convert(input_doc_path)
+        count("pages", len(conv_res.document.pages))
+        doc_filename = conv_res.input.file.stem
+        with span("docling.write"):
+            md_referenced, _ = write_conversion(conv_res, sink, figure_store, render_pages, figure_bytes=figure_bytes)
 
     # Save markdown with externally referenced pictures
-    md_filename_referenced = output_dir / f"{doc_filename}-with-image-refs.md"
-    conv_res.document.save_as_markdown(md_filename_referenced, image_mode=ImageRefMode.REFERENCED)
-    upload_file_to_s3(str(md_filename_referenced), f"pdf_processing_pipeline/pdf_os_pipeline/markdown_outputs/{md_filename_referenced.name}")
-
-    end_time = time.time() - start_time
-
-    logging.info(f"Document converted and figures exported in {end_time:.2f} seconds.")
+    sink.write(f"{doc_filename}-with-image-refs.md", md_referenced)
 
+    # Markdown with embedded pictures, derived from the referenced one
+    if write_embedded:
+        sink.write(f"{doc_filename}-with-images.md", embed_figures(md_referenced, figure_bytes.__getitem__))
+    logging.info(f"{len(figure_store)} unique figures in this document")
 
 if __name__ == "__main__":
-    main()
+    main(cache=ExtractionCache())
@@ -0,0 +1,249 @@
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from collections import namedtuple
+from shared_images import attached_image, release_image, share_image
+
+# Matches docklingextraction.IMAGE_RESOLUTION_SCALE
+IMAGE_RESOLUTION_SCALE = 2.0
+# How often a wait on the results queue stops to check that the workers are still alive
+LIVENESS_POLL_SECONDS = 1.0
+
+ConversionResult = namedtuple("ConversionResult", ["path", "status", "output", "error", "worker", "queue_seconds", "latency_seconds",
+                                                   "page_images"], defaults=[None])
+
+
+def _cpu_groups(workers):
+    """Split the CPUs this process may use into one contiguous group per worker."""
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    size = max(1, len(cpus) // workers)
+    return [cpus[i * size:(i + 1) * size] or cpus for i in range(workers)]
+
+
+def _build_converter(options, num_threads):
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import PdfPipelineOptions
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+    try:
+        from docling.datamodel.accelerator_options import AcceleratorDevice, AcceleratorOptions
+    except ImportError:  # docling < 2.40
+        from docling.datamodel.pipeline_options import AcceleratorDevice, AcceleratorOptions
+
+    pipeline_options = PdfPipelineOptions()
+    pipeline_options.images_scale = options.get("images_scale", IMAGE_RESOLUTION_SCALE)
+    pipeline_options.generate_page_images = options.get("generate_page_images", False)
+    pipeline_options.generate_picture_images = options.get("generate_picture_images", True)
+    pipeline_options.accelerator_options = AcceleratorOptions(num_threads=num_threads, device=AcceleratorDevice.CPU)
+
+    converter = DocumentConverter(format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)})
+    # Load the layout and table models now instead of on the first document
+    converter.initialize_pipeline(InputFormat.PDF)
+    return converter
+
+
+def _share_page_images(conv_res):
+    """Move the rendered page images into shared memory: {page_no: SharedImage}.
+
+    They are dropped from the document so the exported result that goes back through the
+    results queue no longer carries them as pickled, base64-encoded PNGs.
+    """
+    page_images = {}
+    for page_no, page in conv_res.document.pages.items():
+        if page.image is not None:
+            page_images[page_no] = share_image(page.image.pil_image)
+            page.image = None
+    return page_images
+
+
+def _export(conv_res, output):
+    if output == "markdown":
+        return conv_res.document.export_to_markdown()
+    return conv_res.document.export_to_dict()
+
+
+def _worker_main(worker_id, cpus, options, tasks, results):
+    """Long-lived worker: pin, warm one converter, then convert batches until told to stop."""
+    load_start = time.time()
+    try:
+        from docling.datamodel.base_models import ConversionStatus
+
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+        os.environ["OMP_NUM_THREADS"] = str(len(cpus))
+        converter = _build_converter(options, len(cpus))
+    except BaseException as e:
+        # Tell the pool why instead of leaving it waiting for "ready"
+        results.put(("failed", worker_id, f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", worker_id, time.time() - load_start))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        batch_id, batch = task
+        started = time.time()
+        paths = [path for _, path, _ in batch]
+        previous = started
+        reported = set()
+        try:
+            conversions = converter.convert_all(paths, raises_on_error=False)
+            for (index, path, submitted), conv_res in zip(batch, conversions):
+                finished = time.time()
+                ok = conv_res.status in (ConversionStatus.SUCCESS, ConversionStatus.PARTIAL_SUCCESS)
+                page_images = _share_page_images(conv_res) if ok and options.get("generate_page_images") else None
+                results.put(("result", batch_id, (index, ConversionResult(
+                    path, conv_res.status.value, _export(conv_res, options.get("output")) if ok else None,
+                    None if ok else "; ".join(str(error.error_message) for error in conv_res.errors),
+                    worker_id, started - submitted, finished - previous, page_images))))
+                reported.add(index)
+                previous = finished
+        except Exception as e:
+            # Report the rest of the batch instead of leaving the caller waiting for it
+            for index, path, submitted in batch:
+                if index not in reported:
+                    results.put(("result", batch_id, (index, ConversionResult(
+                        path, "failure", None, f"{type(e).__name__}: {e}", worker_id, started - submitted,
+                        time.time() - started))))
+
+
+class DoclingConverterPool:
+    """N warm, CPU-only Docling converters, each in its own process pinned to its own CPUs.
+
+    Models are loaded once per worker at start-up. convert_batch() splits the documents into
+    batches that workers pull from a shared queue and run through convert_all; every result
+    carries the time it spent queued and its own conversion latency. A worker that fails to
+    start, or exits while documents are outstanding, raises RuntimeError in the caller.
+
+    options: images_scale, generate_page_images (default False), generate_picture_images
+    (default True) and output ("docling" for export_to_dict, or "markdown").
+
+    With generate_page_images, page images come back as shared_images.SharedImage handles
+    in result.page_images rather than inside the output; read them with
+    shared_images.attached_image and free them with release_page_images.
+    """
+
+    def __init__(self, workers=2, options=None, start_timeout=600):
+        self.workers = workers
+        self.options = dict(options or {})
+        # Tags every convert_batch call's tasks, so results left over from an earlier call are told apart
+        self._batch_ids = itertools.count()
+        context = multiprocessing.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(target=_worker_main, args=(worker_id, cpus, self.options, self._tasks, self._results), daemon=True)
+            for worker_id, cpus in enumerate(_cpu_groups(workers))
+        ]
+        for process in self._processes:
+            process.start()
+
+        self.warmup_seconds = {}
+        deadline = time.time() + start_timeout
+        try:
+            while len(self.warmup_seconds) < workers:
+                kind, worker_id, value = self._next_result(deadline, f"start within {start_timeout}s")
+                if kind == "failed":
+                    raise RuntimeError(f"Docling worker {worker_id} failed to start: {value}")
+                self.warmup_seconds[worker_id] = value
+        except BaseException:
+            self.close()
+            raise
+        logging.info(f"{workers} Docling converters warm (model load {max(self.warmup_seconds.values()):.2f}s)")
+
+    def convert_batch(self, paths, batch_size=4, timeout=None):
+        """Convert documents and return ConversionResults in input order.
+
+        Results still arriving from an earlier call that timed out are dropped (and their
+        page images freed) rather than taken for this call's.
+        """
+        now = time.time()
+        batch_id = next(self._batch_ids)
+        items = [(index, str(path), now) for index, path in enumerate(paths)]
+        for start in range(0, len(items), batch_size):
+            self._tasks.put((batch_id, items[start:start + batch_size]))
+
+        deadline = None if timeout is None else now + timeout
+        results = [None] * len(items)
+        missing = set(range(len(items)))
+        while missing:
+            kind, message_batch, payload = self._next_result(
+                deadline, f"finish {len(items)} documents" + (f" within {timeout}s" if timeout is not None else ""))
+            if kind != "result" or message_batch != batch_id or payload[0] not in missing:
+                if kind == "result":
+                    self.release_page_images(payload[1])
+                continue
+            index, result = payload
+            results[index] = result
+            missing.discard(index)
+        return results
+
+    def _next_result(self, deadline, doing):
+        """Next message from the results queue, checking worker liveness while waiting.
+
+        Raises RuntimeError once a worker has exited, since whatever it was working on will
+        never be reported, and TimeoutError at deadline (a time.time() value; None waits
+        indefinitely).
+        """
+        while True:
+            wait = LIVENESS_POLL_SECONDS if deadline is None else min(LIVENESS_POLL_SECONDS, deadline - time.time())
+            try:
+                return self._results.get(timeout=max(0.01, wait))
+            except queue.Empty:
+                pass
+            dead = [(worker_id, process.exitcode) for worker_id, process in enumerate(self._processes)
+                    if not process.is_alive()]
+            if dead:
+                # A worker's last message can arrive just after the wait above gave up
+                try:
+                    return self._results.get(timeout=LIVENESS_POLL_SECONDS)
+                except queue.Empty:
+                    raise RuntimeError(f"Docling pool could not {doing}: worker(s) exited "
+                                       + ", ".join(f"{worker_id} (exit code {code})" for worker_id, code in dead))
+            if deadline is not None and time.time() >= deadline:
+                raise TimeoutError(f"Docling pool did not {doing}")
+
+    @staticmethod
+    def release_page_images(result):
+        for handle in (result.page_images or {}).values():
+            release_image(handle)
+
+    def close(self):
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert PDFs on a pool of warm Docling converters.")
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--page-images", help="write every page image as PNG to this folder")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    options = {"output": "markdown", "generate_page_images": bool(args.page_images)}
+    with DoclingConverterPool(args.workers, options) as pool:
+        for result in pool.convert_batch(args.pdfs, args.batch_size):
+            print(f"{result.path}: {result.status} on worker {result.worker}, "
+                  f"queued {result.queue_seconds:.2f}s, converted in {result.latency_seconds:.2f}s")
+            if args.page_images:
+                os.makedirs(args.page_images, exist_ok=True)
+                stem = os.path.splitext(os.path.basename(result.path))[0]
+                for page_no, handle in (result.page_images or {}).items():
+                    with attached_image(handle, release=True) as image:
+                        image.save(os.path.join(args.page_images, f"{stem}-{page_no}.png"))
@@ -0,0 +1,89 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+# (x0, y0, x1, y1) in the backend's page units, top-left origin
+BBox = Tuple[float, float, float, float]
+
+
+@dataclass
+class TextBlock:
+    text: str
+    bbox: Optional[BBox] = None
+    kind: str = "paragraph"
+
+
+@dataclass
+class Table:
+    rows: List[List[str]]
+    bbox: Optional[BBox] = None
+
+
+@dataclass
+class Figure:
+    bbox: Optional[BBox] = None
+    # Where the image bytes were stored (S3 key, file name, backend figure id), if anywhere
+    ref: Optional[str] = None
+    caption: Optional[str] = None
+
+
+@dataclass
+class Page:
+    number: int
+    width: Optional[float] = None
+    height: Optional[float] = None
+    blocks: List[TextBlock] = field(default_factory=list)
+    tables: List[Table] = field(default_factory=list)
+    figures: List[Figure] = field(default_factory=list)
+
+    @property
+    def text(self):
+        return "\n".join(block.text for block in self.blocks)
+
+
+@dataclass
+class Document:
+    """Backend-independent result of an extraction: pages of text blocks, tables and figures."""
+
+    source: str
+    backend: str
+    pages: List[Page] = field(default_factory=list)
+    metadata: dict = field(default_factory=dict)
+
+    def page(self, number):
+        """Return page `number` (1-based), creating it and any missing pages before it."""
+        while len(self.pages) < number:
+            self.pages.append(Page(len(self.pages) + 1))
+        return self.pages[number - 1]
+
+    @property
+    def text(self):
+        return "\n\n".join(page.text for page in self.pages)
+
+    def to_dict(self):
+        """Compact JSON-ready form: empty lists and unset fields are left out."""
+        def compact(obj):
+            return {key: value for key, value in vars(obj).items() if value not in (None, [], {})}
+
+        pages = []
+        for page in self.pages:
+            page_dict = compact(page)
+            for kind in ("blocks", "tables", "figures"):
+                if kind in page_dict:
+                    page_dict[kind] = [compact(item) for item in page_dict[kind]]
+            pages.append(page_dict)
+        return {**compact(self), "pages": pages}
+
+    @classmethod
+    def from_dict(cls, data):
+        pages = [
+            Page(
+                number=page["number"],
+                width=page.get("width"),
+                height=page.get("height"),
+                blocks=[TextBlock(**block) for block in page.get("blocks", [])],
+                tables=[Table(**table) for table in page.get("tables", [])],
+                figures=[Figure(**figure) for figure in page.get("figures", [])],
+            )
+            for page in data.get("pages", [])
+        ]
+        return cls(data["source"], data["backend"], pages, data.get("metadata", {}))
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from instrumentation import count
+
+CHUNK_SIZE = 1024 * 1024
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 60)
+
+DownloadResult = namedtuple("DownloadResult", ["path", "sha256", "size", "not_modified", "resumed"])
+
+
+class DownloadError(Exception):
+    """Raised when the server answers with an unexpected status."""
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide requests session with a connection pool and retries on transient errors."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=("GET", "HEAD"))
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, encoding="utf-8") as fp:
+            return json.load(fp)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_meta(meta_path, meta):
+    with open(meta_path, "w", encoding="utf-8") as fp:
+        json.dump(meta, fp)
+
+
+def _hash_existing(path, digest):
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+
+def download(url, output_path, session=None, timeout=DEFAULT_TIMEOUT, chunk_size=CHUNK_SIZE):
+    """Stream url to output_path with flat memory use and return a DownloadResult.
+
+    The body is written in chunks to output_path + ".part" and hashed on the fly. Validators
+    (ETag / Last-Modified) are kept in output_path + ".meta.json":
+    - if output_path is complete, the request is conditional and a 304 keeps the local copy;
+    - if a .part file is left from an interrupted run, the request asks for the missing
+      byte range (If-Range guards against the file having changed in between).
+    """
+    session = session or get_session()
+    part_path = output_path + ".part"
+    meta_path = output_path + ".meta.json"
+    meta = _read_meta(meta_path)
+    if meta.get("url") != url:
+        meta = {}
+
+    headers = {}
+    validator = meta.get("etag") or meta.get("last_modified")
+    offset = 0
+    if meta.get("complete") and os.path.exists(output_path):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    elif os.path.exists(part_path) and validator:
+        offset = os.path.getsize(part_path)
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return DownloadResult(output_path, meta["sha256"], meta["size"], True, False)
+
+        digest = hashlib.sha256()
+        if response.status_code == 206 and offset and response.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+            _hash_existing(part_path, digest)
+            mode, resumed = "ab", True
+        elif response.status_code == 200:
+            mode, resumed, offset = "wb", False, 0
+        else:
+            raise DownloadError(f"Failed to download PDF. Status code: {response.status_code}")
+
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "complete": False,
+        }
+        _write_meta(meta_path, meta)
+
+        size = offset
+        with open(part_path, mode) as fp:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                fp.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        count("bytes_read", size - offset, source="http")
+
+    os.replace(part_path, output_path)
+    meta.update(complete=True, sha256=digest.hexdigest(), size=size)
+    _write_meta(meta_path, meta)
+    return DownloadResult(output_path, meta["sha256"], size, False, resumed)
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from dotenv import load_dotenv
+from instrumentation import count, span
+from s3_uploader import get_uploader
+from sinks import LocalDiskSink
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_CACHE_DIR = os.getenv('EXTRACTION_CACHE_DIR', '.extraction_cache')
+DEFAULT_MAX_BYTES = int(os.getenv('EXTRACTION_CACHE_MAX_MB', '2048')) * 1024 * 1024
+DEFAULT_S3_PREFIX = os.getenv('EXTRACTION_CACHE_S3_PREFIX')
+
+MANIFEST_NAME = "manifest.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _relative_files(folder):
+    """Paths of every file below folder, relative to it, with / separators."""
+    return sorted(os.path.relpath(os.path.join(root, name), folder).replace(os.sep, "/")
+                  for root, _, names in os.walk(folder) for name in names)
+
+
+def file_sha256(file_path):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Artifacts of previous extractions keyed by document hash, extractor and options.
+
+    Entries live in cache_dir/<key[:2]>/<key>/ as the artifact files plus a manifest that keeps their
+    write order. The manifest mtime is the last-used time; once the local tier grows past
+    max_bytes the least recently used entries are removed. With s3_prefix set, entries are
+    also stored under s3://AWS_BUCKET_NAME/<s3_prefix>/<key>/ and a local miss falls back
+    to S3 before the extractor has to run.
+
+    Misses are filled through begin(key), which returns a staging folder: the extractor
+    writes its artifacts there (from any process, it is a plain folder) and commit(key)
+    publishes them atomically.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, s3_prefix=DEFAULT_S3_PREFIX,
+                 uploader=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.s3_prefix = s3_prefix
+        self.uploader = uploader
+        os.makedirs(os.path.join(cache_dir, "staging"), exist_ok=True)
+
+    @staticmethod
+    def make_key(document_sha256, extractor, options=None):
+        """Cache key for one document, extractor name and option set."""
+        payload = json.dumps({"document": document_sha256, "extractor": extractor, "options": options or {}},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _staging_dir(self, key):
+        return os.path.join(self.cache_dir, "staging", key)
+
+    # -------- Lookup --------
+
+    def get(self, key):
+        """Return {artifact name: bytes} in write order, or None on a miss."""
+        with span("cache.get"):
+            artifacts = self._get_local(key)
+            result = "hit"
+            if artifacts is None and self.s3_prefix:
+                artifacts = self._get_s3(key)
+                result = "s3_hit"
+                if artifacts is not None:
+                    self._store_local(key, artifacts)
+        count("cache", cache="extraction", result=result if artifacts is not None else "miss")
+        if artifacts is not None:
+            count("bytes_read", sum(len(data) for data in artifacts.values()), source="cache")
+        return artifacts
+
+    def _get_local(self, key):
+        entry_dir = self._entry_dir(key)
+        manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+        try:
+            with open(manifest_path, encoding="utf-8") as fp:
+                names = json.load(fp)["artifacts"]
+            artifacts = {}
+            for name in names:
+                with open(os.path.join(entry_dir, name), "rb") as fp:
+                    artifacts[name] = fp.read()
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+        # Mark as recently used for LRU eviction
+        os.utime(manifest_path)
+        return artifacts
+
+    def _get_s3(self, key):
+        uploader = self.uploader or get_uploader()
+        client, prefix = uploader.client, f"{self.s3_prefix}/{key}"
+        try:
+            manifest = json.loads(client.get_object(Bucket=uploader.bucket, Key=f"{prefix}/{MANIFEST_NAME}")['Body'].read())
+        except client.exceptions.NoSuchKey:
+            return None
+        return {name: client.get_object(Bucket=uploader.bucket, Key=f"{prefix}/{name}")['Body'].read()
+                for name in manifest["artifacts"]}
+
+    # -------- Store --------
+
+    def staging_sink(self, key):
+        """Sink collecting the artifacts of a miss until commit(key)."""
+        return LocalDiskSink(self._staging_dir(key))
+
+    def begin(self, key):
+        """Start filling a miss: clear leftovers of an interrupted run and return the staging folder."""
+        self.discard(key)
+        return self.staging_sink(key).folder
+
+    def commit(self, key, names=None):
+        """Publish the staged artifacts of key; names gives their order (defaults to sorted)."""
+        staging_dir = self._staging_dir(key)
+        if names is None:
+            names = _relative_files(staging_dir)
+        with open(os.path.join(staging_dir, MANIFEST_NAME), "w", encoding="utf-8") as fp:
+            json.dump({"artifacts": list(names), "created": time.time()}, fp)
+        self._publish(key, staging_dir)
+        if self.s3_prefix:
+            self._put_s3(key, names)
+
+    def discard(self, key):
+        """Drop staged artifacts after a failed extraction."""
+        shutil.rmtree(self._staging_dir(key), ignore_errors=True)
+
+    def put(self, key, artifacts):
+        """Store {artifact name: bytes} under key."""
+        self._store_local(key, artifacts)
+        if self.s3_prefix:
+            self._put_s3(key, list(artifacts))
+
+    def _store_local(self, key, artifacts):
+        sink = self.staging_sink(key)
+        for name, data in artifacts.items():
+            sink.write(name, data)
+        with open(os.path.join(sink.folder, MANIFEST_NAME), "w", encoding="utf-8") as fp:
+            json.dump({"artifacts": list(artifacts), "created": time.time()}, fp)
+        self._publish(key, sink.folder)
+
+    def _publish(self, key, staging_dir):
+        entry_dir = self._entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        # Rename into place so readers never see a half written entry
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        try:
+            os.rename(staging_dir, entry_dir)
+        except OSError:
+            # Another process published the same key first
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        self.evict()
+
+    def _put_s3(self, key, names):
+        uploader = self.uploader or get_uploader()
+        entry_dir, prefix = self._entry_dir(key), f"{self.s3_prefix}/{key}"
+        for name in names:
+            uploader.upload_file(os.path.join(entry_dir, name), f"{prefix}/{name}")
+        uploader.flush().raise_for_failures()
+        # Manifest last, so a partially uploaded entry is never visible
+        uploader.upload_file(os.path.join(entry_dir, MANIFEST_NAME), f"{prefix}/{MANIFEST_NAME}")
+        uploader.flush().raise_for_failures()
+
+    # -------- Eviction --------
+
+    def _entries(self):
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if shard == "staging" or not os.path.isdir(shard_dir):
+                continue
+            for key in os.listdir(shard_dir):
+                entry_dir = os.path.join(shard_dir, key)
+                try:
+                    last_used = os.path.getmtime(os.path.join(entry_dir, MANIFEST_NAME))
+                    size = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in _relative_files(entry_dir))
+                except FileNotFoundError:
+                    continue
+                yield last_used, size, entry_dir
+
+    def evict(self):
+        """Remove least recently used entries until the local tier fits in max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+        return total
+
@@ -0,0 +1,457 @@
+import json
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+from instrumentation import count, drain, merge, span
+from list_extraction import page_list_trees, list_text
+from ocr import format_ocr_report, needs_ocr, ocr_dpi, text_layer
+from pdf_input import open_pdf
+from sinks import ContentStore
+
+# Folder (relative to the sink) holding content-addressed images
+IMAGES_FOLDER = "images"
+# In streaming mode the MuPDF resource store is emptied this often (pages)
+STORE_SHRINK_PAGES = 32
+# Fewest pages worth a pool worker: starting one costs about as much as 25 typical pages
+PARALLEL_MIN_PAGES_PER_WORKER = 64
+
+
+class PageContext:
+    """Per-page view shared by every handler so each page value is computed at most once."""
+
+    def __init__(self, document, page_index):
+        self.document = document
+        self.page_index = page_index
+        self.page_number = page_index + 1
+        self.page = document[page_index]
+        self._textpage = None
+        self._text = None
+        self._text_dict = None
+        self._list_trees = None
+        self._list_lines = None
+        self._images = None
+        self._text_layer = None
+
+    def release(self):
+        """Drop the page and everything computed from it."""
+        self.page = self._textpage = self._text = self._text_dict = self._list_trees = self._list_lines = self._images = None
+
+    @property
+    def textpage(self):
+        """One text extraction of the page, shared by text and text_dict."""
+        if self._textpage is None:
+            self._textpage = self.page.get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+        return self._textpage
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.page.get_text(textpage=self.textpage)
+        return self._text
+
+    @property
+    def text_layer(self):
+        """"text", "unreadable", "image-only" or "empty" (see ocr.text_layer)."""
+        if self._text_layer is None:
+            self._text_layer = text_layer(self.page, self.text)
+        return self._text_layer
+
+    @property
+    def text_dict(self):
+        """page.get_text("dict") without image blocks."""
+        if self._text_dict is None:
+            self._text_dict = self.page.get_text("dict", textpage=self.textpage)
+        return self._text_dict
+
+    @property
+    def list_trees(self):
+        """Nested bulleted and numbered lists of the page (see list_extraction.build_list_trees)."""
+        if self._list_trees is None:
+            self._list_trees = page_list_trees(self.page, self.text_dict)
+        return self._list_trees
+
+    @property
+    def list_lines(self):
+        if self._list_lines is None:
+            self._list_lines = list_text(self.list_trees)
+        return self._list_lines
+
+    @property
+    def images(self):
+        """Image entries of the page as returned by page.get_images(full=True); entry[0] is the xref."""
+        if self._images is None:
+            self._images = self.page.get_images(full=True)
+        return self._images
+
+
+class PageHandler:
+    """Base class for handlers plugged into run_single_pass.
+
+    Handlers append (page_number, object_name) to self.artifacts for everything they produce,
+    under the page it belongs to even when it is written later (an OCR result, in finish()).
+    """
+
+    name = "handler"
+
+    def __init__(self):
+        self.artifacts = []
+
+    def start(self, document):
+        """Called once after the document is opened."""
+
+    def handle_page(self, ctx):
+        raise NotImplementedError
+
+    def finish(self):
+        """Called once after the last page was visited."""
+
+    def pending_pages(self):
+        """Page numbers whose artifacts are still to come; iter_pages holds them back."""
+        return ()
+
+
+class TextHandler(PageHandler):
+    """Writes page_{n}_text.txt for every page.
+
+    Pages without a usable text layer (ctx.text_layer) go to ocr, a runner from
+    ocr.get_ocr(), when one is given: their text file then holds the OCR text, and
+    page_{n}_ocr.json its DPI, timings and character confidence. OCR results are written as
+    they come back and at the latest in finish(). ocr_pages gets one report entry per page
+    without a text layer, OCRed or not.
+    """
+
+    name = "text"
+
+    def __init__(self, sink, ocr=None):
+        super().__init__()
+        self.sink = sink
+        self.ocr = ocr
+        self.ocr_pages = []
+        self._pending = []
+
+    def _write_text(self, page_number, text):
+        self.artifacts.append((page_number, self.sink.write(f"page_{page_number}_text.txt", text)))
+
+    def _collect(self, wait=False):
+        """Write the OCR results that are ready (all of them with wait)."""
+        pending = []
+        for page_number, layer, text, future in self._pending:
+            if not wait and not future.done():
+                pending.append((page_number, layer, text, future))
+                continue
+            try:
+                text, entry = future.result()
+            except Exception as e:
+                # Keep whatever the text layer had rather than lose the page
+                entry = {"page": page_number, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+            entry["layer"] = layer
+            self._write_text(page_number, text)
+            location = self.sink.write(f"page_{page_number}_ocr.json", json.dumps(entry))
+            self.artifacts.append((page_number, location))
+            self.ocr_pages.append(entry)
+        self._pending = pending
+
+    def handle_page(self, ctx):
+        if needs_ocr(ctx.text_layer):
+            if self.ocr is None:
+                self.ocr_pages.append({"page": ctx.page_number, "status": "skipped", "layer": ctx.text_layer})
+            else:
+                future = self.ocr.submit(ctx.page, ocr_dpi(ctx.page))
+                self._pending.append((ctx.page_number, ctx.text_layer, ctx.text, future))
+                self._collect()
+                return
+        self._write_text(ctx.page_number, ctx.text)
+        if self._pending:
+            self._collect()
+
+    def finish(self):
+        self._collect(wait=True)
+
+    def pending_pages(self):
+        return {page_number for page_number, _, _, _ in self._pending}
+
+
+class ImageHandler(PageHandler):
+    """Stores every distinct image once and writes a page_{n}_images.json manifest per page.
+
+    Each xref is decoded at most once per document; its bytes go through a ContentStore,
+    so an image repeated across pages or documents is written once as images/<sha256>.<ext>.
+    The manifest maps the page's image slots to those shared names, which are relative to
+    the manifest's folder unless images_prefix (where a store shared by several documents
+    writes) is given; the manifest then records it.
+    """
+
+    name = "images"
+
+    def __init__(self, sink, store=None, images_prefix=None):
+        super().__init__()
+        self.sink = sink
+        self.store = store or ContentStore(sink, IMAGES_FOLDER)
+        self.images_prefix = images_prefix
+        self._xrefs = {}
+
+    def start(self, document):
+        self._xrefs = {}
+
+    def _image_entry(self, ctx, xref):
+        """Manifest entry for xref, decoding and storing the image on first sight."""
+        if xref not in self._xrefs:
+            base_image = ctx.document.extract_image(xref)
+            if base_image is None or "image" not in base_image:
+                self._xrefs[xref] = None
+            else:
+                name, location = self.store.put(base_image["image"], base_image["ext"])
+                if location is not None:
+                    self.artifacts.append((ctx.page_number, location))
+                self._xrefs[xref] = {"xref": xref, "name": name, "ext": base_image["ext"],
+                                     "width": base_image.get("width"), "height": base_image.get("height")}
+        return self._xrefs[xref]
+
+    def handle_page(self, ctx):
+        slots = []
+        for img_index, img in enumerate(ctx.images):
+            entry = self._image_entry(ctx, img[0])
+            if entry is not None:
+                slots.append({"slot": img_index + 1, **entry})
+        if slots:
+            manifest = {"page": ctx.page_number, "images": slots}
+            if self.images_prefix:
+                manifest["images_prefix"] = self.images_prefix
+            manifest = json.dumps(manifest)
+            location = self.sink.write(f"page_{ctx.page_number}_images.json", manifest)
+            self.artifacts.append((ctx.page_number, location))
+
+
+class ListHandler(PageHandler):
+    """Writes page_{n}_lists.txt and page_{n}_list_tree.json for pages that contain lists.
+
+    The text file has one indented "<marker> <text>" line per item; the JSON keeps the
+    nesting, list type and numbering style and each item's bounding box.
+    """
+
+    name = "lists"
+
+    def __init__(self, sink):
+        super().__init__()
+        self.sink = sink
+
+    def handle_page(self, ctx):
+        if not ctx.list_lines:
+            return
+        location = self.sink.write(f"page_{ctx.page_number}_lists.txt", "\n".join(ctx.list_lines))
+        self.artifacts.append((ctx.page_number, location))
+        tree = json.dumps({"page": ctx.page_number, "lists": ctx.list_trees}, ensure_ascii=False)
+        location = self.sink.write(f"page_{ctx.page_number}_list_tree.json", tree)
+        self.artifacts.append((ctx.page_number, location))
+
+
+class FlushSinkHandler(PageHandler):
+    """Flushes a sink once the pass is over so write failures surface in the pass itself.
+
+    stores are ContentStores writing outside that sink; they are flushed after it.
+    """
+
+    name = "flush"
+
+    def __init__(self, sink, stores=()):
+        super().__init__()
+        self.sink = sink
+        self.stores = stores
+
+    def handle_page(self, ctx):
+        pass
+
+    def finish(self):
+        self.sink.flush()
+        for store in self.stores:
+            store.flush()
+
+
+PageResult = namedtuple("PageResult", ["page_number", "artifacts"])
+
+
+def shrink_mupdf_store():
+    """Empty MuPDF's cache of decoded fonts and images."""
+    fitz.TOOLS.store_shrink(100)
+
+
+def iter_pages(file_path, handlers, page_range=None, pages=None, timings=None, ceiling=None):
+    """Generator form of the single pass: yields a PageResult per page, in visiting order.
+
+    A page is yielded as soon as every handler saw it and none still has work in flight for
+    it (pending_pages, e.g. OCR), together with every artifact recorded under its number.
+    A page waiting for OCR holds back the pages after it; what finish() writes is yielded
+    with the remaining pages before the generator returns, and artifacts for a page that
+    was already yielded come in one more PageResult for that page.
+
+    The document is read through a memory map of the file (pdf_input.open_pdf). The page
+    object, its text and image lists are released before the next page is loaded, so
+    memory does not grow with the page count. With a memory_guard.MemoryCeiling the MuPDF store is shrunk
+    and the mapped file pages are dropped from RSS every STORE_SHRINK_PAGES pages, and the
+    ceiling is checked after every page.
+    Handlers' finish() runs after the last page was visited. timings, if given, is a dict
+    that accumulates seconds per handler name.
+    """
+    timings = timings if timings is not None else {}
+    if ceiling is not None and shrink_mupdf_store not in ceiling.reclaim:
+        ceiling.reclaim.append(shrink_mupdf_store)
+
+    def timed(handler, method, *args):
+        t0 = time.perf_counter()
+        with span(f"handler.{handler.name}"):
+            method(*args)
+        timings[handler.name] = timings.get(handler.name, 0.0) + time.perf_counter() - t0
+
+    with span("open"):
+        pdf_input = open_pdf(file_path)
+    with pdf_input as pdf_document:
+        count("bytes_read", os.path.getsize(file_path), source="pdf")
+        if pages is None:
+            start, stop = page_range if page_range else (0, len(pdf_document))
+            pages = range(start, stop)
+        for handler in handlers:
+            timed(handler, handler.start, pdf_document)
+
+        # Visited pages not yielded yet, and the artifacts recorded per page number so far
+        waiting = deque()
+        held = {}
+
+        def ready(done=False):
+            for handler in handlers:
+                for page_number, location in handler.artifacts:
+                    held.setdefault(page_number, []).append(location)
+                handler.artifacts.clear()
+            pending = set() if done else {page_number for handler in handlers for page_number in handler.pending_pages()}
+            while waiting and waiting[0] not in pending:
+                page_number = waiting.popleft()
+                yield PageResult(page_number, held.pop(page_number, []))
+
+        for visited, page_index in enumerate(pages, start=1):
+            with span("page", page=page_index + 1):
+                ctx = PageContext(pdf_document, page_index)
+                for handler in handlers:
+                    timed(handler, handler.handle_page, ctx)
+                ctx.release()
+            count("pages")
+            waiting.append(page_index + 1)
+            yield from ready()
+
+            if ceiling is not None:
+                if visited % STORE_SHRINK_PAGES == 0:
+                    shrink_mupdf_store()
+                    pdf_input.release_pages()
+                ceiling.check(f"page {page_index + 1} of {file_path}")
+
+        for handler in handlers:
+            timed(handler, handler.finish)
+        yield from ready(done=True)
+        for page_number in sorted(held):
+            yield PageResult(page_number, held.pop(page_number))
+
+
+def run_single_pass(file_path, handlers, page_range=None, pages=None):
+    """Open the PDF once, visit each page once and dispatch it to every handler.
+
+    Returns a report with the number of pages visited, the seconds spent in each handler
+    (start, handle_page and finish combined) and the artifacts produced, ordered by page.
+    Values computed lazily on the page context are charged to the first handler that asks
+    for them. page_range is a (start, stop) pair of 0-based page indexes; pages, if given,
+    is an explicit list of 0-based indexes and takes precedence. Pages without a text layer
+    add an "ocr" list with one entry per page (see TextHandler).
+    """
+    timings = {handler.name: 0.0 for handler in handlers}
+    pass_start = time.perf_counter()
+    visited = set()
+    artifacts = []
+    for result in iter_pages(file_path, handlers, page_range, pages, timings):
+        visited.add(result.page_number)
+        artifacts.extend(result.artifacts)
+
+    report = {
+        "pages": len(visited),
+        "handlers": timings,
+        "total": time.perf_counter() - pass_start,
+        "artifacts": artifacts,
+    }
+    ocr_pages = [entry for handler in handlers for entry in getattr(handler, "ocr_pages", ())]
+    if ocr_pages:
+        report["ocr"] = sorted(ocr_pages, key=lambda entry: entry["page"])
+    return report
+
+
+def split_page_range(page_count, workers, chunk_size=None):
+    """Split [0, page_count) into contiguous (start, stop) chunks for the process pool."""
+    if chunk_size is None:
+        # A few chunks per worker so a slow chunk does not leave the other workers idle
+        chunk_size = max(1, -(-page_count // (workers * 4)))
+    return [(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+
+
+def _run_chunk(file_path, handler_factory, page_range):
+    """Process pool entry point: every worker opens its own fitz handle over a map of the file."""
+    report = run_single_pass(file_path, handler_factory(), page_range)
+    # A worker's chunks are disjoint page ranges, so their decoded images are rarely reused
+    shrink_mupdf_store()
+    report["telemetry"] = drain()
+    return report
+
+
+def run_parallel(file_path, handler_factory, workers, chunk_size=None,
+                 min_pages_per_worker=PARALLEL_MIN_PAGES_PER_WORKER):
+    """Run the single pass over page chunks in a process pool.
+
+    handler_factory must be picklable (a module level function or functools.partial of one)
+    and return fresh handlers; it is called once per chunk inside the worker. The merged
+    report has the same shape as run_single_pass and lists artifacts in page order no
+    matter which worker finished first.
+
+    Workers are capped at one per min_pages_per_worker pages; a document too short for two
+    runs through run_single_pass in this process, with no pool at all.
+    """
+    pass_start = time.perf_counter()
+    with open_pdf(file_path) as pdf_document:
+        page_count = len(pdf_document)
+    workers = max(1, min(workers, page_count // max(1, min_pages_per_worker)))
+    if workers == 1:
+        report = run_single_pass(file_path, handler_factory())
+        report.update(total=time.perf_counter() - pass_start, workers=1, chunks=1)
+        return report
+    chunks = split_page_range(page_count, workers, chunk_size)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map yields results in submission order, i.e. by page range
+        reports = list(executor.map(_run_chunk, [file_path] * len(chunks), [handler_factory] * len(chunks), chunks))
+
+    timings = {}
+    artifacts = []
+    ocr_pages = []
+    for report in reports:
+        merge(report.pop("telemetry", None))
+        for name, seconds in report["handlers"].items():
+            timings[name] = timings.get(name, 0.0) + seconds
+        artifacts.extend(report["artifacts"])
+        ocr_pages.extend(report.get("ocr", ()))
+    merged = {
+        "pages": page_count,
+        "handlers": timings,
+        "total": time.perf_counter() - pass_start,
+        "artifacts": artifacts,
+        "workers": workers,
+        "chunks": len(chunks),
+    }
+    if ocr_pages:
+        merged["ocr"] = ocr_pages
+    return merged
+
+
+def format_report(report):
+    """Render a run_single_pass report as a short human readable summary."""
+    lines = [f"Single pass over {report['pages']} pages in {report['total']:.2f}s"]
+    if report.get("workers"):
+        lines[0] += f" ({report['workers']} workers, {report['chunks']} chunks)"
+    for name, seconds in report["handlers"].items():
+        lines.append(f"  {name:<10} {seconds:.2f}s")
+    lines.extend(format_ocr_report(report.get("ocr", ())))
+    return "\n".join(lines)
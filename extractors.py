@@ -0,0 +1,374 @@
+import argparse
+import importlib.util
+import json
+import os
+import re
+import time
+from typing import Protocol
+from dotenv import load_dotenv
+from document_model import Document, Figure, Table, TextBlock
+from instrumentation import span
+from table_builder import TableBatch
+
+# Load environment variables
+load_dotenv()
+
+
+class Extractor(Protocol):
+    """What every backend provides.
+
+    cost is a relative price per page (compute and API fees) used to route documents;
+    capabilities lists what the backend can return ("text", "tables", "figures", "ocr");
+    max_pages / max_file_mb are hard service limits, None when unlimited.
+    """
+
+    name: str
+    cost: int
+    capabilities: frozenset
+    max_pages: int
+    max_file_mb: float
+
+    def available(self) -> bool: ...
+
+    def extract(self, file_path) -> Document: ...
+
+
+_registry = {}
+
+
+def register_extractor(cls):
+    """Class decorator adding a backend to the registry under cls.name."""
+    _registry[cls.name] = cls
+    return cls
+
+
+def get_extractor(name, **options):
+    try:
+        return _registry[name](**options)
+    except KeyError:
+        raise ValueError(f"Unknown extractor '{name}'. Available: {', '.join(sorted(_registry))}")
+
+
+def registered_extractors():
+    return sorted(_registry)
+
+
+def choose_extractor(file_path, needs=("text",), max_cost=None):
+    """Cheapest available backend that covers `needs` and accepts the document's size."""
+    from pdf_input import open_pdf
+
+    with open_pdf(file_path) as pdf_document:
+        page_count = len(pdf_document)
+    size_mb = os.path.getsize(file_path) / (1024 * 1024)
+
+    for cls in sorted(_registry.values(), key=lambda cls: cls.cost):
+        extractor = cls()
+        if not set(needs) <= extractor.capabilities or (max_cost is not None and extractor.cost > max_cost):
+            continue
+        if extractor.max_pages is not None and page_count > extractor.max_pages:
+            continue
+        if extractor.max_file_mb is not None and size_mb > extractor.max_file_mb:
+            continue
+        if extractor.available():
+            return extractor
+    raise LookupError(f"No available extractor covers {sorted(needs)} for {file_path}")
+
+
+def run_side_by_side(file_path, names):
+    """Run several backends on one document; returns {name: (Document, seconds)}."""
+    results = {}
+    for name in names:
+        extractor = get_extractor(name)
+        start = time.perf_counter()
+        document = extractor.extract(file_path)
+        results[name] = (document, time.perf_counter() - start)
+    return results
+
+
+def _has_modules(*modules):
+    return all(importlib.util.find_spec(module) is not None for module in modules)
+
+
+# -------- PyMuPDF + camelot --------
+
+@register_extractor
+class PyMuPDFExtractor:
+    name = "pymupdf"
+    cost = 1
+    capabilities = frozenset({"text", "tables", "figures"})
+    max_pages = None
+    max_file_mb = None
+
+    def __init__(self, tables=True, camelot_flavor="stream", min_table_accuracy=80):
+        self.tables = tables
+        self.camelot_flavor = camelot_flavor
+        self.min_table_accuracy = min_table_accuracy
+
+    def available(self):
+        return _has_modules("fitz", "camelot")
+
+    def extract(self, file_path):
+        from pdf_input import open_pdf
+
+        document = Document(file_path, self.name)
+        with open_pdf(file_path) as pdf_document:
+            document.metadata = {key: value for key, value in (pdf_document.metadata or {}).items() if value}
+            for pdf_page in pdf_document:
+                page = document.page(pdf_page.number + 1)
+                page.width, page.height = pdf_page.rect.width, pdf_page.rect.height
+                for x0, y0, x1, y1, text, _, block_type in pdf_page.get_text("blocks"):
+                    if block_type == 0 and text.strip():
+                        page.blocks.append(TextBlock(text.strip(), (x0, y0, x1, y1)))
+                for img in pdf_page.get_images(full=True):
+                    for rect in pdf_page.get_image_rects(img[0]):
+                        page.figures.append(Figure(tuple(rect), ref=f"xref:{img[0]}"))
+
+        if self.tables:
+            import camelot
+            from table_prescreen import prescreen
+
+            candidates = prescreen(file_path).candidates
+            if candidates:
+                for table in camelot.read_pdf(file_path, pages=",".join(map(str, candidates)), flavor=self.camelot_flavor):
+                    if table.parsing_report['accuracy'] >= self.min_table_accuracy:
+                        document.page(int(table.page)).tables.append(Table(table.df.values.tolist()))
+        return document
+
+
+# -------- Docling --------
+
+@register_extractor
+class DoclingExtractor:
+    name = "docling"
+    cost = 5
+    capabilities = frozenset({"text", "tables", "figures", "ocr"})
+    max_pages = None
+    max_file_mb = None
+
+    def __init__(self, converter=None):
+        self.converter = converter
+
+    def available(self):
+        return _has_modules("docling")
+
+    def extract(self, file_path):
+        from docling.document_converter import DocumentConverter
+
+        converter = self.converter or DocumentConverter()
+        docling_document = converter.convert(file_path).document
+        return docling_to_document(docling_document, file_path, self.name)
+
+
+def docling_to_document(docling_document, source, backend="docling"):
+    """Map a DoclingDocument onto the uniform model (bboxes converted to top-left origin)."""
+    from docling_core.types.doc import PictureItem, TableItem, TextItem
+
+    document = Document(source, backend)
+    for page_no, docling_page in sorted(docling_document.pages.items()):
+        page = document.page(page_no)
+        page.width, page.height = docling_page.size.width, docling_page.size.height
+
+    for element, _level in docling_document.iterate_items():
+        if not element.prov:
+            continue
+        prov = element.prov[0]
+        page = document.page(prov.page_no)
+        bbox = prov.bbox.to_top_left_origin(page.height).as_tuple() if page.height else None
+        if isinstance(element, TableItem):
+            page.tables.append(Table(element.export_to_dataframe().astype(str).values.tolist(), bbox))
+        elif isinstance(element, PictureItem):
+            caption = element.caption_text(docling_document) or None
+            page.figures.append(Figure(bbox, ref=element.self_ref, caption=caption))
+        elif isinstance(element, TextItem) and element.text.strip():
+            page.blocks.append(TextBlock(element.text, bbox, str(element.label.value)))
+    return document
+
+
+# -------- Azure Document Intelligence --------
+
+def _polygon_bbox(polygon):
+    if not polygon:
+        return None
+    xs, ys = polygon[0::2], polygon[1::2]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+@register_extractor
+class AzureLayoutExtractor:
+    name = "azure"
+    cost = 20
+    capabilities = frozenset({"text", "tables", "figures", "ocr"})
+    # Limits enforced by the Azure Document Intelligence script
+    max_pages = 5
+    max_file_mb = 5
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def available(self):
+        return _has_modules("azure.ai.documentintelligence") and bool(
+            os.getenv("AZURE_FORM_RECOGNIZER_ENDPOINT") and os.getenv("AZURE_FORM_RECOGNIZER_KEY"))
+
+    def _client(self):
+        if self.client is None:
+            from azure.ai.documentintelligence import DocumentIntelligenceClient
+            from azure.core.credentials import AzureKeyCredential
+
+            self.client = DocumentIntelligenceClient(endpoint=os.getenv("AZURE_FORM_RECOGNIZER_ENDPOINT"),
+                                                     credential=AzureKeyCredential(os.getenv("AZURE_FORM_RECOGNIZER_KEY")))
+        return self.client
+
+    def extract(self, file_path):
+        with span("azure.analyze", source=os.path.basename(file_path)):
+            with open(file_path, "rb") as f:
+                poller = self._client().begin_analyze_document("prebuilt-layout", body=f)
+            result = poller.result()
+        return azure_result_to_document(result, file_path, self.name)
+
+
+def azure_result_to_document(result, source, backend="azure"):
+    """Map an Azure AnalyzeResult (prebuilt-layout) onto the uniform model."""
+    document = Document(source, backend)
+    for azure_page in result.pages:
+        page = document.page(azure_page.page_number)
+        page.width, page.height = azure_page.width, azure_page.height
+
+    for paragraph in result.paragraphs or []:
+        region = paragraph.bounding_regions[0] if paragraph.bounding_regions else None
+        if region is None:
+            continue
+        document.page(region.page_number).blocks.append(
+            TextBlock(paragraph.content, _polygon_bbox(region.polygon), paragraph.role or "paragraph"))
+
+    table_batch = TableBatch.from_azure(result.tables)
+    for table_idx, table in enumerate(result.tables or []):
+        region = table.bounding_regions[0] if table.bounding_regions else None
+        document.page(int(table_batch.pages[table_idx])).tables.append(
+            Table(table_batch.rows(table_idx), _polygon_bbox(region.polygon) if region else None))
+
+    for figure in result.figures or []:
+        region = figure.bounding_regions[0] if figure.bounding_regions else None
+        if region is None:
+            continue
+        caption = figure.caption.content if figure.caption else None
+        document.page(region.page_number).figures.append(Figure(_polygon_bbox(region.polygon), ref=figure.id, caption=caption))
+    return document
+
+
+# -------- Adobe PDF Services --------
+
+# //Document/Table[2]/TR[3]/TD[1]/P  ->  table 2, row 3, column 1 (indexes default to 1)
+ADOBE_TABLE_CELL = re.compile(r"/Table(?:\[(\d+)\])?/TR(?:\[(\d+)\])?/T[DH](?:\[(\d+)\])?")
+
+
+@register_extractor
+class AdobeExtractor:
+    name = "adobe"
+    cost = 20
+    capabilities = frozenset({"text", "tables", "figures", "ocr"})
+    max_pages = None
+    max_file_mb = None
+
+    def available(self):
+        return _has_modules("adobe.pdfservices") and bool(
+            os.getenv('PDF_SERVICES_CLIENT_ID') and os.getenv('PDF_SERVICES_CLIENT_SECRET'))
+
+    def extract(self, file_path):
+        return adobe_structured_data_to_document(self.fetch_structured_data(file_path), file_path, self.name)
+
+    def fetch_structured_data(self, file_path):
+        """Run the Extract job and return its structuredData.json as a dict."""
+        import io
+        import zipfile
+        from adobe.pdfservices.operation.auth.service_principal_credentials import ServicePrincipalCredentials
+        from adobe.pdfservices.operation.pdf_services import PDFServices
+        from adobe.pdfservices.operation.pdf_services_media_type import PDFServicesMediaType
+        from adobe.pdfservices.operation.pdfjobs.jobs.extract_pdf_job import ExtractPDFJob
+        from adobe.pdfservices.operation.pdfjobs.params.extract_pdf.extract_element_type import ExtractElementType
+        from adobe.pdfservices.operation.pdfjobs.params.extract_pdf.extract_pdf_params import ExtractPDFParams
+
+        credentials = ServicePrincipalCredentials(
+            client_id=os.getenv('PDF_SERVICES_CLIENT_ID'),
+            client_secret=os.getenv('PDF_SERVICES_CLIENT_SECRET')
+        )
+        pdf_services = PDFServices(credentials=credentials)
+        with open(file_path, 'rb') as file:
+            # Streamed from the open file rather than read into memory first
+            input_asset = pdf_services.upload(input_stream=file, mime_type=PDFServicesMediaType.PDF)
+        params = ExtractPDFParams(elements_to_extract=[ExtractElementType.TEXT, ExtractElementType.TABLES])
+        location = pdf_services.submit(ExtractPDFJob(input_asset=input_asset, extract_pdf_params=params))
+        result_asset = pdf_services.get_job_result(location).get_result().get_resource()
+        stream_asset = pdf_services.get_content(result_asset)
+        with zipfile.ZipFile(io.BytesIO(stream_asset.get_input_stream())) as archive:
+            return json.loads(archive.read("structuredData.json"))
+
+
+def adobe_structured_data_to_document(structured_data, source, backend="adobe"):
+    """Map Adobe Extract structuredData.json onto the uniform model.
+
+    Adobe pages are 0-based and Bounds use a bottom-left origin; both are converted.
+    """
+    document = Document(source, backend)
+    for page_info in structured_data.get("pages", []):
+        page = document.page(page_info["page_number"] + 1)
+        page.width, page.height = page_info.get("width"), page_info.get("height")
+
+    tables = {}
+    for element in structured_data.get("elements", []):
+        if "Page" not in element:
+            continue
+        page = document.page(element["Page"] + 1)
+        bbox = None
+        if element.get("Bounds") and page.height:
+            x0, y0, x1, y1 = element["Bounds"]
+            bbox = (x0, page.height - y1, x1, page.height - y0)
+        path = element.get("Path", "")
+
+        cell = ADOBE_TABLE_CELL.search(path)
+        if cell:
+            table_key = (page.number, path[:cell.start()], cell.group(1) or "1")
+            row, column = int(cell.group(2) or 1) - 1, int(cell.group(3) or 1) - 1
+            cells = tables.setdefault(table_key, {})
+            # A cell can hold several paragraphs; join them
+            cells[(row, column)] = f"{cells.get((row, column), '')} {element.get('Text', '')}".strip()
+        elif "/Figure" in path:
+            page.figures.append(Figure(bbox, ref=path))
+        elif element.get("Text", "").strip():
+            kind = path.rsplit("/", 1)[-1].split("[")[0] or "paragraph"
+            page.blocks.append(TextBlock(element["Text"].strip(), bbox, kind))
+
+    for (page_number, _, _), cells in tables.items():
+        row_count = max(row for row, _ in cells) + 1
+        column_count = max(column for _, column in cells) + 1
+        rows = [["" for _ in range(column_count)] for _ in range(row_count)]
+        for (row, column), text in cells.items():
+            rows[row][column] = text
+        document.page(page_number).tables.append(Table(rows))
+    return document
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract a PDF into the uniform document model.")
+    parser.add_argument("pdf")
+    parser.add_argument("--backend", default="auto", help=f"auto or one of: {', '.join(registered_extractors())}")
+    parser.add_argument("--needs", default="text", help="comma separated capabilities for --backend auto")
+    parser.add_argument("--compare", help="comma separated backends to run side by side")
+    parser.add_argument("--output", help="write the document model as JSON to this file")
+    args = parser.parse_args()
+
+    if args.compare:
+        for name, (document, seconds) in run_side_by_side(args.pdf, args.compare.split(",")).items():
+            tables = sum(len(page.tables) for page in document.pages)
+            figures = sum(len(page.figures) for page in document.pages)
+            print(f"{name:<10} {seconds:>7.2f}s  pages={len(document.pages)} chars={len(document.text)} "
+                  f"tables={tables} figures={figures}")
+    else:
+        extractor = choose_extractor(args.pdf, args.needs.split(",")) if args.backend == "auto" else get_extractor(args.backend)
+        print(f"Using backend: {extractor.name}")
+        document = extractor.extract(args.pdf)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as fp:
+                json.dump(document.to_dict(), fp)
+            print(f"Document model saved to: {args.output}")
+        else:
+            print(json.dumps(document.to_dict())[:2000])
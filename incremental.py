@@ -0,0 +1,155 @@
+import hashlib
+import json
+import posixpath
+import re
+from pdf_input import open_pdf
+from s3_uploader import get_uploader
+
+# Manifest object kept next to the per-page artifacts
+MANIFEST_NAME = "_page_manifest.json"
+MANIFEST_VERSION = 2
+
+# An indirect reference ("12 0 R") inside an object's source
+REFERENCE = re.compile(r"\b(\d+) \d+ R\b")
+
+
+def _source_digest(document, source, memo):
+    """SHA-256 of an object's source with every reference replaced by its target's digest."""
+    resolved = REFERENCE.sub(lambda match: _object_digest(document, int(match.group(1)), memo), source)
+    return hashlib.sha256(resolved.encode()).hexdigest()
+
+
+def _object_digest(document, xref, memo):
+    """SHA-256 of an object, its raw stream and everything it references.
+
+    Object numbers never enter the digest, so renumbering objects (a save with garbage
+    collection) does not change it. Page tree nodes are not followed (a form's /P or a font's /Parent would otherwise
+    pull in the whole document), and a reference cycle hashes as a fixed marker.
+    """
+    if xref in memo:
+        return memo[xref]
+    memo[xref] = "cycle"
+    if document.xref_get_key(xref, "Type")[1] in ("/Page", "/Pages"):
+        memo[xref] = "page"
+        return memo[xref]
+    digest = hashlib.sha256(_source_digest(document, document.xref_object(xref, compressed=True), memo).encode())
+    if document.xref_is_stream(xref):
+        digest.update(document.xref_stream_raw(xref) or b"")
+    memo[xref] = digest.hexdigest()
+    return memo[xref]
+
+
+def _page_resources(document, page):
+    """(type, value) of the page's Resources entry, inherited from the page tree if needed."""
+    xref = page.xref
+    while xref:
+        entry = document.xref_get_key(xref, "Resources")
+        if entry[0] != "null":
+            return entry
+        parent_type, parent = document.xref_get_key(xref, "Parent")
+        xref = int(parent.split()[0]) if parent_type == "xref" else 0
+    return "null", "null"
+
+
+def page_fingerprint(document, page, memo=None):
+    """SHA-256 over everything that shapes a page's output.
+
+    Covers the page geometry, the decompressed content streams and the resource dictionary
+    (inherited or not) with every object it reaches: fonts and their font files, images,
+    form XObjects and the resources of those. An edit to any of them changes the
+    fingerprint. Fingerprints are compared by page number, so a page that only moved to
+    another number counts as changed. memo caches object digests across the pages of a
+    document, so shared fonts are hashed once.
+    """
+    memo = {} if memo is None else memo
+    digest = hashlib.sha256()
+    digest.update(f"{tuple(page.mediabox)}|{page.rotation}".encode())
+    digest.update(page.read_contents())
+    resources_type, resources = _page_resources(document, page)
+    if resources_type == "xref":
+        digest.update(_object_digest(document, int(resources.split()[0]), memo).encode())
+    else:
+        digest.update(_source_digest(document, resources, memo).encode())
+    return digest.hexdigest()
+
+
+def fingerprint_pages(file_path):
+    """{page number (1-based): fingerprint} for every page of the PDF."""
+    memo = {}
+    with open_pdf(file_path) as pdf_document:
+        return {page.number + 1: page_fingerprint(pdf_document, page, memo) for page in pdf_document}
+
+
+def load_manifest(s3_prefix, uploader=None):
+    uploader = uploader or get_uploader()
+    try:
+        body = uploader.client.get_object(Bucket=uploader.bucket, Key=f"{s3_prefix}/{MANIFEST_NAME}")['Body'].read()
+    except uploader.client.exceptions.NoSuchKey:
+        return None
+    return json.loads(body)
+
+
+def save_manifest(s3_prefix, manifest, uploader=None):
+    uploader = uploader or get_uploader()
+    uploader.client.put_object(Bucket=uploader.bucket, Key=f"{s3_prefix}/{MANIFEST_NAME}",
+                               Body=json.dumps(manifest).encode("utf-8"), ContentType="application/json")
+
+
+def plan(fingerprints, manifest, options):
+    """Compare fresh fingerprints with the stored manifest.
+
+    Returns (changed, removed): page numbers to re-extract and page numbers that no longer
+    exist. Everything counts as changed when there is no manifest or the extraction
+    options differ from the ones it was built with.
+    """
+    if not manifest or manifest.get("version") != MANIFEST_VERSION or manifest.get("options") != options:
+        previous = {}
+    else:
+        previous = {int(page): entry["fingerprint"] for page, entry in manifest["pages"].items()}
+    changed = [page for page, fingerprint in sorted(fingerprints.items()) if previous.get(page) != fingerprint]
+    removed = sorted(int(page) for page in (manifest or {}).get("pages", {}) if int(page) not in fingerprints)
+    return changed, removed
+
+
+def build_manifest(fingerprints, options, page_artifacts, manifest=None, changed=(), sha256=None):
+    """New manifest: fresh fingerprints, artifacts of changed pages, unchanged pages carried over.
+
+    sha256 is the document version the manifest describes, which its search index entry is keyed by.
+    """
+    previous = (manifest or {}).get("pages", {})
+    changed = set(changed)
+    pages = {}
+    for page, fingerprint in fingerprints.items():
+        artifacts = page_artifacts.get(page, []) if page in changed else previous.get(str(page), {}).get("artifacts", [])
+        pages[str(page)] = {"fingerprint": fingerprint, "artifacts": sorted(artifacts)}
+    return {"version": MANIFEST_VERSION, "options": options, "sha256": sha256, "pages": pages}
+
+
+def orphaned_keys(manifest, new_manifest):
+    """Keys listed for a page in the old manifest but not in the new one."""
+    old_pages = (manifest or {}).get("pages", {})
+    new_pages = new_manifest["pages"]
+    orphans = []
+    for page, entry in old_pages.items():
+        keep = set(new_pages.get(page, {}).get("artifacts", []))
+        orphans.extend(key for key in entry.get("artifacts", []) if key not in keep)
+    return sorted(orphans)
+
+
+def page_owned(key):
+    """Per-page artifacts (page_{n}_...); shared content-addressed objects are never owned by a page."""
+    return posixpath.basename(key).startswith("page_")
+
+
+def delete_keys(keys, uploader=None):
+    """Delete keys in batches of 1000 (the DeleteObjects limit)."""
+    uploader = uploader or get_uploader()
+    keys = list(keys)
+    for start in range(0, len(keys), 1000):
+        batch = keys[start:start + 1000]
+        response = uploader.client.delete_objects(Bucket=uploader.bucket, Delete={
+            "Objects": [{"Key": key} for key in batch], "Quiet": True})
+        errors = response.get("Errors", [])
+        if errors:
+            raise RuntimeError(f"Failed to delete {len(errors)} objects, first: {errors[0]}")
+    return len(keys)
@@ -0,0 +1,267 @@
+import asyncio
+import atexit
+import contextvars
+import json
+import multiprocessing
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Write a trace of this run to this file when the top-level process exits
+TRACE_FILE = os.getenv('TRACE_FILE')
+# Keep spans without writing a file at exit (e.g. for the API's /trace endpoint)
+TRACE_ENABLED = bool(TRACE_FILE) or os.getenv('TRACE_ENABLED', '').lower() in ('1', 'true', 'yes')
+# "chrome" (chrome://tracing, Perfetto) or "otlp" (OpenTelemetry OTLP/JSON)
+TRACE_FORMAT = os.getenv('TRACE_FORMAT', 'chrome')
+# Spans kept for the trace; the oldest are dropped past this (stage metrics are not affected)
+TRACE_MAX_SPANS = int(os.getenv('TRACE_MAX_SPANS', '200000'))
+
+SERVICE_NAME = "pdf-pipeline"
+# Upper bounds (seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Telemetry:
+    """Timing spans, counters and per-stage duration histograms of one process.
+
+    span() times a block and feeds the "stage_seconds" histogram under the span name; the
+    span itself is only kept (for trace export) when tracing is on. count() adds to a
+    labelled counter. snapshot() returns everything as JSON-ready data and merge() adds a
+    snapshot from another process, which is how process-pool workers report back.
+    """
+
+    def __init__(self, tracing=False, max_spans=TRACE_MAX_SPANS):
+        self.tracing = tracing
+        self.max_spans = max_spans
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.spans = deque(maxlen=self.max_spans)
+            # (name, ((label, value), ...)) -> value
+            self.counters = {}
+            # stage -> [count per bucket..., overflow count, sum of seconds]
+            self.stages = {}
+            self.trace_id = os.urandom(16).hex()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = _current_span.get()
+        span_id = os.urandom(8).hex()
+        token = _current_span.set(span_id)
+        start_ns = time.time_ns()
+        clock = time.perf_counter_ns()
+        try:
+            yield attributes
+        finally:
+            duration_ns = time.perf_counter_ns() - clock
+            _current_span.reset(token)
+            self.observe(name, duration_ns / 1e9)
+            if self.tracing:
+                record = {"name": name, "span_id": span_id, "parent_id": parent, "start_ns": start_ns,
+                          "duration_ns": duration_ns, "pid": os.getpid(), "tid": _track_id(),
+                          "attributes": attributes}
+                with self._lock:
+                    self.spans.append(record)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            buckets = self.stages.get(stage)
+            if buckets is None:
+                buckets = self.stages[stage] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+            buckets[bisect_left(DURATION_BUCKETS, seconds)] += 1
+            buckets[-1] += seconds
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self, clear=False):
+        with self._lock:
+            data = {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                "stages": {stage: list(buckets) for stage, buckets in self.stages.items()},
+                "spans": list(self.spans),
+            }
+        if clear:
+            self.reset()
+        return data
+
+    def merge(self, data):
+        """Add a snapshot taken in another process."""
+        if not data:
+            return
+        for name, labels, value in data["counters"]:
+            self.count(name, value, **labels)
+        with self._lock:
+            for stage, buckets in data["stages"].items():
+                mine = self.stages.setdefault(stage, [0] * (len(DURATION_BUCKETS) + 1) + [0.0])
+                for index, value in enumerate(buckets):
+                    mine[index] += value
+            if self.tracing:
+                self.spans.extend(data["spans"])
+
+    # -------- Trace export --------
+
+    def chrome_trace(self):
+        """Spans as Chrome trace "complete" events, loadable in chrome://tracing or Perfetto."""
+        tracks = {}
+        events = []
+        for span in self.snapshot()["spans"]:
+            # Small stable thread ids; asyncio tasks each get their own track
+            tid = tracks.setdefault((span["pid"], span["tid"]), len(tracks) + 1)
+            events.append({"name": span["name"], "cat": span["name"].split(".")[0], "ph": "X",
+                           "ts": span["start_ns"] / 1000, "dur": span["duration_ns"] / 1000,
+                           "pid": span["pid"], "tid": tid, "args": span["attributes"]})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def otlp_trace(self):
+        """Spans in the OTLP/JSON trace format, as accepted by an OpenTelemetry collector's /v1/traces."""
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        spans = []
+        for span in self.snapshot()["spans"]:
+            record = {"traceId": self.trace_id, "spanId": span["span_id"], "name": span["name"], "kind": 1,
+                      "startTimeUnixNano": str(span["start_ns"]),
+                      "endTimeUnixNano": str(span["start_ns"] + span["duration_ns"]),
+                      "attributes": [attribute("process.pid", span["pid"])]
+                                    + [attribute(key, value) for key, value in span["attributes"].items()]}
+            if span["parent_id"]:
+                record["parentSpanId"] = span["parent_id"]
+            spans.append(record)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }]}
+
+    def write_trace(self, path, trace_format=TRACE_FORMAT):
+        trace = self.otlp_trace() if trace_format == "otlp" else self.chrome_trace()
+        with open(path, "w") as f:
+            json.dump(trace, f)
+        return path
+
+
+def _track_id():
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+
+telemetry = Telemetry(tracing=TRACE_ENABLED)
+
+
+def _after_fork():
+    # A forked worker starts empty so its snapshot only holds its own work; the lock may
+    # have been held by another thread of the parent at fork time
+    telemetry._lock = threading.Lock()
+    telemetry.reset()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def span(name, **attributes):
+    """Time a block as a stage: `with span("camelot", page=3): ...`."""
+    return telemetry.span(name, **attributes)
+
+
+def count(name, value=1, **labels):
+    telemetry.count(name, value, **labels)
+
+
+def drain():
+    """Snapshot of this process's telemetry, cleared afterwards (for workers to return)."""
+    return telemetry.snapshot(clear=True)
+
+
+def merge(data):
+    telemetry.merge(data)
+
+
+def call_and_drain(function, *args, **kwargs):
+    """Process pool entry point: run function and return (result, drained telemetry)."""
+    try:
+        result = function(*args, **kwargs)
+    except BaseException:
+        drain()
+        raise
+    return result, drain()
+
+
+def instrument_s3_client(client):
+    """Count requests, retries and errors per S3 operation on a boto3 client (once per client)."""
+    def after_call(model=None, parsed=None, **kwargs):
+        operation = model.name if model is not None else "unknown"
+        count("s3_requests", operation=operation)
+        metadata = (parsed or {}).get("ResponseMetadata", {})
+        if metadata.get("RetryAttempts"):
+            count("s3_retries", metadata["RetryAttempts"], operation=operation)
+        error = (parsed or {}).get("Error")
+        if error:
+            # Labelled by code: a 404 from an existence check is expected, a 503 SlowDown is not
+            count("s3_errors", operation=operation, code=str(error.get("Code", "unknown")))
+
+    def after_call_error(model=None, exception=None, **kwargs):
+        count("s3_errors", operation=model.name if model is not None else "unknown",
+              code=type(exception).__name__ if exception is not None else "unknown")
+
+    client.meta.events.register("after-call.s3", after_call, unique_id="instrumentation-after-call")
+    client.meta.events.register("after-call-error.s3", after_call_error, unique_id="instrumentation-after-call-error")
+    return client
+
+
+class PrometheusCollector:
+    """prometheus_client collector exposing the process telemetry, for REGISTRY.register()."""
+
+    def __init__(self, source=telemetry, namespace="pdf_pipeline"):
+        self.source = source
+        self.namespace = namespace
+
+    def collect(self):
+        from prometheus_client.core import CounterMetricFamily, HistogramMetricFamily
+
+        data = self.source.snapshot()
+        families = {}
+        for name, labels, value in sorted(data["counters"], key=lambda counter: (counter[0], sorted(counter[1]))):
+            family = families.get(name)
+            if family is None:
+                family = families[name] = CounterMetricFamily(f"{self.namespace}_{name}", name.replace("_", " "),
+                                                              labels=sorted(labels))
+            family.add_metric([str(labels[label]) for label in sorted(labels)], value)
+        yield from families.values()
+
+        stages = HistogramMetricFamily(f"{self.namespace}_stage_seconds", "Time spent per pipeline stage",
+                                       labels=["stage"])
+        for stage, buckets in sorted(data["stages"].items()):
+            cumulative, running = [], 0
+            for bound, bucket_count in zip(DURATION_BUCKETS + (float("inf"),), buckets[:-1]):
+                running += bucket_count
+                cumulative.append((str(bound) if bound != float("inf") else "+Inf", running))
+            stages.add_metric([stage], cumulative, buckets[-1])
+        yield stages
+
+
+def _write_trace_at_exit():
+    # Workers hand their spans to the parent; only the top-level process writes the file
+    if multiprocessing.parent_process() is None:
+        telemetry.write_trace(TRACE_FILE)
+
+
+if TRACE_FILE:
+    atexit.register(_write_trace_at_exit)
@@ -0,0 +1,151 @@
+import re
+import fitz  # PyMuPDF
+
+# Glyphs that open a bulleted item; "-" and "*" only count when followed by whitespace
+BULLET_GLYPHS = "•◦○●▪▫■□‣⁃∙·➢➤►▶✓✔"
+BULLET_PATTERN = re.compile(rf"^(?:([{BULLET_GLYPHS}])\s*|([-*–—])\s+)(.*)$")
+# 1. 1) 1.2. (a) a) iv. and the like
+ORDERED_PATTERN = re.compile(r"^(\(?(?:\d{1,3}(?:\.\d{1,3})*|[A-Za-z]|[ivxlcdmIVXLCDM]{1,6})[.)])(?:\s+(.*)|$)")
+ROMAN_PATTERN = re.compile(r"^[ivxlcdm]+$|^[IVXLCDM]+$")
+
+# Items whose x0 differ by less than this (points) sit at the same level
+INDENT_TOLERANCE = 4.0
+# A continuation line may start at most this many line heights below the previous line
+CONTINUATION_GAP = 1.0
+
+
+def parse_marker(text):
+    """(type, style, marker, rest) when text starts with a list marker, else None."""
+    match = BULLET_PATTERN.match(text)
+    if match:
+        return "bullet", "bullet", match.group(1) or match.group(2), match.group(3)
+    match = ORDERED_PATTERN.match(text)
+    if match:
+        marker = match.group(1)
+        label = marker.strip("().")
+        if label[:1].isdigit():
+            style = "decimal"
+        elif ROMAN_PATTERN.match(label) and (len(label) > 1 or label in "iI"):
+            style = "roman"
+        else:
+            style = "alpha"
+        return "ordered", style, marker, match.group(2) or ""
+    return None
+
+
+def page_lines(text_dict):
+    """Text lines of a get_text("dict") result as (x0, y0, x1, y1, text), in reading order.
+
+    A line holding nothing but a marker (some producers write the bullet as its own span
+    or block) is joined with the line that follows it on the same row.
+    """
+    lines = []
+    for block in text_dict["blocks"]:
+        for line in block.get("lines", []):
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                lines.append((*line["bbox"], text))
+
+    merged = []
+    for line in lines:
+        if merged:
+            x0, y0, x1, y1, text = merged[-1]
+            middle = (line[1] + line[3]) / 2
+            marker = parse_marker(text)
+            if marker and not marker[3] and y0 <= middle <= y1 and line[0] >= x1 - INDENT_TOLERANCE:
+                merged[-1] = (x0, min(y0, line[1]), line[2], max(y1, line[3]), f"{text} {line[4]}")
+                continue
+        merged.append(line)
+    return merged
+
+
+def _union(bbox, line):
+    return [min(bbox[0], line[0]), min(bbox[1], line[1]), max(bbox[2], line[2]), max(bbox[3], line[3])]
+
+
+def build_list_trees(lines):
+    """Nested lists from page lines.
+
+    A line opening with a bullet glyph or a numbering pattern starts an item; its x0 is the
+    item's indent. A deeper indent opens a child list under the previous item, a shallower
+    one closes lists until the indent matches. A line without a marker that starts right of
+    the current item's indent and directly below the previous line continues that item;
+    any other line ends all open lists. Returns a list of
+    {"type", "style", "items": [{"marker", "text", "bbox", "lists": [...]}]}.
+    """
+    trees = []
+    # Open lists from outermost to innermost: (indent, list, container it was appended to)
+    stack = []
+    item = None
+    previous = None
+
+    def open_list(indent, marker, container):
+        new_list = {"type": marker[0], "style": marker[1], "items": []}
+        container.append(new_list)
+        stack.append((indent, new_list, container))
+        return new_list
+
+    for line in lines:
+        x0, y0, x1, y1, text = line
+        height = max(y1 - y0, 1.0)
+        # Moving up the page (next column) or a wide gap closes everything
+        if previous is not None and (y0 < previous[1] - height or y0 - previous[3] > 3 * height):
+            stack, item = [], None
+        marker = parse_marker(text)
+
+        if marker is None:
+            if item is not None and x0 > stack[-1][0] + INDENT_TOLERANCE and y0 - previous[3] <= CONTINUATION_GAP * height:
+                item["text"] = f"{item['text']} {text}".strip()
+                item["bbox"] = _union(item["bbox"], line)
+            else:
+                stack, item = [], None
+            previous = line
+            continue
+
+        while stack and x0 < stack[-1][0] - INDENT_TOLERANCE:
+            stack.pop()
+        if not stack:
+            current = open_list(x0, marker, trees)
+        elif x0 > stack[-1][0] + INDENT_TOLERANCE:
+            current = open_list(x0, marker, item["lists"])
+        else:
+            indent, current, container = stack[-1]
+            if current["type"] != marker[0]:
+                # A bullet list directly followed by a numbered one (or the reverse) at the same level
+                stack.pop()
+                current = open_list(indent, marker, container)
+
+        item = {"marker": marker[2], "text": marker[3], "bbox": list(line[:4]), "lists": []}
+        current["items"].append(item)
+        previous = line
+
+    _round_boxes(trees)
+    return trees
+
+
+def _round_boxes(lists):
+    for current in lists:
+        for entry in current["items"]:
+            entry["bbox"] = [round(value, 2) for value in entry["bbox"]]
+            _round_boxes(entry["lists"])
+
+
+def list_text(trees):
+    """Items as indented "<marker> <text>" lines, two spaces per level."""
+    lines = []
+
+    def visit(lists, depth):
+        for current in lists:
+            for entry in current["items"]:
+                lines.append(f"{'  ' * depth}{entry['marker']} {entry['text']}".rstrip())
+                visit(entry["lists"], depth + 1)
+
+    visit(trees, 0)
+    return lines
+
+
+def page_list_trees(page, text_dict=None):
+    """List trees of a PyMuPDF page; pass text_dict to reuse an existing get_text("dict") result."""
+    if text_dict is None:
+        text_dict = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)
+    return build_list_trees(page_lines(text_dict))
@@ -1,112 +1,362 @@
 import os
-import fitz  # PyMuPDF
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import camelot
-import requests
-import boto3
 from dotenv import load_dotenv
+from extraction_engine import run_single_pass, run_parallel, iter_pages, format_report, PageHandler, TextHandler, ImageHandler, ListHandler, FlushSinkHandler, IMAGES_FOLDER
+from s3_uploader import get_uploader
+from sinks import ContentStore, LocalDiskSink, ParquetSink, S3Sink, TeeSink, delete_columnar_parts
+from extraction_cache import ExtractionCache, file_sha256
+from instrumentation import call_and_drain, merge, span
+from downloader import download
+from table_prescreen import prescreen as prescreen_tables, format_prescreen
+from table_builder import TableBatch
+import incremental
+from memory_guard import MemoryCeiling, STREAM_MEMORY_LIMIT_MB
+from search_index import SearchIndexHandler, get_index
+from ocr import OCR_LANG, get_ocr, ocr_available
+from pdf_input import open_pdf
 
 # Load environment variables
 load_dotenv()
 
-# AWS S3 Configuration
-session = boto3.Session(
-    aws_access_key_id=os.getenv('AWS_SERVER_PUBLIC_KEY'),
-    aws_secret_access_key=os.getenv('AWS_SERVER_SECRET_KEY'),
-)
-
-s3 = session.client('s3')
+# AWS S3 Configuration (uploads go through the shared s3_uploader client)
 bucket_name = os.getenv('AWS_BUCKET_NAME')
 
+# S3 prefix for per-page artifacts
+S3_PARSED_PREFIX = "pdf_processing_pipeline/pdf_os_pipeline/parsed_data"
+# API jobs get one folder each here, next to S3_PARSED_PREFIX rather than inside it: that
+# prefix is listed recursively and grouped by file name as a single document
+S3_JOBS_PREFIX = "pdf_processing_pipeline/pdf_os_pipeline/parsed_jobs"
+# Batch documents, one folder per document sha256, and images/ shared by all of them
+S3_BATCH_PREFIX = "pdf_processing_pipeline/pdf_os_pipeline/parsed_batch"
+
+# Extractor identity and options that change its output; both are part of the cache key
+EXTRACTOR_NAME = "pymupdf+camelot"
+CAMELOT_FLAVOR = "stream"
+MIN_TABLE_ACCURACY = 80
+TABLE_PRESCREEN_THRESHOLD = 0.25
+EXTRACTION_OPTIONS = {
+    "camelot_flavor": CAMELOT_FLAVOR,
+    "min_table_accuracy": MIN_TABLE_ACCURACY,
+    "table_prescreen_threshold": TABLE_PRESCREEN_THRESHOLD,
+    "image_layout": "content-addressed",
+    # 2: indented "<marker> <text>" list lines plus page_{n}_list_tree.json
+    "list_format": 2,
+    # Pages without a text layer get OCR text only when local OCR can run
+    "ocr": {"enabled": ocr_available(), "lang": OCR_LANG},
+}
+
+# Write per-page text, lists and tables as one Parquet dataset per document instead of many small objects
+COLUMNAR_OUTPUT = os.getenv('COLUMNAR_OUTPUT', '').lower() in ('1', 'true', 'yes')
+# Dataset name shared by every document of a batch; unset means one dataset per document
+COLUMNAR_DATASET = os.getenv('COLUMNAR_DATASET')
+
+# Image names known to be in S3, per S3 prefix, shared across the documents of this process
+_known_images = {}
+
 def upload_file_to_s3(file_path, object_name):
-    """Uploads a file to S3."""
-    try:
-        s3.upload_file(file_path, bucket_name, object_name)
-        print(f"Uploaded {file_path} to s3://{bucket_name}/{object_name}")
-    except Exception as e:
-        print(f"Error uploading file {file_path}: {e}")
+    """Queues a file for upload to S3 on the shared uploader and returns its future."""
+    return get_uploader().upload_file(file_path, object_name)
+
+def build_sink(output_folder=None, staging_folder=None, s3_prefix=S3_PARSED_PREFIX, columnar_doc_id=None,
+               columnar_label="pages", columnar_prefix=None):
+    """S3 sink for the parsed artifacts, teed to output_folder when a local copy is wanted
+    and to staging_folder when the run fills the extraction cache. With columnar_doc_id the
+    per-page artifacts go to that document's Parquet dataset under columnar_prefix (s3_prefix
+    by default) and only images stay objects."""
+    if columnar_doc_id:
+        sinks = [ParquetSink(columnar_prefix or s3_prefix, columnar_doc_id, passthrough=S3Sink(s3_prefix),
+                             label=columnar_label, dataset=COLUMNAR_DATASET)]
+    else:
+        sinks = [S3Sink(s3_prefix)]
+    if output_folder:
+        sinks.append(LocalDiskSink(output_folder))
+    if staging_folder:
+        sinks.append(LocalDiskSink(staging_folder))
+    return TeeSink(*sinks) if len(sinks) > 1 else sinks[0]
 
 def download_pdf(url, output_path):
-    """Download PDF from a URL and save to S3."""
-    response = requests.get(url)
-    if response.status_code == 200:
-        with open(output_path, "wb") as pdf_file:
-            pdf_file.write(response.content)
-        print(f"PDF downloaded successfully: {output_path}")
-        upload_file_to_s3(output_path, "RawInputs/downloaded.pdf")
+    """Stream a PDF from a URL to output_path and save it to S3 under its content hash.
+
+    Interrupted downloads resume with a Range request and unchanged files are not fetched
+    again (conditional GET). Returns the downloader.DownloadResult.
+    """
+    with span("download", url=url):
+        result = download(url, output_path)
+    if result.not_modified:
+        print(f"PDF not modified since last download: {output_path}")
+        return result
+    print(f"PDF downloaded successfully: {output_path} ({result.size} bytes{', resumed' if result.resumed else ''})")
+    upload_file_to_s3(output_path, f"RawInputs/{result.sha256}.pdf")
+    get_uploader().flush().raise_for_failures()
+    return result
+
+def extract_text_from_pdf(file_path, output_folder=None):
+    """Extract text from PDF and upload to S3 (plus a local copy if output_folder is set).
+
+    Pages without a text layer are OCRed locally when pytesseract and tesseract are there.
+    """
+    sink = build_sink(output_folder)
+    report = run_single_pass(file_path, [TextHandler(sink, get_ocr()), FlushSinkHandler(sink)])
+    print(format_report(report))
+    return report
+
+def extract_images_from_pdf(file_path, output_folder=None):
+    """Extract images from PDF and upload to S3 (plus a local copy if output_folder is set)."""
+    sink = build_sink(output_folder)
+    run_single_pass(file_path, [ImageHandler(sink), FlushSinkHandler(sink)])
+
+def read_page_tables(file_path, page_number):
+    """Run camelot on one page and return the CSV text of every table above the accuracy bar."""
+    with span("camelot", page=page_number):
+        tables = camelot.read_pdf(file_path, pages=str(page_number), flavor=CAMELOT_FLAVOR)
+    # Same CSV layout as camelot's Table.to_csv, without the intermediate file
+    table_batch = TableBatch.from_frames([table.df for table in tables if table.parsing_report['accuracy'] >= MIN_TABLE_ACCURACY])
+    return table_batch.csv_payloads(quoting=csv.QUOTE_ALL)
+
+def extract_tables_from_pdf(file_path, output_folder=None, sink=None, prescreen=True, workers=1, pages=None):
+    """Extract tables from PDF and upload to S3 (plus a local copy if output_folder is set).
+
+    With prescreen, pages are ranked by table likelihood from PyMuPDF drawings and word
+    geometry first and camelot only runs on the candidates. camelot runs one page per task,
+    across a process pool when workers > 1. pages (1-based page numbers) restricts the run
+    to those pages. Returns a summary with the skipped page count and the artifacts written.
+    """
+    sink = sink or build_sink(output_folder)
+    only = set(pages) if pages is not None else None
+    if prescreen:
+        with span("prescreen"):
+            screen = prescreen_tables(file_path, TABLE_PRESCREEN_THRESHOLD)
+        print(format_prescreen(screen))
+        pages, skipped = screen.candidates, screen.skipped
     else:
-        raise Exception(f"Failed to download PDF. Status code: {response.status_code}")
-
-def extract_text_from_pdf(file_path, output_folder):
-    """Extract text from PDF and upload to S3."""
-    with fitz.open(file_path) as pdf_document:
-        for page_num in range(len(pdf_document)):
-            text = pdf_document[page_num].get_text()
-            text_filename = os.path.join(output_folder, f"page_{page_num + 1}_text.txt")
-            with open(text_filename, "w", encoding="utf-8") as text_file:
-                text_file.write(text)
-            upload_file_to_s3(text_filename, f"pdf_processing_pipeline/pdf_os_pipeline/parsed_data/page_{page_num + 1}_text.txt")
-
-def extract_images_from_pdf(file_path, output_folder):
-    """Extract images from PDF and upload to S3."""
-    pdf_document = fitz.open(file_path)
-    for page_num in range(len(pdf_document)):
-        page = pdf_document[page_num]
-        image_list = page.get_images(full=True)
-        for img_index, img in enumerate(image_list):
-            xref = img[0]
-            base_image = pdf_document.extract_image(xref)
-            if base_image is None or "image" not in base_image:
-                continue
-            image_bytes = base_image["image"]
-            image_ext = base_image["ext"]
-            image_filename = os.path.join(output_folder, f"page_{page_num + 1}_img_{img_index + 1}.{image_ext}")
-            with open(image_filename, "wb") as img_file:
-                img_file.write(image_bytes)
-            upload_file_to_s3(image_filename, f"pdf_processing_pipeline/pdf_os_pipeline/parsed_data/{os.path.basename(image_filename)}")
-
-def extract_tables_from_pdf(file_path, output_folder):
-    """Extract tables from PDF and upload to S3."""
-    tables = camelot.read_pdf(file_path, pages='all', flavor='stream')
-    for table in tables:
-        if table.parsing_report['accuracy'] >= 80:
-            table_filename = os.path.join(output_folder, f"page_{table.page}_table.csv")
-            table.to_csv(table_filename)
-            upload_file_to_s3(table_filename, f"pdf_processing_pipeline/pdf_os_pipeline/parsed_data/{os.path.basename(table_filename)}")
-
-def extract_lists_from_pdf(file_path, output_folder):
-    """Extract lists from PDF and upload to S3."""
-    with fitz.open(file_path) as pdf_document:
-        for page_num in range(len(pdf_document)):
-            page = pdf_document[page_num]
-            text = page.get_text()
-            list_lines = [line.strip() for line in text.splitlines() if line.strip().startswith(('-', '*', '•', '○'))]
-            if list_lines:
-                list_filename = os.path.join(output_folder, f"page_{page_num + 1}_lists.txt")
-                with open(list_filename, "w", encoding="utf-8") as list_file:
-                    list_file.write("\n".join(list_lines))
-                upload_file_to_s3(list_filename, f"pdf_processing_pipeline/pdf_os_pipeline/parsed_data/{os.path.basename(list_filename)}")
-
-def extract_all_from_pdf(file_path, output_folder):
-    """Extract all data from a PDF and upload to S3."""
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    extract_text_from_pdf(file_path, output_folder)
-    extract_images_from_pdf(file_path, output_folder)
-    extract_tables_from_pdf(file_path, output_folder)
-    extract_lists_from_pdf(file_path, output_folder)
+        pages, skipped = list(range(1, count_pages(file_path) + 1)), 0
+    if only is not None:
+        pages = [page_number for page_number in pages if page_number in only]
+
+    start = time.perf_counter()
+    if workers > 1 and len(pages) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = []
+            for csv_tables, worker_telemetry in executor.map(partial(call_and_drain, read_page_tables),
+                                                             [file_path] * len(pages), pages):
+                merge(worker_telemetry)
+                results.append(csv_tables)
+    else:
+        results = [read_page_tables(file_path, page_number) for page_number in pages]
+
+    table_count = 0
+    artifacts = []
+    for page_number, csv_tables in zip(pages, results):
+        for csv_data in csv_tables:
+            artifacts.append(sink.write(f"page_{page_number}_table.csv", csv_data))
+            table_count += 1
+    sink.flush()
+    return {"pages": len(pages), "skipped": skipped, "tables": table_count, "camelot_seconds": time.perf_counter() - start,
+            "artifacts": artifacts}
+
+def extract_lists_from_pdf(file_path, output_folder=None):
+    """Extract lists from PDF and upload to S3 (plus a local copy if output_folder is set)."""
+    sink = build_sink(output_folder)
+    run_single_pass(file_path, [ListHandler(sink), FlushSinkHandler(sink)])
+
+def build_page_handlers(output_folder=None, staging_folder=None, s3_prefix=S3_PARSED_PREFIX, columnar_doc_id=None,
+                        image_prefix=None, columnar_prefix=None, document_sha256=None):
+    """Handlers for the per-page artifacts (text, images, lists) and, unless it is turned
+    off, the search index entry of every page, keyed by document_sha256 (hashed from the
+    file when not given) with s3_prefix as its location. With image_prefix, images are
+    stored under image_prefix/images/ instead, shared by every document using it, and the
+    image manifests say so."""
+    sink = build_sink(output_folder, staging_folder, s3_prefix, columnar_doc_id, columnar_prefix=columnar_prefix)
+    # Only S3 is shared across documents; the local copy and the cache staging folder get
+    # every image of this document
+    mirrors = [LocalDiskSink(folder) for folder in (output_folder, staging_folder) if folder]
+    image_store = ContentStore(S3Sink(image_prefix or s3_prefix), IMAGES_FOLDER, check_existing=True,
+                               known=_known_images.setdefault(image_prefix or s3_prefix, set()),
+                               mirror=TeeSink(*mirrors) if mirrors else None)
+    handlers = [TextHandler(sink, get_ocr()), ImageHandler(sink, image_store, image_prefix), ListHandler(sink)]
+    if get_index() is not None:
+        handlers.append(SearchIndexHandler(document_sha256, s3_prefix))
+    return handlers + [FlushSinkHandler(sink, stores=[image_store])]
+
+def count_pages(file_path):
+    """Number of pages in a PDF."""
+    with open_pdf(file_path) as pdf_document:
+        return len(pdf_document)
+
+def extract_page_chunk(file_path, page_range, s3_prefix=S3_PARSED_PREFIX, image_prefix=None, columnar_doc_id=None,
+                       columnar_prefix=None, document_sha256=None):
+    """Worker entry point: text, images and lists for one (start, stop) page range."""
+    handlers = build_page_handlers(s3_prefix=s3_prefix, columnar_doc_id=columnar_doc_id, image_prefix=image_prefix,
+                                   columnar_prefix=columnar_prefix, document_sha256=document_sha256)
+    return run_single_pass(file_path, handlers, page_range)
+
+def extract_page_tables(file_path, page_number, s3_prefix=S3_PARSED_PREFIX, columnar_doc_id=None, columnar_prefix=None):
+    """Worker entry point: camelot tables of one page, uploaded before returning their count."""
+    sink = build_sink(s3_prefix=s3_prefix, columnar_doc_id=columnar_doc_id, columnar_label="tables",
+                      columnar_prefix=columnar_prefix)
+    csv_tables = read_page_tables(file_path, page_number)
+    for csv_data in csv_tables:
+        sink.write(f"page_{page_number}_table.csv", csv_data)
+    sink.flush()
+    return len(csv_tables)
+
+class CamelotTableHandler(PageHandler):
+    """Runs camelot on the pre-screened candidate pages as part of the page pass."""
+
+    name = "tables"
+
+    def __init__(self, file_path, sink, candidates):
+        super().__init__()
+        self.file_path = file_path
+        self.sink = sink
+        self.candidates = set(candidates)
+
+    def handle_page(self, ctx):
+        if ctx.page_number not in self.candidates:
+            return
+        for csv_data in read_page_tables(self.file_path, ctx.page_number):
+            self.artifacts.append((ctx.page_number, self.sink.write(f"page_{ctx.page_number}_table.csv", csv_data)))
+
+def stream_pdf(file_path, s3_prefix=S3_PARSED_PREFIX, memory_limit_mb=STREAM_MEMORY_LIMIT_MB, tables=True):
+    """Bounded-memory extraction of very large PDFs, one page at a time.
+
+    Yields an extraction_engine.PageResult per page once its text, images, lists and tables
+    have been handed to the uploader, whose pending-upload limit applies backpressure. Page
+    objects are released as soon as they are yielded and the MuPDF store is shrunk
+    regularly; with memory_limit_mb (STREAM_MEMORY_LIMIT_MB by default) the run stops with
+    MemoryLimitExceeded rather than grow past it. Uploads are flushed after the last page.
+    """
+    handlers = build_page_handlers(s3_prefix=s3_prefix)
+    if tables:
+        screen = prescreen_tables(file_path, TABLE_PRESCREEN_THRESHOLD)
+        print(format_prescreen(screen))
+        # Before the flush handler, so table uploads are part of the final flush
+        handlers.insert(-1, CamelotTableHandler(file_path, handlers[0].sink, screen.candidates))
+    yield from iter_pages(file_path, handlers, ceiling=MemoryCeiling(memory_limit_mb))
+
+def replay_cached_artifacts(artifacts, output_folder=None, columnar_doc_id=None):
+    """Send cached artifacts to the usual destinations without running any extractor."""
+    sink = build_sink(output_folder, columnar_doc_id=columnar_doc_id, columnar_label="cached")
+    for name, data in artifacts.items():
+        sink.write(name, data)
+    sink.flush()
+    return {"pages": 0, "handlers": {}, "total": 0.0, "artifacts": [f"{S3_PARSED_PREFIX}/{name}" for name in artifacts],
+            "cached": True}
+
+def extract_all_from_pdf(file_path, output_folder=None, workers=1, cache=None, document_sha256=None,
+                         columnar=COLUMNAR_OUTPUT):
+    """Extract all data from a PDF and upload to S3.
+
+    Artifacts go straight from memory to S3; pass output_folder to keep a local copy as well.
+    Text, images and lists are produced by a single pass over the document; with workers > 1
+    the page range is split into chunks handled by a process pool. Tables still go through
+    camelot, which parses the file on its own.
+
+    With an ExtractionCache, a document that was already extracted with the same options is
+    served from the cache without opening it in PyMuPDF or camelot. Pass document_sha256
+    when it is already known (download_pdf computes it while streaming) to skip rehashing.
+
+    With columnar, text, lists, tables and image manifests are written as a Parquet dataset
+    under {S3_PARSED_PREFIX}/columnar/{document sha256 or COLUMNAR_DATASET}/ instead of one
+    object per page.
+    """
+    if cache is not None or columnar or get_index() is not None:
+        document_sha256 = document_sha256 or file_sha256(file_path)
+    columnar_doc_id = document_sha256 if columnar else None
+    if columnar_doc_id:
+        # Parts are named after this run's page chunks; older ones would duplicate its rows
+        delete_columnar_parts(S3_PARSED_PREFIX, columnar_doc_id, COLUMNAR_DATASET)
+
+    cache_key = staging_folder = None
+    if cache is not None:
+        cache_key = cache.make_key(document_sha256, EXTRACTOR_NAME, EXTRACTION_OPTIONS)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print(f"Extraction cache hit ({len(cached)} artifacts), skipping extraction.")
+            return replay_cached_artifacts(cached, output_folder, columnar_doc_id)
+        staging_folder = cache.begin(cache_key)
+
+    try:
+        with span("page_pass", workers=workers):
+            if workers > 1:
+                report = run_parallel(file_path, partial(build_page_handlers, output_folder, staging_folder,
+                                                         columnar_doc_id=columnar_doc_id,
+                                                         document_sha256=document_sha256), workers)
+            else:
+                report = run_single_pass(file_path, build_page_handlers(output_folder, staging_folder,
+                                                                        columnar_doc_id=columnar_doc_id,
+                                                                        document_sha256=document_sha256))
+        print(format_report(report))
+        table_sink = build_sink(output_folder, staging_folder, columnar_doc_id=columnar_doc_id, columnar_label="tables")
+        with span("tables", workers=workers):
+            report["tables"] = extract_tables_from_pdf(file_path, sink=table_sink, workers=workers)
+    except BaseException:
+        if cache is not None:
+            cache.discard(cache_key)
+        raise
+    if cache is not None:
+        cache.commit(cache_key)
     print("All extracted files uploaded to S3.")
+    return report
+
+def extract_incremental(file_path, s3_prefix=S3_PARSED_PREFIX, markdown_prefix=None):
+    """Re-extract only the pages whose fingerprint changed since the last run under s3_prefix.
+
+    Every page is fingerprinted (content streams, resources and image streams) and compared
+    with the manifest stored next to the artifacts. Text, images, lists and tables are
+    extracted for new and changed pages only; artifacts a page no longer produces and those
+    of removed pages are deleted. Shared content-addressed images are never deleted. With
+    markdown_prefix, the markdown of changed pages is re-rendered and that of removed pages
+    deleted. Returns the changed, removed and unchanged page numbers.
+    """
+    fingerprints = incremental.fingerprint_pages(file_path)
+    manifest = incremental.load_manifest(s3_prefix)
+    changed, removed = incremental.plan(fingerprints, manifest, EXTRACTION_OPTIONS)
+    unchanged = sorted(set(fingerprints) - set(changed))
+    print(f"{len(changed)} changed, {len(removed)} removed, {len(unchanged)} unchanged pages")
+
+    document_sha256 = file_sha256(file_path)
+    # Only changed pages are re-indexed; the unchanged ones move over from the last version,
+    # which manifests from before the sha256 was recorded indexed under s3_prefix
+    previous_sha256 = manifest.get("sha256", s3_prefix) if manifest else None
+    if get_index() is not None and previous_sha256 not in (None, document_sha256):
+        get_index().rename_document(previous_sha256, document_sha256)
+
+    page_artifacts = {}
+    if changed:
+        report = run_single_pass(file_path, build_page_handlers(s3_prefix=s3_prefix, document_sha256=document_sha256),
+                                 pages=[page - 1 for page in changed])
+        print(format_report(report))
+        tables = extract_tables_from_pdf(file_path, sink=build_sink(s3_prefix=s3_prefix), pages=changed)
+        for key in report["artifacts"] + tables["artifacts"]:
+            if incremental.page_owned(key):
+                page_artifacts.setdefault(int(key.rsplit("/", 1)[-1].split("_")[1]), set()).add(key)
+
+    new_manifest = incremental.build_manifest(fingerprints, EXTRACTION_OPTIONS, page_artifacts, manifest, changed,
+                                              document_sha256)
+    orphans = incremental.orphaned_keys(manifest, new_manifest)
+    if orphans:
+        print(f"Deleting {incremental.delete_keys(orphans)} orphaned page artifacts")
+    incremental.save_manifest(s3_prefix, new_manifest)
+
+    if markdown_prefix and (changed or removed):
+        from ospdftomarkdown import create_markdown_from_s3
+        create_markdown_from_s3(bucket_name, s3_prefix, markdown_prefix, pages=changed, removed_pages=removed)
+    return {"changed": changed, "removed": removed, "unchanged": unchanged}
 
 if __name__ == "__main__":
     project_root = os.path.dirname(os.path.abspath(__file__))
     downloaded_pdf_path = os.path.join(project_root, "downloaded.pdf")
-    output_dir = os.path.join(project_root, "output_data")
     pdf_url = "https://arxiv.org/pdf/2408.09869"
     
     try:
         print("Downloading PDF...")
-        download_pdf(pdf_url, downloaded_pdf_path)
+        downloaded = download_pdf(pdf_url, downloaded_pdf_path)
         print("Extracting data from PDF...")
-        extract_all_from_pdf(downloaded_pdf_path, output_dir)
+        extract_all_from_pdf(downloaded_pdf_path, cache=ExtractionCache(), document_sha256=downloaded.sha256)
     except Exception as e:
         print(f"Error: {e}")
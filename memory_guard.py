@@ -0,0 +1,65 @@
+import gc
+import os
+import resource
+import sys
+
+# Resident memory ceiling for the streaming mode, in MB; 0 disables the check
+STREAM_MEMORY_LIMIT_MB = int(os.getenv('STREAM_MEMORY_LIMIT_MB', '0'))
+
+
+class MemoryLimitExceeded(MemoryError):
+    """Raised when resident memory stays above the ceiling after reclaiming what can be reclaimed."""
+
+
+def current_rss_mb():
+    """Resident set size of this process right now (falls back to the peak where /proc is missing)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process."""
+    # VmHWM starts over at exec, unlike ru_maxrss which keeps the parent's peak across fork + exec
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class MemoryCeiling:
+    """Keeps resident memory under limit_mb during a streaming run.
+
+    check() is cheap (one read of /proc/self/statm). Over the limit it runs the garbage
+    collector and every `reclaim` callback (e.g. shrinking the MuPDF store) and only raises
+    MemoryLimitExceeded if that was not enough. peak_mb is the highest RSS seen by check().
+    """
+
+    def __init__(self, limit_mb=STREAM_MEMORY_LIMIT_MB, reclaim=()):
+        self.limit_mb = limit_mb
+        self.reclaim = list(reclaim)
+        self.peak_mb = 0.0
+        self.reclaims = 0
+
+    def check(self, where=""):
+        rss = current_rss_mb()
+        self.peak_mb = max(self.peak_mb, rss)
+        if not self.limit_mb or rss <= self.limit_mb:
+            return rss
+        gc.collect()
+        for release in self.reclaim:
+            release()
+        self.reclaims += 1
+        rss = current_rss_mb()
+        if rss > self.limit_mb:
+            raise MemoryLimitExceeded(f"Resident memory {rss:.0f}MB is above the {self.limit_mb}MB ceiling"
+                                      + (f" ({where})" if where else ""))
+        return rss
@@ -0,0 +1,288 @@
+import argparse
+import atexit
+import importlib.util
+import math
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+import fitz  # PyMuPDF
+from dotenv import load_dotenv
+from instrumentation import call_and_drain, count, merge, span
+from pdf_input import open_pdf
+from shared_images import attached_image, release_image, share_pixmap
+
+# Load environment variables
+load_dotenv()
+
+# Local OCR Configuration (tesseract through pytesseract, for pages without a text layer)
+OCR_ENABLED = os.getenv('OCR_ENABLED', '1').lower() in ('1', 'true', 'yes')
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+# Pages submitted but not OCRed yet; the page pass waits past this many
+OCR_MAX_PENDING = int(os.getenv('OCR_MAX_PENDING', str(2 * OCR_WORKERS)))
+OCR_LANG = os.getenv('OCR_LANG', 'eng')
+OCR_TESSERACT_CMD = os.getenv('OCR_TESSERACT_CMD', 'tesseract')
+
+# Render resolution: the resolution of the scanned image itself, within these bounds
+OCR_MIN_DPI = 150
+OCR_MAX_DPI = 400
+OCR_DEFAULT_DPI = 300
+# Cap on rendered pixels per page (~40 MB of grayscale), whatever the page size
+OCR_MAX_PIXELS = 40_000_000
+# A page with fewer visible characters than this has no usable text layer
+MIN_TEXT_CHARS = 16
+# ... and is treated as a scan when images cover at least this share of it
+MIN_IMAGE_COVERAGE = 0.25
+# Pages whose character confidence (0-100) is below this are worth a cloud extractor
+LOW_CONFIDENCE = 70.0
+
+
+def text_layer(page, text):
+    """Classify a page by its text layer.
+
+    "text": enough readable characters, get_text is all it needs. "unreadable": characters
+    are there but mostly U+FFFD (fonts without a usable encoding). "image-only": no usable
+    text and images cover at least MIN_IMAGE_COVERAGE of the page, i.e. a scan. "empty":
+    neither, a blank or vector-only page. The last two are decided without touching the
+    image data, so digital pages pay only for counting characters.
+    """
+    visible = [ch for ch in text if not ch.isspace()]
+    readable = sum(1 for ch in visible if ch != "\ufffd")
+    if readable >= MIN_TEXT_CHARS:
+        return "text"
+    if len(visible) >= MIN_TEXT_CHARS:
+        return "unreadable"
+    page_area = abs(page.rect)
+    if not page_area:
+        return "empty"
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return "image-only" if covered / page_area >= MIN_IMAGE_COVERAGE else "empty"
+
+
+def needs_ocr(layer):
+    return layer in ("image-only", "unreadable")
+
+
+def ocr_dpi(page):
+    """Render resolution for OCR: the resolution the largest image was scanned at, clamped
+    to [OCR_MIN_DPI, OCR_MAX_DPI] and to OCR_MAX_PIXELS for the page."""
+    dpi = OCR_DEFAULT_DPI
+    images = [info for info in page.get_image_info() if not fitz.Rect(info["bbox"]).is_empty]
+    if images:
+        largest = max(images, key=lambda info: abs(fitz.Rect(info["bbox"])))
+        bbox = fitz.Rect(largest["bbox"])
+        # Geometric mean of both axes, so a rotated scan gives the same answer
+        dpi = math.sqrt(largest["width"] * largest["height"] / (bbox.width * bbox.height)) * 72
+    dpi = min(max(dpi, OCR_MIN_DPI), OCR_MAX_DPI)
+    page_inches = page.rect.width * page.rect.height / (72 * 72)
+    if page_inches:
+        dpi = min(dpi, math.sqrt(OCR_MAX_PIXELS / page_inches))
+    return int(dpi)
+
+
+def ocr_text(data):
+    """Lines of words from pytesseract.image_to_data, and the character-weighted mean
+    confidence of those words (0-100; None when nothing was recognised)."""
+    lines = {}
+    weighted = characters = 0
+    for index, word in enumerate(data["text"]):
+        word = (word or "").strip()
+        confidence = float(data["conf"][index])
+        if not word or confidence < 0:
+            continue
+        key = (data["block_num"][index], data["par_num"][index], data["line_num"][index])
+        lines.setdefault(key, []).append(word)
+        weighted += confidence * len(word)
+        characters += len(word)
+    text = "\n".join(" ".join(words) for words in lines.values())
+    return text, (weighted / characters if characters else None), sum(len(words) for words in lines.values())
+
+
+def render_page(page, dpi):
+    """Grayscale pixmap of a page for OCR."""
+    with span("ocr.render", page=page.number + 1, dpi=dpi):
+        return page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+
+
+def recognize(image, page_number, dpi, lang=OCR_LANG):
+    """OCR a rendered page (a PIL image). Returns the text and a per-page report."""
+    import pytesseract
+
+    pytesseract.pytesseract.tesseract_cmd = OCR_TESSERACT_CMD
+    started = time.perf_counter()
+    with span("ocr.recognize", page=page_number):
+        data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+    text, confidence, words = ocr_text(data)
+    count("ocr_pages")
+    return text, {"page": page_number, "status": "ocr", "dpi": dpi, "lang": lang, "render_seconds": 0.0,
+                  "ocr_seconds": time.perf_counter() - started, "char_confidence": confidence,
+                  "chars": len(text), "words": words}
+
+
+def recognize_shared(handle, page_number, dpi, lang=OCR_LANG):
+    """Pool entry point: OCR a page the page pass rendered into shared memory."""
+    with attached_image(handle) as image:
+        return recognize(image, page_number, dpi, lang)
+
+
+def ocr_available():
+    return (OCR_ENABLED and importlib.util.find_spec("pytesseract") is not None
+            and importlib.util.find_spec("PIL") is not None and shutil.which(OCR_TESSERACT_CMD) is not None)
+
+
+class OcrPool:
+    """Bounded process pool for OCR.
+
+    The page pass renders each page from the page object it already has and hands the
+    pixels to a worker through shared memory, so workers never open the document and no
+    image is pickled. submit() blocks while OCR_MAX_PENDING pages are in flight, which also
+    bounds the rendered pages held in shared memory. Futures resolve to recognize's
+    (text, report); worker telemetry is merged into this process.
+    """
+
+    def __init__(self, workers=OCR_WORKERS, max_pending=OCR_MAX_PENDING, lang=OCR_LANG):
+        self.lang = lang
+        self._slots = threading.BoundedSemaphore(max(max_pending, workers))
+        # Spawned, so workers never inherit the uploader's or the API's threads
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, page, dpi):
+        self._slots.acquire()
+        handle = None
+        try:
+            started = time.perf_counter()
+            pixmap = render_page(page, dpi)
+            handle = share_pixmap(pixmap)
+            del pixmap
+            render_seconds = time.perf_counter() - started
+            inner = self._executor.submit(call_and_drain, recognize_shared, handle, page.number + 1, dpi, self.lang)
+        except BaseException:
+            if handle is not None:
+                release_image(handle)
+            self._slots.release()
+            raise
+        outer = Future()
+
+        def done(inner):
+            release_image(handle)
+            self._slots.release()
+            try:
+                (text, entry), worker_telemetry = inner.result()
+            except BaseException as e:
+                outer.set_exception(e)
+                return
+            merge(worker_telemetry)
+            entry["render_seconds"] = render_seconds
+            outer.set_result((text, entry))
+
+        inner.add_done_callback(done)
+        return outer
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+class InlineOcr:
+    """OCR in the calling process, for code that already runs inside a pool worker."""
+
+    def __init__(self, lang=OCR_LANG):
+        self.lang = lang
+
+    def submit(self, page, dpi):
+        from PIL import Image
+
+        future = Future()
+        try:
+            started = time.perf_counter()
+            pixmap = render_page(page, dpi)
+            image = Image.frombuffer("L", (pixmap.width, pixmap.height), pixmap.samples_mv, "raw", "L",
+                                     pixmap.stride, 1)
+            render_seconds = time.perf_counter() - started
+            text, entry = recognize(image, page.number + 1, dpi, self.lang)
+            entry["render_seconds"] = render_seconds
+            future.set_result((text, entry))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def close(self):
+        pass
+
+
+_shared_ocr = None
+_shared_pid = None
+_shared_lock = threading.Lock()
+
+
+def get_ocr():
+    """Process-wide OCR runner, or None when OCR is off or pytesseract/tesseract is missing.
+
+    The top-level process gets an OcrPool; pool workers (extraction chunks, API and batch
+    workers) OCR inline, since their parallelism already comes from their own pool.
+    """
+    global _shared_ocr, _shared_pid
+    with _shared_lock:
+        if _shared_pid != os.getpid():
+            _shared_pid = os.getpid()
+            if not ocr_available():
+                _shared_ocr = None
+            elif multiprocessing.parent_process() is not None:
+                _shared_ocr = InlineOcr()
+            else:
+                _shared_ocr = OcrPool()
+                atexit.register(_shared_ocr.close)
+        return _shared_ocr
+
+
+def format_ocr_report(entries):
+    """Summary lines for the OCR entries of a page pass report, naming the pages that still
+    need a cloud extractor."""
+    done = [entry for entry in entries if entry["status"] == "ocr"]
+    failed = [entry["page"] for entry in entries if entry["status"] == "failed"]
+    skipped = [entry["page"] for entry in entries if entry["status"] == "skipped"]
+    lines = []
+    if done:
+        seconds = sum(entry["render_seconds"] + entry["ocr_seconds"] for entry in done)
+        scored = [entry for entry in done if entry["char_confidence"] is not None]
+        confidence = (sum(entry["char_confidence"] * entry["chars"] for entry in scored)
+                      / max(1, sum(entry["chars"] for entry in scored)))
+        lines.append(f"  ocr        {len(done)} pages OCRed in {seconds:.2f}s, "
+                     f"mean confidence {confidence:.1f}")
+        low = [entry["page"] for entry in done
+               if entry["char_confidence"] is None or entry["char_confidence"] < LOW_CONFIDENCE]
+        if low:
+            lines.append(f"  ocr        low confidence, send to a cloud extractor: pages {low}")
+    if failed:
+        lines.append(f"  ocr        failed on pages {failed}")
+    if skipped:
+        lines.append(f"  ocr        {len(skipped)} pages without a text layer were not OCRed "
+                     f"(needs pytesseract, tesseract and OCR_ENABLED): pages {skipped}")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect pages without a text layer and OCR them locally.")
+    parser.add_argument("pdf")
+    parser.add_argument("--detect-only", action="store_true", help="only classify pages and pick their DPI")
+    args = parser.parse_args()
+
+    runner = None if args.detect_only else get_ocr()
+    if runner is None and not args.detect_only:
+        raise SystemExit("OCR unavailable: install pytesseract and tesseract")
+    with open_pdf(args.pdf) as pdf_document:
+        futures = []
+        for pdf_page in pdf_document:
+            layer = text_layer(pdf_page, pdf_page.get_text())
+            if not needs_ocr(layer):
+                print(f"page {pdf_page.number + 1}: {layer}")
+                continue
+            dpi = ocr_dpi(pdf_page)
+            print(f"page {pdf_page.number + 1}: {layer}, OCR at {dpi} dpi")
+            if runner is not None:
+                futures.append(runner.submit(pdf_page, dpi))
+        for future in futures:
+            text, report = future.result()
+            print(f"page {report['page']}: {report['chars']} chars, confidence {report['char_confidence']}, "
+                  f"{report['render_seconds'] + report['ocr_seconds']:.2f}s at {report['dpi']} dpi")
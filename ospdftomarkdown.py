@@ -1,8 +1,18 @@
 import os
 import pandas as pd
 import boto3
+from botocore.config import Config
 from dotenv import load_dotenv
+import csv
 import io
+import json
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from incremental import delete_keys
+from instrumentation import count, instrument_s3_client, span
+from s3_uploader import S3Uploader, get_uploader
+from sinks import COLUMNAR_FOLDER
 
 # Load environment variables
 load_dotenv()
@@ -13,66 +23,209 @@ session = boto3.Session(
     aws_secret_access_key=os.getenv('AWS_SERVER_SECRET_KEY'),
 )
 
-s3 = session.client('s3')
+# Bounded parallelism for the GET stage; the connection pool matches it
+FETCH_WORKERS = int(os.getenv('S3_FETCH_WORKERS', '16'))
+# Pages assembled per batch, bounds how many fetched objects are held in memory
+PAGE_BATCH_SIZE = 64
+# Columnar artifact kinds that were .json objects in the per-object layout
+JSON_KINDS = {"images", "list_tree", "ocr"}
+
+s3 = instrument_s3_client(session.client('s3', config=Config(max_pool_connections=FETCH_WORKERS)))
 bucket_name = os.getenv('AWS_BUCKET_NAME')
 output_s3_folder = "parsed_markdown"
 
 
 def download_s3_file(bucket, key):
     """Download file from S3 and return its content."""
-    obj = s3.get_object(Bucket=bucket, Key=key)
-    return obj['Body'].read().decode('utf-8')
+    with span("s3.get", key=key):
+        obj = s3.get_object(Bucket=bucket, Key=key)
+        body = obj['Body'].read()
+    count("bytes_read", len(body), source="s3")
+    return body.decode('utf-8')
+
+
+def list_s3_keys(bucket, prefix):
+    """Yield every key under prefix, following list_objects_v2 pagination."""
+    paginator = s3.get_paginator('list_objects_v2')
+    for response in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for file in response.get('Contents', []):
+            yield file['Key']
+
+
+def group_keys_by_page(keys):
+    """Map page number (int) -> {"text", "tables", "images", "image_manifests"} key lists, pages in numeric order."""
+    pages = {}
+    for key in keys:
+        filename = key.split('/')[-1]
+        if not filename.startswith("page_"):
+            continue
+        page_num = filename.split("_")[1].split(".")[0]  # Get page number
+        if not page_num.isdigit():
+            continue
+        content = pages.setdefault(int(page_num), {"text": [], "tables": [], "images": [], "image_manifests": []})
+
+        if filename.endswith("_text.txt"):
+            content["text"].append(key)
+        elif filename.endswith(".csv"):
+            content["tables"].append(key)
+        elif any(filename.endswith(ext) for ext in ['.png', '.jpg', '.jpeg']):
+            content["images"].append(key)
+        elif filename.endswith("_images.json"):
+            content["image_manifests"].append(key)
+
+    for content in pages.values():
+        for keys_of_kind in content.values():
+            keys_of_kind.sort()
+    return dict(sorted(pages.items()))
+
+
+def render_page_markdown(bucket, page_num, content, fetched):
+    """Assemble one page with a streaming writer; fetched maps key -> downloaded text."""
+    out = io.StringIO()
+    out.write(f"# Page {page_num}\n\n")
+
+    if content["text"]:
+        out.write("## Text Content\n\n")
+        for text_file in content["text"]:
+            out.write(fetched[text_file])
+            out.write("\n\n")
+
+    if content["tables"]:
+        out.write("## Tables\n\n")
+        for table_file in content["tables"]:
+            df = pd.read_csv(io.StringIO(fetched[table_file]))
+            out.write(f"### {table_file}\n\n")
+            out.write(df.to_markdown(index=False))
+            out.write("\n\n")
+
+    # Images are either per-page files or shared content-addressed objects listed in a manifest
+    image_keys = list(content["images"])
+    for manifest_key in content["image_manifests"]:
+        manifest = json.loads(fetched[manifest_key])
+        folder = manifest.get("images_prefix") or posixpath.dirname(manifest_key)
+        image_keys.extend(posixpath.join(folder, image["name"]) for image in manifest["images"])
+
+    if image_keys:
+        out.write("## Images\n\n")
+        for image_file in image_keys:
+            out.write(f"![{image_file}](s3://{bucket}/{image_file})\n\n")
+
+    return out.getvalue()
+
+
+def markdown_uploader(bucket):
+    """The shared uploader if it writes to bucket, else an S3Uploader that closes with the with block."""
+    uploader = get_uploader()
+    return nullcontext(uploader) if uploader.bucket == bucket else S3Uploader(bucket, client=s3)
+
+
+def create_markdown_from_s3(bucket, input_prefix, output_prefix, max_workers=FETCH_WORKERS, pages=None, removed_pages=()):
+    """Create markdown files from extracted PDF content stored in S3 and upload back to S3.
 
+    Keys are listed with the paginator, text and CSV objects are fetched concurrently (at
+    most max_workers GETs in flight) and pages are written in page-number order, one batch
+    of PAGE_BATCH_SIZE pages at a time. Pass pages (page numbers) to re-render only those
+    pages, and removed_pages to delete the markdown of pages that no longer exist.
+    """
+    try:
+        with span("s3.list", prefix=input_prefix):
+            grouped = group_keys_by_page(list_s3_keys(bucket, input_prefix))
+        if pages is not None:
+            wanted = set(pages)
+            grouped = {page_num: content for page_num, content in grouped.items() if page_num in wanted}
+        page_items = list(grouped.items())
+
+        with markdown_uploader(bucket) as uploader, \
+                ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-fetch") as executor:
+            if removed_pages:
+                deleted = delete_keys((f"{output_prefix}/page_{page_num}.md" for page_num in removed_pages), uploader)
+                print(f"{deleted} markdown files of removed pages deleted")
+            for batch_start in range(0, len(page_items), PAGE_BATCH_SIZE):
+                batch = page_items[batch_start:batch_start + PAGE_BATCH_SIZE]
+                keys = [key for _, content in batch
+                        for key in content["text"] + content["tables"] + content["image_manifests"]]
+                fetched = dict(zip(keys, executor.map(lambda key: download_s3_file(bucket, key), keys)))
+
+                for page_num, content in batch:
+                    with span("markdown.page", page=page_num):
+                        markdown_content = render_page_markdown(bucket, page_num, content, fetched)
+                    markdown_filename = f"page_{page_num}.md"
+                    markdown_key = f"{output_prefix}/{markdown_filename}"
+                    uploader.upload_bytes(markdown_content.encode("utf-8"), markdown_key, content_type="text/markdown")
+
+            report = uploader.flush()
+        report.raise_for_failures()
+        print(f"{report.uploaded} markdown files uploaded to S3://{bucket}/{output_prefix}")
+
+    except Exception as e:
+        print(f"Error creating markdown files: {e}")
+
+
+def read_columnar_pages(bucket, input_prefix, dataset=None, pages=None):
+    """Load the Parquet dataset(s) written by sinks.ParquetSink under input_prefix.
 
-def create_markdown_from_s3(bucket, input_prefix, output_prefix):
-    """Create markdown files from extracted PDF content stored in S3 and upload back to S3."""
+    Returns {doc_id: (pages, fetched)} shaped like group_keys_by_page() and the fetched map
+    of create_markdown_from_s3, so render_page_markdown() works unchanged. Part files are
+    fetched concurrently; with pages, row groups outside them are skipped by the reader.
+    A row repeated across parts (same doc_id, page, kind and seq) is only used once.
+    """
+    import pyarrow.parquet as pq
+
+    folder = f"{input_prefix}/{COLUMNAR_FOLDER}/" + (f"{dataset}/" if dataset else "")
+    part_keys = [key for key in list_s3_keys(bucket, folder) if key.endswith(".parquet")]
+    filters = [("page", "in", sorted(pages))] if pages is not None else None
+
+    def read_part(key):
+        with span("s3.get", key=key):
+            body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+        count("bytes_read", len(body), source="s3")
+        return pq.read_table(io.BytesIO(body), filters=filters).to_pylist()
+
+    documents = {}
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="s3-fetch") as executor:
+        for rows in executor.map(read_part, part_keys):
+            for row in rows:
+                keys, fetched = documents.setdefault(row["doc_id"], ([], {}))
+                # Same names the per-object layout uses, so image manifests resolve against input_prefix
+                suffix = f"_{row['seq']}" if row["seq"] else ""
+                if row["table"] is not None:
+                    key = f"{input_prefix}/page_{row['page']}_{row['kind']}{suffix}.csv"
+                    if key in fetched:
+                        continue
+                    buffer = io.StringIO()
+                    csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(row["table"])
+                    fetched[key] = buffer.getvalue()
+                else:
+                    key = f"{input_prefix}/page_{row['page']}_{row['kind']}{suffix}.{'json' if row['kind'] in JSON_KINDS else 'txt'}"
+                    if key in fetched:
+                        continue
+                    fetched[key] = row["text"]
+                keys.append(key)
+    return {doc_id: (group_keys_by_page(keys), fetched) for doc_id, (keys, fetched) in documents.items()}
+
+
+def create_markdown_from_parquet(bucket, input_prefix, output_prefix, dataset=None, pages=None):
+    """Create markdown files from the columnar dataset instead of listing and fetching per-page objects.
+
+    Pages of a single document go to output_prefix/page_{n}.md as with create_markdown_from_s3;
+    when the dataset holds a batch, each document gets its own output_prefix/{doc_id}/ folder.
+    """
     try:
-        response = s3.list_objects_v2(Bucket=bucket, Prefix=input_prefix)
-        files = response.get('Contents', [])
-        
-        pages = {}
-        for file in files:
-            filename = file['Key'].split('/')[-1]
-            if filename.startswith("page_"):
-                page_num = filename.split("_")[1].split(".")[0]  # Get page number
-                if page_num not in pages:
-                    pages[page_num] = {"text": [], "tables": [], "images": []}
-                
-                if filename.endswith("_text.txt"):
-                    pages[page_num]["text"].append(file['Key'])
-                elif filename.endswith(".csv"):
-                    pages[page_num]["tables"].append(file['Key'])
-                elif any(filename.endswith(ext) for ext in ['.png', '.jpg', '.jpeg']):
-                    pages[page_num]["images"].append(file['Key'])
-        
-        for page_num, content in pages.items():
-            markdown_content = f"# Page {page_num}\n\n"
-            
-            if content["text"]:
-                markdown_content += "## Text Content\n\n"
-                for text_file in content["text"]:
-                    text_data = download_s3_file(bucket, text_file)
-                    markdown_content += f"{text_data}\n\n"
-            
-            if content["tables"]:
-                markdown_content += "## Tables\n\n"
-                for table_file in content["tables"]:
-                    table_data = download_s3_file(bucket, table_file)
-                    df = pd.read_csv(io.StringIO(table_data))
-                    markdown_content += f"### {table_file}\n\n"
-                    markdown_content += df.to_markdown(index=False) + "\n\n"
-            
-            if content["images"]:
-                markdown_content += "## Images\n\n"
-                for image_file in content["images"]:
-                    markdown_content += f"![{image_file}](s3://{bucket}/{image_file})\n\n"
-            
-            markdown_filename = f"page_{page_num}.md"
-            markdown_key = f"{output_prefix}/{markdown_filename}"
-            
-            s3.put_object(Bucket=bucket, Key=markdown_key, Body=markdown_content.encode("utf-8"))
-            print(f"Markdown file {markdown_filename} uploaded to S3://{bucket}/{markdown_key}")
-        
+        documents = read_columnar_pages(bucket, input_prefix, dataset, pages)
+
+        with markdown_uploader(bucket) as uploader:
+            for doc_id, (grouped, fetched) in documents.items():
+                document_prefix = output_prefix if len(documents) == 1 else f"{output_prefix}/{doc_id}"
+                for page_num, content in grouped.items():
+                    with span("markdown.page", page=page_num):
+                        markdown_content = render_page_markdown(bucket, page_num, content, fetched)
+                    uploader.upload_bytes(markdown_content.encode("utf-8"), f"{document_prefix}/page_{page_num}.md",
+                                          content_type="text/markdown")
+
+            report = uploader.flush()
+        report.raise_for_failures()
+        print(f"{report.uploaded} markdown files uploaded to S3://{bucket}/{output_prefix}")
+
     except Exception as e:
         print(f"Error creating markdown files: {e}")
 
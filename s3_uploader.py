@@ -0,0 +1,188 @@
+import io
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from dotenv import load_dotenv
+from instrumentation import count, instrument_s3_client, span
+
+# Load environment variables
+load_dotenv()
+
+# Defaults, overridable through the environment
+DEFAULT_MAX_WORKERS = int(os.getenv('S3_UPLOAD_WORKERS', '16'))
+DEFAULT_MAX_PENDING = int(os.getenv('S3_UPLOAD_MAX_PENDING', '256'))
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+UploadFailure = namedtuple("UploadFailure", ["key", "source", "error"])
+
+
+class UploadError(Exception):
+    """Raised by flush/close when one or more objects failed to upload."""
+
+    def __init__(self, failures):
+        self.failures = list(failures)
+        details = "; ".join(f"{failure.key}: {failure.error}" for failure in self.failures[:5])
+        more = f" (+{len(self.failures) - 5} more)" if len(self.failures) > 5 else ""
+        super().__init__(f"{len(self.failures)} upload(s) failed: {details}{more}")
+
+    def __reduce__(self):
+        # Keep the failure list when the error crosses a process pool boundary
+        return (UploadError, (self.failures,))
+
+
+class UploadReport:
+    """Outcome of all uploads submitted since the previous flush."""
+
+    def __init__(self, uploaded, bytes_uploaded, failures):
+        self.uploaded = uploaded
+        self.bytes_uploaded = bytes_uploaded
+        self.failures = failures
+
+    @property
+    def ok(self):
+        return not self.failures
+
+    def raise_for_failures(self):
+        if self.failures:
+            raise UploadError(self.failures)
+
+    def __repr__(self):
+        return f"UploadReport(uploaded={self.uploaded}, bytes={self.bytes_uploaded}, failed={len(self.failures)})"
+
+
+class S3Uploader:
+    """Background S3 uploads on a bounded thread pool sharing one pooled client.
+
+    upload_file/upload_bytes return immediately with a future; once max_pending uploads are
+    in flight they block until a slot frees up, so extraction can't outrun the network
+    without bound. Objects above multipart_threshold go through boto3's managed multipart
+    transfer. flush() waits for everything submitted so far and returns an UploadReport with
+    the per-object failures.
+
+    Pass client= to run against a stand-in such as moto.
+    """
+
+    def __init__(self, bucket, client=None, max_workers=DEFAULT_MAX_WORKERS, max_pending=DEFAULT_MAX_PENDING,
+                 multipart_threshold=MULTIPART_THRESHOLD):
+        self.bucket = bucket
+        self.client = client or boto3.Session(
+            aws_access_key_id=os.getenv('AWS_SERVER_PUBLIC_KEY'),
+            aws_secret_access_key=os.getenv('AWS_SERVER_SECRET_KEY'),
+        ).client('s3', config=Config(
+            # One connection per upload thread plus headroom for multipart parts
+            max_pool_connections=max_workers * 2,
+            retries={'max_attempts': 5, 'mode': 'adaptive'},
+        ))
+        instrument_s3_client(self.client)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_threshold,
+            max_concurrency=4,
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-upload")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self._uploaded = 0
+        self._bytes = 0
+        self._failures = []
+
+    def _run(self, key, source, size, upload):
+        try:
+            with span("s3.upload", key=key, bytes=size):
+                upload()
+            count("bytes_written", size, destination="s3")
+            with self._lock:
+                self._uploaded += 1
+                self._bytes += size
+        except Exception as e:
+            with self._lock:
+                self._failures.append(UploadFailure(key, source, e))
+        finally:
+            self._slots.release()
+
+    def _submit(self, key, source, size, upload):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._run, key, source, size, upload)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.append(future)
+        return future
+
+    def upload_file(self, file_path, key):
+        """Queue a local file for upload to s3://bucket/key."""
+        return self._submit(key, file_path, os.path.getsize(file_path), lambda: self.client.upload_file(
+            file_path, self.bucket, key, Config=self.transfer_config))
+
+    def upload_bytes(self, data, key, content_type=None):
+        """Queue an in-memory payload (bytes or str) for upload to s3://bucket/key."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        extra_args = {'ContentType': content_type} if content_type else None
+        return self._submit(key, "<memory>", len(data), lambda: self.client.upload_fileobj(
+            io.BytesIO(data), self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config))
+
+    def upload_stream(self, fileobj, key, content_type=None):
+        """Queue a seekable file object for upload to s3://bucket/key; it is closed once uploaded."""
+        size = fileobj.seek(0, io.SEEK_END)
+        fileobj.seek(0)
+        extra_args = {'ContentType': content_type} if content_type else None
+
+        def upload():
+            with fileobj:
+                self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+
+        return self._submit(key, "<stream>", size, upload)
+
+    def flush(self):
+        """Wait for every queued upload and return the report for them."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+        with self._lock:
+            report = UploadReport(self._uploaded, self._bytes, self._failures)
+            self._reset_counters()
+        return report
+
+    def close(self):
+        """Flush, stop the worker threads and raise UploadError if anything failed."""
+        report = self.flush()
+        self._executor.shutdown(wait=True)
+        report.raise_for_failures()
+        return report
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.flush()
+            self._executor.shutdown(wait=True)
+
+
+_shared_uploader = None
+_shared_pid = None
+_shared_lock = threading.Lock()
+
+
+def get_uploader():
+    """Process-wide uploader for AWS_BUCKET_NAME, recreated after a fork."""
+    global _shared_uploader, _shared_pid
+    with _shared_lock:
+        if _shared_uploader is None or _shared_pid != os.getpid():
+            _shared_uploader = S3Uploader(os.getenv('AWS_BUCKET_NAME'))
+            _shared_pid = os.getpid()
+        return _shared_uploader
@@ -0,0 +1,380 @@
+import argparse
+import heapq
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from extraction_cache import file_sha256
+from extraction_engine import PageHandler
+from instrumentation import count, span
+
+# Search index configuration (pages are only indexed when SEARCH_INDEX_PATH is set)
+SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH') or None
+# Matches BM25-ranked per query, newest first; beyond this a query is answered from the newest ones
+SEARCH_MAX_CANDIDATES = int(os.getenv('SEARCH_MAX_CANDIDATES', '5000'))
+
+# Page counts per query word are cached this long (seconds)
+FREQUENCY_CACHE_SECONDS = 300
+# Pages are written in one transaction per this many pages
+INDEX_BATCH_PAGES = 64
+# Snippet length in tokens and its match markers
+SNIPPET_TOKENS = 24
+SNIPPET_MARKERS = ("<mark>", "</mark>")
+# Marks matches in highlight() output so their offsets can be recovered
+_MATCH = re.compile("\x02([^\x03]*)\x03")
+_TERM = re.compile(r"\w+")
+
+# One row (and one FTS5 document) per page; "blocks" holds [start, end, bbox] of every text
+# block in the page text, so matches resolve to blocks without a row per block. Documents are
+# keyed by their sha256; s3_prefix is where their artifacts were written.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    source TEXT,
+    pages INTEGER,
+    indexed_at REAL,
+    s3_prefix TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    blocks TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS pages_by_document ON pages (doc_id, page);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+    text, content='pages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS pages_fts_insert AFTER INSERT ON pages BEGIN
+    INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS pages_fts_delete AFTER DELETE ON pages BEGIN
+    INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+def page_blocks(text_dict):
+    """(text, bbox) of every non-empty text block of a page.get_text("dict") result."""
+    blocks = []
+    for block in text_dict["blocks"]:
+        if block.get("type", 0) != 0:
+            continue
+        text = "\n".join("".join(span["text"] for span in line["spans"]) for line in block["lines"]).strip()
+        if text:
+            blocks.append((text, [round(value, 1) for value in block["bbox"]]))
+    return blocks
+
+
+def query_phrases(query):
+    """The words of a free-text query as quoted FTS5 phrases, all of which have to match."""
+    return list(dict.fromkeys(f'"{term}"' for term in _TERM.findall(query)))
+
+
+def _match_offsets(highlighted):
+    """(start, end) of every match in the page text, from highlight() output."""
+    offsets, markers = [], 0
+    for match in _MATCH.finditer(highlighted):
+        start = match.start() - markers
+        offsets.append((start, start + len(match.group(1))))
+        markers += 2
+    return offsets
+
+
+class SearchIndex:
+    """SQLite FTS5 index of page text blocks, keyed by (document, page, block).
+
+    index_pages() replaces the rows of the given pages only, so re-indexing a document
+    rewrites that document's postings and nothing else; pages whose text did not change
+    are left alone. The database runs in WAL mode so several extraction workers can index
+    while the API searches.
+    """
+
+    def __init__(self, path, max_candidates=SEARCH_MAX_CANDIDATES):
+        self.path = path
+        self.max_candidates = max_candidates
+        self._local = threading.local()
+        # (computed at, indexed pages, {phrase: pages containing it})
+        self._frequencies = None
+
+    @property
+    def connection(self):
+        # sqlite3 connections are per thread; the API searches from its thread pool
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA mmap_size=268435456")
+            connection.executescript(SCHEMA)
+            self._add_s3_prefix(connection)
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _add_s3_prefix(connection):
+        # Indexes created before documents had an s3_prefix used the prefix as doc_id
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if "s3_prefix" not in {row[1] for row in connection.execute("PRAGMA table_info(documents)")}:
+                connection.execute("ALTER TABLE documents ADD COLUMN s3_prefix TEXT")
+                connection.execute("UPDATE documents SET s3_prefix = doc_id")
+            connection.execute("CREATE INDEX IF NOT EXISTS documents_by_prefix ON documents (s3_prefix)")
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def index_pages(self, doc_id, pages, source=None, page_count=None, s3_prefix=None):
+        """Index {page_number: [(text, bbox), ...]} for doc_id and return the pages rewritten.
+
+        With page_count, rows of pages past the end of the document are removed as well.
+        """
+        connection = self.connection
+        rewritten = unchanged = 0
+        with span("index.write", pages=len(pages)):
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "INSERT INTO documents (doc_id, source, pages, indexed_at, s3_prefix) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (doc_id) DO UPDATE SET source = coalesce(excluded.source, source), "
+                    "pages = coalesce(excluded.pages, pages), indexed_at = excluded.indexed_at, "
+                    "s3_prefix = coalesce(excluded.s3_prefix, s3_prefix)",
+                    (doc_id, source, page_count, time.time(), s3_prefix))
+                for page_number, blocks in sorted(pages.items()):
+                    spans, start = [], 0
+                    for text, bbox in blocks:
+                        spans.append([start, start + len(text), bbox])
+                        start += len(text) + 1
+                    text = "\n".join(text for text, _ in blocks)
+                    encoded = json.dumps(spans)
+                    existing = connection.execute("SELECT id, blocks, text FROM pages WHERE doc_id = ? AND page = ?",
+                                                  (doc_id, page_number)).fetchone()
+                    if existing is not None:
+                        if existing[1] == encoded and existing[2] == text:
+                            unchanged += 1
+                            continue
+                        connection.execute("DELETE FROM pages WHERE id = ?", (existing[0],))
+                    connection.execute("INSERT INTO pages (doc_id, page, blocks, text) VALUES (?, ?, ?, ?)",
+                                       (doc_id, page_number, encoded, text))
+                    rewritten += 1
+                if page_count is not None:
+                    rewritten += connection.execute("DELETE FROM pages WHERE doc_id = ? AND page > ?",
+                                                    (doc_id, page_count)).rowcount
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        self._frequencies = None
+        count("index_pages", unchanged, result="unchanged")
+        count("index_pages", rewritten, result="rewritten")
+        return rewritten
+
+    def set_source(self, doc_id, source):
+        """Record where doc_id came from (a URL, upload name or S3 key) for search results."""
+        self.connection.execute(
+            "INSERT INTO documents (doc_id, source, indexed_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (doc_id) DO UPDATE SET source = excluded.source", (doc_id, source, time.time()))
+
+    def rename_document(self, old_doc_id, doc_id):
+        """Move the pages of old_doc_id (an earlier version of the document) to doc_id, for
+        runs that only re-index the pages that changed; returns how many moved."""
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Pages doc_id already has win over the older version's
+            connection.execute("DELETE FROM pages WHERE doc_id = ? AND page IN (SELECT page FROM pages WHERE doc_id = ?)",
+                               (old_doc_id, doc_id))
+            moved = connection.execute("UPDATE pages SET doc_id = ? WHERE doc_id = ?", (doc_id, old_doc_id)).rowcount
+            connection.execute(
+                "INSERT INTO documents (doc_id, source, pages, indexed_at, s3_prefix) "
+                "SELECT ?, source, pages, indexed_at, s3_prefix FROM documents WHERE doc_id = ? "
+                "ON CONFLICT (doc_id) DO NOTHING", (doc_id, old_doc_id))
+            connection.execute("DELETE FROM documents WHERE doc_id = ?", (old_doc_id,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._frequencies = None
+        return moved
+
+    def remove_document(self, doc_id):
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            removed = connection.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,)).rowcount
+            connection.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return removed
+
+    def _page_frequencies(self, connection, phrases):
+        """Indexed page count and the number of pages containing each phrase, cached a while."""
+        now = time.monotonic()
+        cached = self._frequencies
+        if cached is None or now - cached[0] > FREQUENCY_CACHE_SECONDS:
+            cached = self._frequencies = (now, connection.execute("SELECT count(*) FROM pages").fetchone()[0], {})
+        _, total, frequencies = cached
+        for phrase in phrases:
+            if phrase not in frequencies:
+                frequencies[phrase] = connection.execute("SELECT count(*) FROM pages_fts WHERE pages_fts MATCH ?",
+                                                         (phrase,)).fetchone()[0]
+        return total, frequencies
+
+    def optimize(self):
+        """Merge the index segments into one; worth running after a large batch."""
+        self.connection.execute("INSERT INTO pages_fts (pages_fts) VALUES ('optimize')")
+
+    def search(self, query, limit=10, offset=0, doc_id=None):
+        """Pages matching every word of query, best BM25 score first.
+
+        Each hit has the document, page, score, a snippet and the matched blocks with their
+        bbox, text and match offsets (relative to the block text). At most max_candidates
+        matching pages are ranked, the most recently indexed ones; "exhaustive" is False
+        when the query matched more pages than that.
+
+        FTS5's bm25() gives a word on half the pages or more an idf of ~0 and counts the
+        pages of every query word on each call, which for such a word means reading its
+        whole doclist. Those words therefore only filter the candidates and the rest rank
+        them; a query made only of such words returns the newest matching pages.
+        """
+        started = time.perf_counter()
+        phrases = query_phrases(query)
+        result = {"query": query, "hits": [], "candidates": 0, "exhaustive": True}
+        if not phrases:
+            return result
+        connection = self.connection
+        match = " ".join(phrases)
+        with span("index.search"):
+            total, frequencies = self._page_frequencies(connection, phrases)
+            ranking = [phrase for phrase in phrases if frequencies[phrase] * 2 < total]
+            # Newest candidates first: FTS5 streams rowids in order, whereas ORDER BY rank
+            # would score every match before returning the first one
+            rank_column = "rank" if ranking == phrases else "0"
+            if doc_id is None:
+                candidates = connection.execute(
+                    f"SELECT rowid, {rank_column} FROM pages_fts WHERE pages_fts MATCH ? ORDER BY rowid DESC LIMIT ?",
+                    (match, self.max_candidates)).fetchall()
+            else:
+                candidates = connection.execute(
+                    f"SELECT pages_fts.rowid, {rank_column} FROM pages_fts JOIN pages ON pages.id = pages_fts.rowid "
+                    "WHERE pages_fts MATCH ? AND pages.doc_id = ? ORDER BY pages_fts.rowid DESC LIMIT ?",
+                    (match, doc_id, self.max_candidates)).fetchall()
+            if ranking and ranking != phrases and candidates:
+                # Score the candidates on the ranking words alone, over the rowid range they span
+                ranks = dict(connection.execute(
+                    "SELECT rowid, rank FROM pages_fts WHERE pages_fts MATCH ? AND rowid BETWEEN ? AND ?",
+                    (" ".join(ranking), candidates[-1][0], candidates[0][0])).fetchall())
+                candidates = [(rowid, ranks[rowid]) for rowid, _ in candidates]
+            # Stable, so equal scores keep the newest page first
+            top = heapq.nsmallest(offset + limit, candidates, key=lambda candidate: candidate[1])[offset:]
+            result["candidates"] = len(candidates)
+            result["exhaustive"] = len(candidates) < self.max_candidates
+            if top:
+                placeholders = ",".join("?" * len(top))
+                rows = connection.execute(
+                    "SELECT pages.id, pages.doc_id, pages.page, pages.blocks, pages.text, documents.source, "
+                    "documents.s3_prefix, "
+                    "highlight(pages_fts, 0, char(2), char(3)), snippet(pages_fts, 0, ?, ?, '…', ?) "
+                    "FROM pages_fts JOIN pages ON pages.id = pages_fts.rowid "
+                    "LEFT JOIN documents ON documents.doc_id = pages.doc_id "
+                    f"WHERE pages_fts MATCH ? AND pages_fts.rowid IN ({placeholders})",
+                    (*SNIPPET_MARKERS, SNIPPET_TOKENS, match, *(rowid for rowid, _ in top))).fetchall()
+                details = {row[0]: row for row in rows}
+                result["hits"] = [self._hit(details[rowid], rank) for rowid, rank in top if rowid in details]
+        result["seconds"] = round(time.perf_counter() - started, 6)
+        return result
+
+    @staticmethod
+    def _hit(row, rank):
+        _, doc_id, page, blocks, text, source, s3_prefix, highlighted, snippet = row
+        blocks = json.loads(blocks)
+        starts = [start for start, _, _ in blocks]
+        matched = {}
+        for start, end in _match_offsets(highlighted):
+            index = bisect_right(starts, start) - 1
+            if index < 0:
+                continue
+            block_start, block_end, bbox = blocks[index]
+            entry = matched.setdefault(index, {"block": index, "bbox": bbox, "text": text[block_start:block_end],
+                                               "matches": []})
+            entry["matches"].append([start - block_start, min(end, block_end) - block_start])
+        # bm25() is lower for better matches
+        return {"doc_id": doc_id, "source": source, "s3_prefix": s3_prefix, "page": page, "score": -rank,
+                "snippet": snippet,
+                "blocks": [matched[index] for index in sorted(matched)]}
+
+
+_shared_index = None
+_shared_pid = None
+_shared_lock = threading.Lock()
+
+
+def get_index():
+    """Process-wide SearchIndex at SEARCH_INDEX_PATH, or None when indexing is off."""
+    global _shared_index, _shared_pid
+    if not SEARCH_INDEX_PATH:
+        return None
+    with _shared_lock:
+        if _shared_index is None or _shared_pid != os.getpid():
+            _shared_index = SearchIndex(SEARCH_INDEX_PATH)
+            _shared_pid = os.getpid()
+        return _shared_index
+
+
+class SearchIndexHandler(PageHandler):
+    """Indexes the text blocks of every visited page under doc_id, the document's sha256
+    (hashed from the file when not given), recording s3_prefix as where its artifacts are."""
+
+    name = "index"
+
+    def __init__(self, doc_id=None, s3_prefix=None, index=None, batch_pages=INDEX_BATCH_PAGES):
+        super().__init__()
+        self.doc_id = doc_id
+        self.s3_prefix = s3_prefix
+        self.index = index or get_index()
+        self.batch_pages = batch_pages
+        self._pending = {}
+        self._source = self._page_count = None
+
+    def start(self, document):
+        if self.doc_id is None:
+            self.doc_id = file_sha256(document.name)
+        self._pending = {}
+        self._source = os.path.basename(document.name) if document.name else None
+        self._page_count = len(document)
+
+    def handle_page(self, ctx):
+        self._pending[ctx.page_number] = page_blocks(ctx.text_dict)
+        if len(self._pending) >= self.batch_pages:
+            self._write()
+
+    def finish(self):
+        self._write()
+
+    def _write(self):
+        pages, self._pending = self._pending, {}
+        self.index.index_pages(self.doc_id, pages, self._source, self._page_count, self.s3_prefix)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the page index built by the extraction pipeline.")
+    parser.add_argument("query")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--doc-id")
+    parser.add_argument("--index", default=SEARCH_INDEX_PATH, required=SEARCH_INDEX_PATH is None,
+                        help="index database (default: SEARCH_INDEX_PATH)")
+    args = parser.parse_args()
+
+    result = SearchIndex(args.index).search(args.query, args.limit, doc_id=args.doc_id)
+    print(f"{len(result['hits'])} hits from {result['candidates']} candidate pages"
+          f"{'' if result['exhaustive'] else ' (newest only)'} in {result.get('seconds', 0) * 1000:.1f} ms")
+    for hit in result["hits"]:
+        print(f"{hit['score']:>8.3f}  {hit['source'] or hit['doc_id']} p.{hit['page']} "
+              f"blocks {[block['block'] for block in hit['blocks']]}: {hit['snippet']}")
@@ -0,0 +1,75 @@
+from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from instrumentation import count
+
+# A raw image in a shared memory block: what crosses the process boundary instead of the pixels
+SharedImage = namedtuple("SharedImage", ["name", "width", "height", "mode", "stride"])
+
+# PIL mode by channel count of a PyMuPDF pixmap
+PIXMAP_MODES = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}
+CHANNELS = {"L": 1, "LA": 2, "RGB": 3, "RGBA": 4}
+
+
+def share_pixels(samples, width, height, mode, stride=None):
+    """Copy raw row-major pixels into a new shared memory block and return its handle.
+
+    The block outlives this call; whoever ends up owning the handle frees it with
+    release_image once the consumer is done.
+    """
+    stride = stride or width * CHANNELS[mode]
+    size = stride * height
+    block = shared_memory.SharedMemory(create=True, size=max(1, size))
+    try:
+        block.buf[:size] = samples
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    block.close()
+    count("shared_image_bytes", size)
+    return SharedImage(block.name, width, height, mode, stride)
+
+
+def share_pixmap(pixmap):
+    """Share a PyMuPDF pixmap's samples, copied once straight from MuPDF's buffer."""
+    return share_pixels(pixmap.samples_mv, pixmap.width, pixmap.height, PIXMAP_MODES[pixmap.n], pixmap.stride)
+
+
+def share_image(image):
+    """Share a PIL image (converted to RGB unless it is L, LA, RGB or RGBA)."""
+    if image.mode not in CHANNELS:
+        image = image.convert("RGB")
+    return share_pixels(image.tobytes(), image.width, image.height, image.mode)
+
+
+@contextmanager
+def attached_image(handle, release=False):
+    """PIL image reading the shared block in place, valid inside the with block only.
+
+    With release, the block is freed on the way out (for consumers that own the handle).
+    """
+    from PIL import Image
+
+    block = shared_memory.SharedMemory(name=handle.name)
+    image = Image.frombuffer(handle.mode, (handle.width, handle.height), block.buf, "raw", handle.mode,
+                             handle.stride, 1)
+    try:
+        yield image
+    finally:
+        # The image holds an export of the block's buffer, which must go before the block closes
+        image.close()
+        del image
+        block.close()
+        if release:
+            block.unlink()
+
+
+def release_image(handle):
+    """Free a shared image; a block that is already gone is ignored."""
+    try:
+        block = shared_memory.SharedMemory(name=handle.name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
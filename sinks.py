@@ -0,0 +1,287 @@
+import csv
+import hashlib
+import io
+import os
+import re
+from itertools import groupby
+from botocore.exceptions import ClientError
+from instrumentation import count
+from s3_uploader import get_uploader
+
+
+class ArtifactSink:
+    """Destination for extracted artifacts, written straight from the extractor's buffer.
+
+    write() takes an artifact name such as page_3_text.txt and its bytes (str is encoded as
+    UTF-8) and returns where the artifact ended up. flush() makes sure everything written so
+    far has reached the destination.
+    """
+
+    def write(self, name, data):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def exists(self, name):
+        """Whether an artifact called name is already at the destination."""
+        return False
+
+
+def _as_bytes(data):
+    return data.encode("utf-8") if isinstance(data, str) else data
+
+
+class LocalDiskSink(ArtifactSink):
+    """Writes artifacts into a local folder."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def write(self, name, data):
+        path = os.path.join(self.folder, name)
+        if os.path.dirname(name):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = _as_bytes(data)
+        with open(path, "wb") as fp:
+            fp.write(payload)
+        count("bytes_written", len(payload), destination="disk")
+        return path
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.folder, name))
+
+
+class S3Sink(ArtifactSink):
+    """Queues artifacts on the S3 uploader under prefix/name, without a temp file."""
+
+    def __init__(self, prefix, uploader=None):
+        self.prefix = prefix
+        self.uploader = uploader
+
+    def write(self, name, data):
+        key = f"{self.prefix}/{name}"
+        (self.uploader or get_uploader()).upload_bytes(_as_bytes(data), key)
+        return key
+
+    def flush(self):
+        report = (self.uploader or get_uploader()).flush()
+        report.raise_for_failures()
+        return report
+
+    def exists(self, name):
+        uploader = self.uploader or get_uploader()
+        try:
+            uploader.client.head_object(Bucket=uploader.bucket, Key=f"{self.prefix}/{name}")
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+
+class MemorySink(ArtifactSink):
+    """Keeps artifacts in a dict, in write order. Only useful within a single process."""
+
+    def __init__(self):
+        self.artifacts = {}
+
+    def write(self, name, data):
+        self.artifacts[name] = _as_bytes(data)
+        return name
+
+    def exists(self, name):
+        return name in self.artifacts
+
+
+class TeeSink(ArtifactSink):
+    """Writes every artifact to several sinks; the first sink's location is returned."""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, name, data):
+        locations = [sink.write(name, data) for sink in self.sinks]
+        return locations[0]
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def exists(self, name):
+        return all(sink.exists(name) for sink in self.sinks)
+
+
+class ContentStore:
+    """Writes each distinct payload once, as folder/<sha256>.<ext> on a sink.
+
+    known holds the names that are safely at the destination; with check_existing the sink
+    is asked about any other name first, so payloads stored by earlier runs or other
+    documents are not written again. Pass the same `known` set to several stores to share
+    it. Names this store writes only join known in flush(), once the sink flushed without
+    errors, so a failed upload is retried by the next document rather than assumed done.
+
+    mirror, if given, is a sink (a local copy, a cache staging folder) that receives every
+    payload this store sees once, whatever known says.
+    """
+
+    def __init__(self, sink, folder, check_existing=False, known=None, mirror=None):
+        self.sink = sink
+        self.folder = folder
+        self.check_existing = check_existing
+        self.known = known if known is not None else set()
+        self.mirror = mirror
+        # Names handled by this store, and those of them written to sink since the last flush
+        self._seen = set()
+        self._written = set()
+
+    def put(self, data, ext):
+        """Return (name, location) where location is None if nothing had to be written."""
+        name = f"{self.folder}/{hashlib.sha256(data).hexdigest()}.{ext}"
+        if name in self._seen:
+            count("cache", cache="images", result="hit")
+            return name, None
+        self._seen.add(name)
+        if self.mirror is not None:
+            self.mirror.write(name, data)
+        if name in self.known:
+            count("cache", cache="images", result="hit")
+            return name, None
+        if self.check_existing and self.sink.exists(name):
+            self.known.add(name)
+            count("cache", cache="images", result="hit")
+            return name, None
+        count("cache", cache="images", result="miss")
+        self._written.add(name)
+        return name, self.sink.write(name, data)
+
+    def __len__(self):
+        """Distinct payloads this store has seen."""
+        return len(self._seen)
+
+    def flush(self):
+        """Flush the sink and the mirror, then record what was written as stored."""
+        self.sink.flush()
+        if self.mirror is not None:
+            self.mirror.flush()
+        self.known.update(self._written)
+        self._written.clear()
+
+
+# Folder under the artifact prefix holding the columnar datasets, one sub-folder per document
+COLUMNAR_FOLDER = "columnar"
+# Pages per Parquet row group, so readers can skip page ranges by row-group statistics
+ROW_GROUP_PAGES = 64
+PAGE_ARTIFACT = re.compile(r"^page_(\d+)_(\w+?)\.(txt|csv|json)$")
+
+
+def columnar_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("doc_id", pa.string()),
+        ("page", pa.int32()),
+        ("kind", pa.string()),
+        ("seq", pa.int32()),
+        ("text", pa.string()),
+        ("table", pa.list_(pa.list_(pa.string()))),
+    ])
+
+
+def delete_columnar_parts(prefix, doc_id, dataset=None, uploader=None):
+    """Delete the part files doc_id has in its dataset under prefix; returns how many."""
+    uploader = uploader or get_uploader()
+    part_prefix = f"{prefix}/{COLUMNAR_FOLDER}/{dataset or doc_id}/{doc_id}-"
+    keys = []
+    for response in uploader.client.get_paginator("list_objects_v2").paginate(Bucket=uploader.bucket, Prefix=part_prefix):
+        keys.extend(item["Key"] for item in response.get("Contents", []) if item["Key"].endswith(".parquet"))
+    # DeleteObjects takes at most 1000 keys
+    for start in range(0, len(keys), 1000):
+        response = uploader.client.delete_objects(Bucket=uploader.bucket, Delete={
+            "Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True})
+        if response.get("Errors"):
+            raise RuntimeError(f"Failed to delete {len(response['Errors'])} parts, first: {response['Errors'][0]}")
+    return len(keys)
+
+
+class ParquetSink(ArtifactSink):
+    """Collects per-page text, lists, tables and image manifests as rows of a Parquet dataset.
+
+    Rows are (doc_id, page, kind, seq, text, table): kind is what followed page_{n}_ in the
+    artifact name ("text", "lists", "table", "images"), seq numbers repeated artifacts of a
+    page such as several tables, and table holds CSV payloads as a list of rows. Anything
+    that is not a per-page artifact (content-addressed images) goes to `passthrough`.
+
+    flush() writes the buffered rows as one part file,
+    {prefix}/columnar/{dataset}/{doc_id}-{label}-p{first}-{last}.parquet, sorted by page with
+    one row group per ROW_GROUP_PAGES pages. Part names follow the page chunks of a run, so a
+    rerun with other chunks (another worker count, a cache replay) must first remove the
+    document's old parts with delete_columnar_parts. dataset defaults to doc_id (one dataset per document); give several documents the
+    same dataset to collect a whole batch in one place.
+    """
+
+    def __init__(self, prefix, doc_id, passthrough=None, label="pages", dataset=None, uploader=None):
+        self.prefix = prefix
+        self.doc_id = doc_id
+        self.dataset = dataset or doc_id
+        self.passthrough = passthrough
+        self.label = label
+        self.uploader = uploader
+        self._rows = []
+        self._seq = {}
+
+    @property
+    def dataset_prefix(self):
+        return f"{self.prefix}/{COLUMNAR_FOLDER}/{self.dataset}"
+
+    def write(self, name, data):
+        match = PAGE_ARTIFACT.match(name)
+        if match is None:
+            if self.passthrough is None:
+                raise ValueError(f"ParquetSink has no passthrough sink for {name}")
+            return self.passthrough.write(name, data)
+
+        page, kind, ext = int(match.group(1)), match.group(2), match.group(3)
+        text = data.decode("utf-8") if isinstance(data, bytes) else data
+        seq = self._seq.get((page, kind), 0)
+        self._seq[(page, kind)] = seq + 1
+        if ext == "csv":
+            self._rows.append((page, kind, seq, None, list(csv.reader(io.StringIO(text)))))
+        else:
+            self._rows.append((page, kind, seq, text, None))
+        return f"{self.dataset_prefix}#{name}"
+
+    def to_parquet(self):
+        """(first page, last page, Parquet bytes) of the buffered rows, or None when empty; clears the buffer."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._rows:
+            return None
+        rows, self._rows, self._seq = sorted(self._rows, key=lambda row: row[:3]), [], {}
+        schema = columnar_schema()
+        buffer = io.BytesIO()
+        with pq.ParquetWriter(buffer, schema, compression="zstd") as writer:
+            for _, group in groupby(rows, key=lambda row: (row[0] - 1) // ROW_GROUP_PAGES):
+                page, kind, seq, text, table = zip(*group)
+                writer.write_table(pa.table([[self.doc_id] * len(page), page, kind, seq, text, table], schema=schema),
+                                   row_group_size=len(page))
+        return rows[0][0], rows[-1][0], buffer.getvalue()
+
+    def flush(self):
+        written = self.to_parquet()
+        if written is not None:
+            first_page, last_page, data = written
+            key = f"{self.dataset_prefix}/{self.doc_id}-{self.label}-p{first_page}-{last_page}.parquet"
+            (self.uploader or get_uploader()).upload_bytes(data, key, content_type="application/vnd.apache.parquet")
+        if self.passthrough is not None:
+            self.passthrough.flush()
+        report = (self.uploader or get_uploader()).flush()
+        report.raise_for_failures()
+        return report
+
+    def exists(self, name):
+        if PAGE_ARTIFACT.match(name) is None and self.passthrough is not None:
+            return self.passthrough.exists(name)
+        return False
@@ -0,0 +1,164 @@
+import csv
+import io
+from itertools import chain
+from operator import attrgetter
+import numpy as np
+import pandas as pd
+
+
+class TableBatch:
+    """Many tables reconstructed into one flat, preallocated array of cell strings.
+
+    Table i occupies values[offsets[i]:offsets[i + 1]] in row-major order with shape
+    shapes[i]; array(i) is a reshaped view, not a copy. Spanning cells are expanded into
+    every grid position they cover when built with fill_spans (the default), otherwise
+    only their top-left position holds the text. Empty positions are "".
+
+    Build one from Azure layout tables with from_azure() or from any DataFrames (camelot's
+    table.df, Docling's export_to_dataframe()) with from_frames(); export each table as CSV
+    with csv_payloads() or all of them at once as an Arrow table / Parquet file.
+    """
+
+    def __init__(self, values, shapes, pages=None):
+        self.values = values
+        self.shapes = np.asarray(shapes, dtype=np.int64).reshape(-1, 2)
+        self.offsets = np.concatenate(([0], np.cumsum(self.shapes[:, 0] * self.shapes[:, 1])))
+        self.pages = np.asarray(pages if pages is not None else np.zeros(len(self.shapes)), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    @classmethod
+    def from_cells(cls, shapes, table, row, column, content, row_span=None, column_span=None, pages=None,
+                   fill_spans=True):
+        """Build from parallel per-cell arrays; table is the index of the table each cell belongs to.
+
+        Cells whose row or column lies outside their table's shape are dropped, and spans are
+        clipped at the table's edge.
+        """
+        shapes = np.asarray(shapes, dtype=np.int64).reshape(-1, 2)
+        offsets = np.concatenate(([0], np.cumsum(shapes[:, 0] * shapes[:, 1])))
+        values = np.full(offsets[-1], "", dtype=object)
+
+        table = np.asarray(table, dtype=np.int64)
+        row = np.asarray(row, dtype=np.int64)
+        column = np.asarray(column, dtype=np.int64)
+        content = np.asarray(content, dtype=object)
+        if len(table) == 0:
+            return cls(values, shapes, pages)
+
+        if row_span is None or not fill_spans:
+            row_span = np.ones_like(row)
+        if column_span is None or not fill_spans:
+            column_span = np.ones_like(column)
+        row_span = np.maximum(np.asarray(row_span, dtype=np.int64), 1)
+        column_span = np.maximum(np.asarray(column_span, dtype=np.int64), 1)
+        # A cell outside the declared table size has no grid position to go to
+        inside = (row >= 0) & (row < shapes[table, 0]) & (column >= 0) & (column < shapes[table, 1])
+        if not inside.all():
+            table, row, column, content = table[inside], row[inside], column[inside], content[inside]
+            row_span, column_span = row_span[inside], column_span[inside]
+        # Clip spans that run past the declared table size instead of writing into the next table
+        row_span = np.minimum(row_span, shapes[table, 0] - row)
+        column_span = np.minimum(column_span, shapes[table, 1] - column)
+
+        # One entry per covered grid position: repeat each cell by its area, then recover the
+        # position inside the span from the running index
+        area = row_span * column_span
+        cell = np.repeat(np.arange(len(table)), area)
+        local = np.arange(area.sum()) - np.repeat(np.cumsum(area) - area, area)
+        target_row = row[cell] + local // column_span[cell]
+        target_column = column[cell] + local % column_span[cell]
+        values[offsets[table[cell]] + target_row * shapes[table[cell], 1] + target_column] = content[cell]
+        return cls(values, shapes, pages)
+
+    @classmethod
+    def from_azure(cls, tables, fill_spans=True):
+        """Build from Azure Document Intelligence tables (AnalyzeResult.tables)."""
+        tables = list(tables or [])
+        cells = list(chain.from_iterable(table.cells for table in tables))
+
+        def integers(name):
+            return np.fromiter(map(attrgetter(name), cells), dtype=np.int64, count=len(cells))
+
+        def spans(name):
+            # Spans are None on the wire when they are 1; None becomes NaN in a float array
+            return np.nan_to_num(np.array(list(map(attrgetter(name), cells)), dtype=float), nan=1).astype(np.int64)
+
+        return cls.from_cells(
+            [(table.row_count, table.column_count) for table in tables],
+            np.repeat(np.arange(len(tables)), [len(table.cells) for table in tables]),
+            integers("row_index"),
+            integers("column_index"),
+            np.array(list(map(attrgetter("content"), cells)), dtype=object),
+            spans("row_span"),
+            spans("column_span"),
+            pages=[table.bounding_regions[0].page_number if table.bounding_regions else 1 for table in tables],
+            fill_spans=fill_spans,
+        )
+
+    @classmethod
+    def from_frames(cls, frames, pages=None):
+        """Build from DataFrames such as camelot's table.df (cells as strings)."""
+        frames = list(frames)
+        if not frames:
+            return cls(np.empty(0, dtype=object), np.empty((0, 2)), pages)
+        values = np.concatenate([frame.to_numpy(dtype=object).ravel() for frame in frames])
+        values[pd.isna(values)] = ""
+        return cls(values, [frame.shape for frame in frames], pages)
+
+    def array(self, index):
+        """Table index as a (rows, columns) object array view."""
+        return self.values[self.offsets[index]:self.offsets[index + 1]].reshape(self.shapes[index])
+
+    def frame(self, index):
+        return pd.DataFrame(self.array(index))
+
+    def rows(self, index):
+        return self.array(index).tolist()
+
+    def csv_payloads(self, quoting=csv.QUOTE_MINIMAL, lineterminator="\n"):
+        """CSV text of every table, without header or index (same layout as DataFrame.to_csv)."""
+        payloads = []
+        for index in range(len(self)):
+            buffer = io.StringIO()
+            csv.writer(buffer, quoting=quoting, lineterminator=lineterminator).writerows(self.array(index).tolist())
+            payloads.append(buffer.getvalue())
+        return payloads
+
+    def to_arrow(self):
+        """All tables as one long Arrow table: table, page, row, column, text."""
+        import pyarrow as pa
+
+        sizes = np.diff(self.offsets)
+        table = np.repeat(np.arange(len(self)), sizes)
+        position = np.arange(self.offsets[-1]) - self.offsets[table]
+        columns = self.shapes[table, 1]
+        return pa.table({
+            "table": pa.array(table, pa.int32()),
+            "page": pa.array(self.pages[table], pa.int32()),
+            "row": pa.array(position // columns, pa.int32()),
+            "column": pa.array(position % columns, pa.int32()),
+            "text": pa.array(self.values, pa.string()),
+        })
+
+    def to_parquet(self, destination=None):
+        """Write to_arrow() as Parquet to a path or file object; returns the bytes when destination is None."""
+        import pyarrow.parquet as pq
+
+        buffer = destination if destination is not None else io.BytesIO()
+        pq.write_table(self.to_arrow(), buffer, compression="zstd")
+        if destination is None:
+            return buffer.getvalue()
+
+    @classmethod
+    def from_arrow(cls, arrow_table):
+        """Inverse of to_arrow()."""
+        frame = arrow_table.to_pandas()
+        if frame.empty:
+            return cls(np.empty(0, dtype=object), np.empty((0, 2)))
+        grouped = frame.groupby("table", sort=True)
+        shapes = np.column_stack([grouped["row"].max().to_numpy() + 1, grouped["column"].max().to_numpy() + 1])
+        pages = grouped["page"].first().to_numpy()
+        return cls.from_cells(shapes, frame["table"].to_numpy(), frame["row"].to_numpy(), frame["column"].to_numpy(),
+                              frame["text"].fillna("").to_numpy(dtype=object), pages=pages, fill_spans=False)
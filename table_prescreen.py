@@ -0,0 +1,122 @@
+import argparse
+import statistics
+import time
+from collections import Counter, defaultdict, namedtuple
+from pdf_input import open_pdf
+
+# Pages scoring at or above this are handed to camelot
+DEFAULT_THRESHOLD = 0.25
+# Word x positions are snapped to this grid (points) when looking for column anchors
+ANCHOR_GRID = 4
+# A column anchor has to be shared by at least this many multi-cell lines
+MIN_ANCHOR_LINES = 3
+
+PageScore = namedtuple("PageScore", ["page_number", "score", "ruling_lines", "column_anchors", "multi_cell_lines", "numeric_ratio"])
+PrescreenResult = namedtuple("PrescreenResult", ["candidates", "ranked", "page_count", "skipped", "seconds"])
+
+
+def _ruling_lines(page):
+    """Count horizontal/vertical segments and thin rectangles among the page drawings."""
+    count = 0
+    for drawing in page.get_drawings():
+        for item in drawing["items"]:
+            if item[0] == "l":
+                p1, p2 = item[1], item[2]
+                if abs(p1.y - p2.y) < 1 or abs(p1.x - p2.x) < 1:
+                    count += 1
+            elif item[0] == "re":
+                rect = item[1]
+                if rect.height < 2 or rect.width < 2:
+                    count += 1
+                else:
+                    # A cell border drawn as a rectangle counts for its four sides
+                    count += 4
+    return count
+
+
+def _column_layout(words):
+    """Return (column anchors, multi-cell lines, numeric ratio) from page.get_text("words")."""
+    if not words:
+        return 0, 0, 0.0
+    # Group by baseline rather than by block/line: table cells are often separate blocks
+    lines = defaultdict(list)
+    for x0, y0, x1, y1, text, _, _, _ in words:
+        lines[round(y1 / 2)].append((x0, x1, y1 - y0, text))
+
+    gap = 1.5 * statistics.median(height for line in lines.values() for _, _, height, _ in line)
+    anchors = Counter()
+    multi_cell_lines = 0
+    for line in lines.values():
+        line.sort()
+        cells = [line[0][0]]
+        for (_, prev_x1, _, _), (x0, _, _, _) in zip(line, line[1:]):
+            if x0 - prev_x1 > gap:
+                cells.append(x0)
+        if len(cells) >= 2:
+            multi_cell_lines += 1
+            anchors.update({round(x / ANCHOR_GRID) for x in cells})
+
+    column_anchors = sum(1 for hits in anchors.values() if hits >= MIN_ANCHOR_LINES)
+    numeric = sum(1 for word in words if any(ch.isdigit() for ch in word[4]))
+    return column_anchors, multi_cell_lines, numeric / len(words)
+
+
+def score_page(page):
+    """Table likelihood of a page in [0, 1] from drawings and word geometry only."""
+    ruling_lines = _ruling_lines(page)
+    column_anchors, multi_cell_lines, numeric_ratio = _column_layout(page.get_text("words"))
+    score = (0.45 * min(1.0, ruling_lines / 8)
+             + 0.35 * min(1.0, column_anchors / 3) * min(1.0, multi_cell_lines / 3)
+             + 0.20 * numeric_ratio)
+    return PageScore(page.number + 1, round(score, 4), ruling_lines, column_anchors, multi_cell_lines, round(numeric_ratio, 4))
+
+
+def prescreen(file_path, threshold=DEFAULT_THRESHOLD):
+    """Rank pages by table likelihood and keep the ones worth running camelot on.
+
+    candidates are 1-based page numbers in page order; ranked lists every PageScore, most
+    table-like first; skipped is the number of pages camelot won't see.
+    """
+    start = time.perf_counter()
+    with open_pdf(file_path) as pdf_document:
+        scores = [score_page(page) for page in pdf_document]
+    candidates = [page_score.page_number for page_score in scores if page_score.score >= threshold]
+    ranked = sorted(scores, key=lambda page_score: page_score.score, reverse=True)
+    return PrescreenResult(candidates, ranked, len(scores), len(scores) - len(candidates), time.perf_counter() - start)
+
+
+def format_prescreen(result):
+    return (f"Table pre-screen: {len(result.candidates)}/{result.page_count} candidate pages, "
+            f"{result.skipped} skipped ({result.seconds:.2f}s)")
+
+
+if __name__ == "__main__":
+    # Compare the pre-screen with a full camelot run to measure recall and speed
+    import camelot
+
+    parser = argparse.ArgumentParser(description="Table pre-screen recall/speed check against a full camelot run.")
+    parser.add_argument("pdf")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--flavor", default="stream")
+    parser.add_argument("--min-accuracy", type=float, default=80)
+    args = parser.parse_args()
+
+    result = prescreen(args.pdf, args.threshold)
+    print(format_prescreen(result))
+
+    t0 = time.perf_counter()
+    tables = camelot.read_pdf(args.pdf, pages="all", flavor=args.flavor)
+    full_seconds = time.perf_counter() - t0
+    table_pages = {int(table.page) for table in tables if table.parsing_report["accuracy"] >= args.min_accuracy}
+
+    t0 = time.perf_counter()
+    if result.candidates:
+        camelot.read_pdf(args.pdf, pages=",".join(map(str, result.candidates)), flavor=args.flavor)
+    pruned_seconds = time.perf_counter() - t0 + result.seconds
+
+    found = table_pages & set(result.candidates)
+    recall = len(found) / len(table_pages) if table_pages else 1.0
+    print(f"Pages with tables (full run): {sorted(table_pages)}")
+    print(f"Missed by pre-screen: {sorted(table_pages - found)}")
+    print(f"Recall {recall:.2%}, full run {full_seconds:.2f}s, pruned run {pruned_seconds:.2f}s "
+          f"(x{full_seconds / pruned_seconds if pruned_seconds else float('inf'):.1f})")
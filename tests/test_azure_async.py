@@ -0,0 +1,147 @@
+"""azure_async against azure_fake and moto: chunk splitting, figure spooling and the merge.
+
+Run with: python -m pytest tests (needs pytest and moto; skipped without moto)
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+moto = pytest.importorskip("moto")
+
+import boto3
+import fitz  # PyMuPDF
+import azure_async
+from azure_async import absolute_figure_id, document_dir, extract_documents, split_pdf
+from azure_fake import FakeDocumentIntelligenceClient, make_pdf
+from s3_uploader import S3Uploader
+
+BUCKET = "azure-test"
+
+
+@pytest.fixture(autouse=True)
+def aws(monkeypatch):
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SERVER_PUBLIC_KEY", "AWS_SERVER_SECRET_KEY"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        yield
+
+
+def write_pdf(path, page_count, images_per_page=1):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(make_pdf(page_count, images_per_page))
+    return str(path)
+
+
+def write_noisy_pdf(path, page_count):
+    """PDF whose pages each carry an incompressible image, so its size grows with its pages."""
+    pdf_document = fitz.open()
+    for _ in range(page_count):
+        page = pdf_document.new_page()
+        pixmap = fitz.Pixmap(fitz.csRGB, 128, 128, os.urandom(128 * 128 * 3), False)
+        page.insert_image(fitz.Rect(72, 72, 328, 328), pixmap=pixmap)
+    pdf_document.save(str(path))
+    pdf_document.close()
+    return str(path)
+
+
+def body(uploader, key):
+    return uploader.client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+
+
+def run(pdf_paths, client, **kwargs):
+    uploader = S3Uploader(BUCKET)
+    return asyncio.run(extract_documents(pdf_paths, client=client, uploader=uploader, s3_base_dir="out", **kwargs)), uploader
+
+
+def test_small_document_is_sent_whole(tmp_path):
+    pdf_path = write_pdf(tmp_path / "small.pdf", 3)
+    chunks = split_pdf(pdf_path)
+    assert [(chunk.first_page, chunk.page_count) for chunk in chunks] == [(1, 3)]
+    with open(pdf_path, "rb") as f:
+        assert chunks[0].data == f.read()
+
+
+def test_chunks_respect_the_page_limit(tmp_path):
+    pdf_path = write_pdf(tmp_path / "long.pdf", 12)
+    chunks = split_pdf(pdf_path, max_pages=5)
+    assert [(chunk.first_page, chunk.page_count) for chunk in chunks] == [(1, 5), (6, 5), (11, 2)]
+
+
+def test_chunks_above_the_size_limit_are_halved(tmp_path):
+    pdf_path = write_noisy_pdf(tmp_path / "heavy.pdf", 4)
+    page_bytes = len(split_pdf(pdf_path, max_pages=1)[0].data)
+    max_file_mb = 2.5 * page_bytes / (1024 * 1024)
+    chunks = split_pdf(pdf_path, max_pages=4, max_file_mb=max_file_mb)
+    assert [(chunk.first_page, chunk.page_count) for chunk in chunks] == [(1, 2), (3, 2)]
+    assert all(len(chunk.data) <= max_file_mb * 1024 * 1024 for chunk in chunks)
+    with pytest.raises(ValueError, match="on its own"):
+        split_pdf(pdf_path, max_pages=4, max_file_mb=page_bytes / (4 * 1024 * 1024))
+
+
+def test_absolute_figure_id():
+    assert absolute_figure_id("2.1", 5) == "7.1"
+    assert absolute_figure_id("2.1", 0) == "2.1"
+    assert absolute_figure_id("figure", 5) == "figure"
+
+
+def test_chunks_merge_into_one_document_with_absolute_pages(tmp_path, monkeypatch):
+    # Every figure rolls over to disk on its way to S3
+    monkeypatch.setattr(azure_async, "FIGURE_SPOOL_BYTES", 64)
+    pdf_path = write_pdf(tmp_path / "doc.pdf", 12, images_per_page=2)
+    client = FakeDocumentIntelligenceClient(max_pages=5, latency=0.01, figure_chunk_size=50)
+    (summary,), uploader = run([pdf_path], client, max_concurrent=2)
+
+    assert "error" not in summary
+    assert (summary["chunks"], summary["pages"], summary["figures"]) == (3, 12, 24)
+    assert client.max_in_flight <= 2
+    document = summary["document"]
+    assert [page.number for page in document.pages] == list(range(1, 13))
+    assert [figure.ref for figure in document.pages[6].figures] == ["7.1", "7.2"]
+
+    s3_dir = summary["s3_dir"]
+    text = body(uploader, f"{s3_dir}/text/extracted_text.txt").decode()
+    assert text.index("---- Page #1 ----") < text.index("---- Page #6 ----") < text.index("---- Page #12 ----")
+    assert "Page 12 of 12" in text
+    assert "Requests: 3" in body(uploader, f"{s3_dir}/others/metadata.txt").decode()
+
+    # Figures arrive intact under their absolute ids
+    figure = body(uploader, f"{s3_dir}/images/7.1.png")
+    assert figure.startswith(b"\x89PNG")
+    operation_ids = {result_id for kind, result_id, figure_id in client.calls if kind == "figure" and figure_id == "2.1"}
+    assert figure in {client._figures[(operation_id, "2.1")] for operation_id in operation_ids}
+
+
+def test_same_file_names_get_separate_folders(tmp_path):
+    first = write_pdf(tmp_path / "a" / "report.pdf", 1)
+    second = write_pdf(tmp_path / "b" / "report.pdf", 2)
+    summaries, uploader = run([first, second], FakeDocumentIntelligenceClient(latency=0))
+    assert summaries[0]["s3_dir"] != summaries[1]["s3_dir"]
+    assert summaries[0]["s3_dir"] == document_dir("out", first)
+    for summary in summaries:
+        metadata = body(uploader, f"{summary['s3_dir']}/others/metadata.txt").decode()
+        assert f"Total Pages: {summary['pages']}" in metadata
+
+
+def test_a_failed_document_does_not_stop_the_others(tmp_path):
+    good = write_pdf(tmp_path / "good.pdf", 2)
+    bad = write_pdf(tmp_path / "bad.pdf", 1)
+    client = FakeDocumentIntelligenceClient(latency=0)
+    real_analyze = client.begin_analyze_document
+    good_size = os.path.getsize(good)
+
+    async def begin_analyze_document(model_id, body, **kwargs):
+        data = body.read()
+        if len(data) != good_size:
+            raise RuntimeError("service unavailable")
+        return await real_analyze(model_id, data, **kwargs)
+
+    client.begin_analyze_document = begin_analyze_document
+    summaries, _ = run([good, bad], client)
+    assert summaries[0]["pages"] == 2
+    assert summaries[1] == {"source": bad, "error": "RuntimeError: service unavailable"}
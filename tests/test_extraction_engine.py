@@ -0,0 +1,105 @@
+"""iter_pages with OCR running in the background: artifacts stay with their own page.
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+from concurrent.futures import Future
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+from extraction_engine import PageHandler, TextHandler, iter_pages, run_single_pass
+from sinks import MemorySink
+
+
+class StubOcr:
+    """OCR runner whose futures only resolve when the test says so."""
+
+    def __init__(self):
+        self.futures = {}
+
+    def submit(self, page, dpi):
+        future = Future()
+        self.futures[page.number + 1] = future
+        return future
+
+    def resolve(self, page_number):
+        self.futures[page_number].set_result((f"ocr text of page {page_number}", {
+            "page": page_number, "status": "ocr", "dpi": 300, "render_seconds": 0.0, "ocr_seconds": 0.0,
+            "char_confidence": 90.0, "chars": 20, "words": 5}))
+
+
+class ResolveAt(PageHandler):
+    """For every (at, target) pair, resolves the OCR of page target while page at is visited.
+
+    Placed after TextHandler, so a result is picked up on the next page at the earliest,
+    or in finish().
+    """
+
+    name = "resolve"
+
+    def __init__(self, ocr, *pairs):
+        super().__init__()
+        self.ocr = ocr
+        self.pairs = pairs
+
+    def handle_page(self, ctx):
+        for at, target in self.pairs:
+            if ctx.page_number == at:
+                self.ocr.resolve(target)
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    """5 pages; pages 1 and 5 are scans (one full-page image, no text)."""
+    pdf_document = fitz.open()
+    for page_number in range(1, 6):
+        page = pdf_document.new_page()
+        if page_number in (1, 5):
+            pixmap = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 64, 64), False)
+            pixmap.set_rect(pixmap.irect, (200,))
+            page.insert_image(page.rect, pixmap=pixmap)
+        else:
+            page.insert_text((72, 72), f"Digital page {page_number} with a text layer")
+    path = tmp_path / "scans.pdf"
+    pdf_document.save(str(path))
+    pdf_document.close()
+    return str(path)
+
+
+def test_ocr_results_are_yielded_with_their_own_page(pdf_path):
+    ocr = StubOcr()
+    sink = MemorySink()
+    text = TextHandler(sink, ocr)
+    results = list(iter_pages(pdf_path, [text, ResolveAt(ocr, (3, 1), (5, 5))]))
+
+    assert [result.page_number for result in results] == [1, 2, 3, 4, 5]
+    by_page = {result.page_number: result.artifacts for result in results}
+    assert by_page[1] == ["page_1_text.txt", "page_1_ocr.json"]
+    assert by_page[3] == ["page_3_text.txt"]
+    # Page 5's OCR is only collected in finish(), after the last page was visited
+    assert by_page[5] == ["page_5_text.txt", "page_5_ocr.json"]
+    assert text.artifacts == []
+    assert sink.artifacts["page_1_text.txt"] == b"ocr text of page 1"
+
+
+def test_pages_after_a_pending_ocr_page_wait_for_it(pdf_path):
+    ocr = StubOcr()
+    pages = iter_pages(pdf_path, [TextHandler(MemorySink(), ocr), ResolveAt(ocr, (4, 1), (5, 5))])
+    first = next(pages)
+    # Nothing came out before page 1's OCR, which took until page 5 was visited to be collected
+    assert first.page_number == 1 and "page_1_ocr.json" in first.artifacts
+    assert 5 in ocr.futures
+    assert [result.page_number for result in pages] == [2, 3, 4, 5]
+
+
+def test_run_single_pass_reports_every_artifact_once(pdf_path):
+    ocr = StubOcr()
+    report = run_single_pass(pdf_path, [TextHandler(MemorySink(), ocr), ResolveAt(ocr, (2, 1), (5, 5))])
+    assert report["pages"] == 5
+    assert sorted(report["artifacts"]) == sorted(
+        [f"page_{n}_text.txt" for n in range(1, 6)] + ["page_1_ocr.json", "page_5_ocr.json"])
+    assert [entry["page"] for entry in report["ocr"]] == [1, 5]
@@ -0,0 +1,139 @@
+"""S3Uploader against moto: uploads, retries, backpressure and failure reporting.
+
+Run with: python -m pytest tests (needs pytest and moto; skipped without moto)
+"""
+import io
+import os
+import pickle
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+moto = pytest.importorskip("moto")
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from s3_uploader import S3Uploader, UploadError
+
+BUCKET = "uploader-test"
+
+
+@pytest.fixture(autouse=True)
+def aws(monkeypatch):
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SERVER_PUBLIC_KEY", "AWS_SERVER_SECRET_KEY"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        yield
+
+
+def body(client, key):
+    return client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+
+
+class RawBody:
+    """Stand-in for the urllib3 response botocore reads an error body from."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+def fail_puts(client, failures):
+    """Answer the next `failures` PutObject requests with a 503 SlowDown; returns the attempt log."""
+    attempts = []
+
+    def before_send(request, **kwargs):
+        attempts.append(request.url)
+        if len(attempts) <= failures:
+            error = b"<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>"
+            return AWSResponse(request.url, 503, {}, RawBody(error))
+        return None
+
+    # Ahead of moto's own before-send handler, which would answer the request otherwise
+    client.meta.events.register_first("before-send.s3.PutObject", before_send)
+    return attempts
+
+
+def test_uploads_land_and_flush_reports_them(tmp_path):
+    path = tmp_path / "page.txt"
+    path.write_text("from a file")
+    with S3Uploader(BUCKET) as uploader:
+        uploader.upload_bytes("from memory", "a.txt", content_type="text/plain")
+        uploader.upload_file(str(path), "b.txt")
+        uploader.upload_stream(io.BytesIO(b"from a stream"), "c.txt")
+        report = uploader.flush()
+        assert report.ok
+        assert (report.uploaded, report.bytes_uploaded) == (3, len("from memory") + len("from a file") + len("from a stream"))
+        assert body(uploader.client, "a.txt") == b"from memory"
+        assert uploader.client.head_object(Bucket=BUCKET, Key="a.txt")["ContentType"] == "text/plain"
+        assert body(uploader.client, "b.txt") == b"from a file"
+        assert body(uploader.client, "c.txt") == b"from a stream"
+        # Counters start over after a flush
+        assert uploader.flush().uploaded == 0
+
+
+def test_transient_errors_are_retried():
+    uploader = S3Uploader(BUCKET)
+    attempts = fail_puts(uploader.client, failures=2)
+    uploader.upload_bytes(b"payload", "retried.txt")
+    report = uploader.close()
+    assert report.ok and report.uploaded == 1
+    assert len(attempts) == 3
+    assert body(uploader.client, "retried.txt") == b"payload"
+
+
+def test_retries_exhausted_are_reported():
+    client = boto3.client("s3", config=Config(retries={"max_attempts": 2, "mode": "standard"}))
+    uploader = S3Uploader(BUCKET, client=client)
+    attempts = fail_puts(client, failures=10)
+    future = uploader.upload_bytes(b"payload", "lost.txt")
+    report = uploader.flush()
+    # The future itself never raises; failures only surface in the report
+    assert future.result() is None
+    assert not report.ok and report.uploaded == 0
+    assert [failure.key for failure in report.failures] == ["lost.txt"]
+    assert report.failures[0].source == "<memory>"
+    # max_attempts counts retries, on top of the first attempt
+    assert len(attempts) == 3
+
+
+def test_failures_surface_from_flush_and_close():
+    uploader = S3Uploader("missing-bucket")
+    uploader.upload_bytes(b"x", "one.txt")
+    uploader.upload_bytes(b"y", "two.txt")
+    with pytest.raises(UploadError) as raised:
+        uploader.close()
+    assert sorted(failure.key for failure in raised.value.failures) == ["one.txt", "two.txt"]
+    assert "2 upload(s) failed" in str(raised.value)
+    # The failure list survives the trip back from a process pool worker
+    assert len(pickle.loads(pickle.dumps(raised.value)).failures) == 2
+
+
+def test_submit_blocks_once_max_pending_uploads_are_in_flight():
+    release = threading.Event()
+
+    class BlockingStream(io.BytesIO):
+        def read(self, *args):
+            release.wait(10)
+            return super().read(*args)
+
+    uploader = S3Uploader(BUCKET, max_workers=2, max_pending=2)
+    uploader.upload_stream(BlockingStream(b"first"), "first.txt")
+    uploader.upload_stream(BlockingStream(b"second"), "second.txt")
+    third = threading.Thread(target=uploader.upload_bytes, args=(b"third", "third.txt"))
+    third.start()
+    third.join(0.5)
+    assert third.is_alive()
+    release.set()
+    third.join(10)
+    assert not third.is_alive()
+    report = uploader.close()
+    assert report.uploaded == 3
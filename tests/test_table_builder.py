@@ -0,0 +1,41 @@
+"""TableBatch built from Azure-style cells, including malformed ones.
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from table_builder import TableBatch
+
+
+def azure_table(row_count, column_count, cells, page=1):
+    return SimpleNamespace(row_count=row_count, column_count=column_count,
+                           bounding_regions=[SimpleNamespace(page_number=page)],
+                           cells=[SimpleNamespace(row_index=row, column_index=column, content=content,
+                                                  row_span=row_span, column_span=column_span)
+                                  for row, column, content, row_span, column_span in cells])
+
+
+def test_spans_fill_every_covered_position():
+    batch = TableBatch.from_azure([azure_table(2, 3, [(0, 0, "wide", None, 2), (0, 2, "c", None, None),
+                                                      (1, 0, "d", None, None), (1, 1, "e", None, 2)])])
+    assert batch.rows(0) == [["wide", "wide", "c"], ["d", "e", "e"]]
+
+
+def test_spans_past_the_edge_are_clipped():
+    batch = TableBatch.from_azure([azure_table(2, 2, [(0, 1, "tall", 5, 3)]), azure_table(1, 1, [(0, 0, "next", None, None)])])
+    assert batch.rows(0) == [["", "tall"], ["", "tall"]]
+    assert batch.rows(1) == [["next"]]
+
+
+def test_cells_outside_the_table_are_dropped():
+    batch = TableBatch.from_azure([azure_table(2, 2, [(0, 0, "a", None, None), (3, 0, "far below", None, None),
+                                                      (2, 1, "just below", None, None), (1, 2, "right", None, None),
+                                                      (1, 1, "d", None, None)]),
+                                   azure_table(1, 2, [(0, 0, "x", None, None), (0, 1, "y", None, None)], page=4)])
+    assert batch.rows(0) == [["a", ""], ["", "d"]]
+    assert batch.rows(1) == [["x", "y"]]
+    assert batch.pages.tolist() == [1, 4]